@@ -0,0 +1,455 @@
+"""
+An U{asyncio<https://docs.python.org/3/library/asyncio.html>} backend (Python
+3 only), that shares the matching engine (L{texpect.matching}) and the
+buffer (L{texpect.buffer}) with the Twisted one, but drives asyncio
+protocols directly, without a reactor in between.
+
+The requests return asyncio futures, so they can be awaited::
+
+    session = await connect('router1', timeout=10)
+    await session.read_until(b'Username:')
+    session.write(b'admin\\n')
+    index, match, data = await session.expect([b'#', b'Login invalid'])
+
+The data is C{bytes}, so are the patterns, that match it. Only the basic
+requests are supported, the rest of the features (C{keep_data}, the prompts,
+the dialogs, the filters, the bounded buffer, flow control...) need Twisted,
+the README lists them.
+
+@author: shylent
+"""
+import asyncio
+import re
+
+from texpect import matching
+from texpect.buffer import ReceiveBuffer
+from texpect.errors import (RequestInterruptedByConnectionLoss, RequestTimeout,
+    OutOfSequenceError, EOFReached, ConnectionAlreadyClosed)
+
+
+class Request(object):
+    r"""A request in progress.
+
+    While an L{ExpectMixin.expect} request is waiting for data, it has the
+    attributes, that describe the state of the search (see
+    L{resume<texpect.matching.resume>}).
+
+    @ivar future: The future, that is resolved, when the request is complete
+    @type future: C{asyncio.Future}
+    @ivar matcher: The patterns, C{None} for a L{ExpectMixin.read_all} request
+    @type matcher: L{PatternSet<texpect.matching.PatternSet>}
+    @ivar as_tuple: Whether the result of the match is a tuple (see
+    L{ExpectMixin.expect}) or just the data
+    @type as_tuple: C{bool}
+
+    """
+
+    __slots__ = ('future', 'matcher', 'as_tuple', 'lookbacks', 'searched', 'scan',
+                 'truncated', 'timer')
+
+    def __init__(self, future, matcher=None, as_tuple=True):
+        self.future = future
+        self.matcher = matcher
+        self.as_tuple = as_tuple
+        self.timer = None
+        if matcher is not None:
+            self.lookbacks = matcher.lookbacks
+            self.searched = 0
+            self.scan = matcher.scan()
+            # The buffer is never cut, the whole reply is kept until it matches
+            self.truncated = False
+
+    def __str__(self):
+        if self.matcher is None:
+            return 'ReadAll'
+        return 'Expect: %s' % ', '.join(repr(p.pattern) for p in self.matcher.patterns)
+
+
+class ExpectMixin(object):
+    r"""The asyncio counterpart of L{texpect.mixin.ExpectMixin}.
+
+    The resulting protocol must call L{expectDataReceived} with the data, that
+    is received, and L{expectConnectionLost}, when the connection is lost,
+    and set L{transport}. As with the Twisted backend, only one request may
+    be in progress at a time, await each request before making the next one.
+
+    @ivar timeout: Default timeout for the requests in seconds
+    @type timeout: C{float}
+    @ivar lookback: See L{texpect.mixin.ExpectMixin.lookback}
+    @type lookback: C{int} or C{NoneType}
+    @ivar request: The request in progress
+    @type request: L{Request} or C{NoneType}
+    @ivar eof: Whether the connection has been lost
+    @type eof: C{bool}
+
+    """
+
+    lookback = None
+
+    def __init__(self, timeout=None, loop=None):
+        r"""
+        @param timeout: Default timeout for the requests in seconds
+        @type timeout: C{float}
+        @param loop: The event loop. Default: the loop, that is running
+        @type loop: C{asyncio.AbstractEventLoop}
+
+        """
+        self.timeout = timeout
+        self._loop = loop
+        self._buffer = ReceiveBuffer()
+        self.transport = None
+        self.request = None
+        self.eof = False
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def expectDataReceived(self, data):
+        r"""Process incoming data, see if a match has occured."""
+        self._buffer.append(data)
+        request = self.request
+        if request is not None and request.matcher is not None:
+            found = matching.resume(self._buffer.view(), request)
+            if found:
+                self._complete(request, found)
+
+    def expectConnectionLost(self, exc=None):
+        r"""Complete or fail the request in progress, because the connection is
+        lost.
+
+        """
+        self.eof = True
+        request, self.request = self.request, None
+        if request is None:
+            return
+        self._cancel_timer(request)
+        data = self._buffer.consume()
+        if request.matcher is None:
+            request.future.set_result(data)
+        else:
+            request.future.set_exception(RequestInterruptedByConnectionLoss(
+                data=data, promise=request))
+
+    def _complete(self, request, found):
+        index, match = found
+        data = self._buffer.consume(match.end())
+        self.request = None
+        self._cancel_timer(request)
+        request.future.set_result((index, match, data) if request.as_tuple else data)
+
+    def _cancel_timer(self, request):
+        if request.timer is not None:
+            request.timer.cancel()
+            request.timer = None
+
+    def _handle_timeout(self, request):
+        if self.request is not request:
+            return
+        self.request = None
+        request.timer = None
+        request.future.set_exception(RequestTimeout(data=self._buffer.consume(),
+                                                    promise=request))
+
+    def _request_done(self, future):
+        r"""Forget the request, if its future has been cancelled (for example,
+        by C{asyncio.wait_for}).
+
+        """
+        request = self.request
+        if request is not None and request.future is future and future.cancelled():
+            self.request = None
+            self._cancel_timer(request)
+
+    def _start(self, request, timeout):
+        self.request = request
+        request.future.add_done_callback(self._request_done)
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            request.timer = self._get_loop().call_later(timeout, self._handle_timeout, request)
+
+    def _out_of_sequence(self, future):
+        future.set_exception(OutOfSequenceError('Unable to process request, '
+                                                'there is another one pending: %s' % self.request))
+        self.close()
+        return future
+
+    def expect(self, pattern_list, timeout=None, _as_tuple=True):
+        r"""A request to read data until a pattern from a pattern list matches
+        the buffer, see L{texpect.mixin.ExpectMixin.expect}.
+
+        @param pattern_list: A list of byte strings or compiled regular
+        expression objects
+        @param timeout: A number of seconds to wait for the match. Overrides
+        the instance default.
+        @type timeout: C{float}
+
+        @return: A future, that will be resolved with a tuple of three items:
+        the index in the list of patterns of the pattern, that matched, the match
+        object, the data up to and including the match.
+        Exceptions: the same as the Twisted backend's.
+        @rtype: C{asyncio.Future}
+
+        """
+        future = self._get_loop().create_future()
+        if self.request is not None:
+            return self._out_of_sequence(future)
+        if isinstance(pattern_list, (bytes, str)):
+            pattern_list = [pattern_list]
+        request = Request(future, matching.compile_patterns(pattern_list), _as_tuple)
+        if self.lookback is not None:
+            request.lookbacks = [self.lookback if lb is None else lb
+                                 for lb in request.lookbacks]
+        buf = self._buffer
+        found = buf and request.matcher.search(buf.view(), None, request.scan)
+        if found:
+            self._complete(request, found)
+        elif self.eof:
+            if not buf:
+                future.set_exception(EOFReached('The connection is closed and no data is available'))
+            else:
+                future.set_exception(ConnectionAlreadyClosed(data=buf.consume(), promise=request))
+        else:
+            request.searched = len(buf)
+            self._start(request, timeout)
+        return future
+
+    def read_until(self, expected, timeout=None):
+        r"""A request to read until a pattern matches.
+
+        @return: A future, that will be resolved with the data up to and
+        including the match.
+        @rtype: C{asyncio.Future}
+
+        """
+        return self.expect([expected], timeout, _as_tuple=False)
+
+    def read_all(self, timeout=None):
+        r"""A request to read all data until the connection is lost.
+
+        @return: A future, that will be resolved with the data.
+        @rtype: C{asyncio.Future}
+
+        """
+        future = self._get_loop().create_future()
+        if self.request is not None:
+            return self._out_of_sequence(future)
+        if self.eof:
+            return self.read_lazy()
+        self._start(Request(future), timeout)
+        return future
+
+    def read_lazy(self):
+        r"""A request to return all data, that is currently in the buffer.
+
+        @return: A future, that has already been resolved with the data.
+        @rtype: C{asyncio.Future}
+
+        """
+        future = self._get_loop().create_future()
+        if self.request is not None:
+            return self._out_of_sequence(future)
+        if not self._buffer and self.eof:
+            future.set_exception(EOFReached('The connection is closed and no data is available'))
+        else:
+            future.set_result(self._buffer.consume())
+        return future
+
+    def write(self, data):
+        r"""Write data to the transport."""
+        self.transport.write(data)
+
+    def close(self):
+        r"""Close the connection."""
+        if self.transport is not None:
+            self.transport.close()
+
+
+IAC = b'\xff'
+SE, SB, WILL, WONT, DO, DONT = (bytes(bytearray([c])) for c in (240, 250, 251, 252, 253, 254))
+
+
+class TelnetParser(object):
+    r"""Separates the application data from the Telnet commands, the same way
+    as L{twisted.conch.telnet.Telnet} does, refusing all of the options, that
+    the peer offers or asks for.
+
+    C{CR LF} is passed on as C{LF} and C{CR NUL} as C{CR}.
+
+    """
+
+    _special = re.compile(b'[\xff\r]')
+
+    def __init__(self, write):
+        r"""
+        @param write: A callable, that sends the replies to the peer
+        """
+        self._write = write
+        self._pending = b''
+
+    def feed(self, data):
+        r"""
+        @return: The application data, that the received data contains
+        @rtype: C{bytes}
+
+        """
+        if self._pending:
+            data = self._pending + data
+            self._pending = b''
+        out = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            match = self._special.search(data, pos)
+            if match is None:
+                out.append(data[pos:])
+                break
+            start = match.start()
+            out.append(data[pos:start])
+            if start + 1 >= end:
+                self._pending = data[start:]
+                break
+            char, command = data[start:start + 1], data[start + 1:start + 2]
+            if char == b'\r':
+                if command == b'\n':
+                    out.append(b'\n')
+                    pos = start + 2
+                elif command == b'\0':
+                    out.append(b'\r')
+                    pos = start + 2
+                else:
+                    out.append(b'\r')
+                    pos = start + 1
+            elif command == IAC:
+                out.append(IAC)
+                pos = start + 2
+            elif command in (WILL, WONT, DO, DONT):
+                if start + 2 >= end:
+                    self._pending = data[start:]
+                    break
+                option = data[start + 2:start + 3]
+                if command == WILL:
+                    self._write(IAC + DONT + option)
+                elif command == DO:
+                    self._write(IAC + WONT + option)
+                pos = start + 3
+            elif command == SB:
+                close = data.find(IAC + SE, start + 2)
+                if close == -1:
+                    self._pending = data[start:]
+                    break
+                pos = close + 2
+            else:
+                pos = start + 2
+        return b''.join(out)
+
+
+class TelnetExpect(asyncio.Protocol, ExpectMixin):
+    r"""The asyncio counterpart of L{texpect.protocols.TelnetExpect}."""
+
+    def __init__(self, timeout=None, loop=None):
+        ExpectMixin.__init__(self, timeout=timeout, loop=loop)
+        self._parser = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._parser = TelnetParser(transport.write)
+
+    def data_received(self, data):
+        data = self._parser.feed(data)
+        if data:
+            self.expectDataReceived(data)
+
+    def connection_lost(self, exc):
+        self.expectConnectionLost(exc)
+
+    def write(self, data):
+        r"""Write data to the transport, escaping C{IAC}."""
+        self.transport.write(data.replace(IAC, IAC + IAC))
+
+
+class ProcessExpect(asyncio.SubprocessProtocol, ExpectMixin):
+    r"""The asyncio counterpart of L{texpect.protocols.ProcessExpect}: writes
+    to the subprocess's stdin and reads from its stdout.
+
+    @ivar exited: A future, that is resolved with the exit code of the
+    subprocess, when it exits
+    @type exited: C{asyncio.Future}
+
+    """
+
+    def __init__(self, timeout=None, loop=None):
+        ExpectMixin.__init__(self, timeout=timeout, loop=loop)
+        self.exited = self._get_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def pipe_data_received(self, fd, data):
+        if fd == 1:
+            self.expectDataReceived(data)
+
+    def pipe_connection_lost(self, fd, exc):
+        if fd == 1:
+            self.expectConnectionLost(exc)
+
+    def process_exited(self):
+        if not self.exited.done():
+            self.exited.set_result(self.transport.get_returncode())
+
+    def write(self, data):
+        r"""Write data to the subprocess's stdin."""
+        self.transport.get_pipe_transport(0).write(data)
+
+
+def _protocol(coroutine, loop):
+    r"""Run a coroutine, that returns a C{(transport, protocol)} pair, and
+    get a future of the protocol.
+
+    """
+    task = asyncio.ensure_future(coroutine, loop=loop)
+    future = loop.create_future()
+    def done(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result()[1])
+    task.add_done_callback(done)
+    return future
+
+
+def connect(host, port=23, timeout=None, loop=None):
+    r"""Connect to a Telnet server.
+
+    @param timeout: Default timeout for the requests of the session
+    @type timeout: C{float}
+    @return: A future, that will be resolved with a L{TelnetExpect}
+    @rtype: C{asyncio.Future}
+
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    return _protocol(loop.create_connection(lambda: TelnetExpect(timeout, loop), host, port),
+                     loop)
+
+
+def spawn(args, timeout=None, loop=None, **kwargs):
+    r"""Start a subprocess.
+
+    @param args: The program and its arguments
+    @type args: C{list}
+    @param timeout: Default timeout for the requests of the session
+    @type timeout: C{float}
+    @param kwargs: Passed to C{loop.subprocess_exec}
+    @return: A future, that will be resolved with a L{ProcessExpect}
+    @rtype: C{asyncio.Future}
+
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    return _protocol(loop.subprocess_exec(lambda: ProcessExpect(timeout, loop), *args, **kwargs),
+                     loop)
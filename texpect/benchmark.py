@@ -0,0 +1,471 @@
+"""
+Benchmarks for the expect hot path.
+
+The hot path benchmarks feed synthetic replies to L{ExpectMixin} in chunks
+of various sizes and measure how fast the requests are satisfied, the end
+to end ones talk to a Telnet server on the loopback interface and to a
+subprocess through pipes and through a pseudo-terminal. The results can be stored and compared with the ones of a
+previous run::
+
+    python -m texpect.benchmark --save before.json
+    ... change something ...
+    python -m texpect.benchmark --compare before.json
+
+The exit status is 1, if any of the benchmarks has regressed by more than
+C{--threshold}.
+
+@author: shylent
+"""
+from texpect.mixin import ExpectMixin
+from texpect.protocols import TelnetExpect, ProcessExpect, PTYProcessExpect, termios
+from twisted.internet.defer import Deferred
+from twisted.internet.protocol import ClientCreator, Protocol, ServerFactory
+from twisted.python import usage
+from timeit import default_timer
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PROMPT = 'router#'
+
+CHUNK_SIZES = (1, 16, 256, 4096, 65536)
+BUFFER_SIZES = (64, 1024, 16384, 262144)
+PATTERN_COUNTS = (1, 4, 16, 64)
+
+#: Metrics, that are compared between the runs, and whether more is better
+METRICS = (('bytes_per_sec', True), ('p50_us', False), ('p99_us', False),
+           ('peak_buffer', False))
+
+_LINE = 'GigabitEthernet0/1 is up, line protocol is up\r\n'
+
+
+def reply(size):
+    r"""Make a reply of a network device: lines of output, followed by the
+    prompt.
+
+    @param size: Length of the reply
+    @type size: C{int}
+    @rtype: C{str}
+
+    """
+    size = max(size - len(PROMPT), 0)
+    return (_LINE * (size // len(_LINE) + 1))[:size] + PROMPT
+
+
+def patterns(count, regex=False):
+    r"""Make a list of patterns, whose last pattern matches the prompt, so
+    that each of the patterns has to be searched for.
+
+    @param count: Number of the patterns
+    @type count: C{int}
+    @param regex: Whether the patterns should be regular expressions rather
+    than fixed strings
+    @type regex: C{bool}
+    @rtype: C{list}
+
+    """
+    if regex:
+        return [r'%%Error \d+ at %d' % i for i in range(count - 1)] + [r'router[#>]']
+    return ['%%Error %d' % i for i in range(count - 1)] + [PROMPT]
+
+
+def percentile(values, fraction):
+    r"""Nearest-rank percentile of a sorted list of values."""
+    if not values:
+        return None
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def peak_rss():
+    r"""Peak resident set size of the process in kilobytes (on Linux) or
+    C{None}, if it is not available. It never decreases, so it only tells,
+    how much memory the most demanding benchmark so far has taken.
+
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def summarize(received, elapsed, latencies, peak_buffer=None):
+    r"""Make the result of a benchmark.
+
+    @param received: Number of bytes, that were processed
+    @type received: C{int}
+    @param elapsed: Time it took in seconds
+    @type elapsed: C{float}
+    @param latencies: Time it took to satisfy each of the requests in seconds
+    @type latencies: C{list}
+    @param peak_buffer: The largest size of the receive buffer's storage
+    @type peak_buffer: C{int}
+    @rtype: C{dict}
+
+    """
+    latencies = sorted(latencies)
+    elapsed = max(elapsed, 1e-9)
+    return {'bytes': received,
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'bytes_per_sec': received / elapsed,
+            'requests_per_sec': len(latencies) / elapsed,
+            'p50_us': percentile(latencies, 0.5) * 1e6,
+            'p90_us': percentile(latencies, 0.9) * 1e6,
+            'p99_us': percentile(latencies, 0.99) * 1e6,
+            'max_us': latencies[-1] * 1e6,
+            'peak_buffer': peak_buffer,
+            'peak_rss_kb': peak_rss()}
+
+
+def hot_path(chunk_size, buffer_size, pattern_count=1, regex=False, total=262144):
+    r"""Satisfy a series of requests by feeding replies to
+    L{ExpectMixin.expectDataReceived} directly.
+
+    @param chunk_size: Size of the chunks, in which the data arrives
+    @type chunk_size: C{int}
+    @param buffer_size: Length of each reply, that is, how much data is
+    buffered before the request is satisfied
+    @type buffer_size: C{int}
+    @param pattern_count: Number of the patterns in each request
+    @type pattern_count: C{int}
+    @param regex: Whether the patterns are regular expressions
+    @type regex: C{bool}
+    @param total: Number of bytes to feed (at least one reply is fed)
+    @type total: C{int}
+    @rtype: C{dict}
+
+    """
+    # The test helpers are not needed, unless the hot path is measured
+    from twisted.test.proto_helpers import StringTransport
+    session = ExpectMixin()
+    session.transport = StringTransport()
+    pattern_list = patterns(pattern_count, regex)
+    data = reply(buffer_size)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    rounds = max(total // len(data), 1)
+    done = []
+    latencies = []
+    start = default_timer()
+    for i in range(rounds):
+        began = default_timer()
+        session.expect(pattern_list).addCallback(done.append)
+        for chunk in chunks:
+            session.expectDataReceived(chunk)
+        latencies.append(default_timer() - began)
+    elapsed = default_timer() - start
+    if len(done) != rounds:
+        raise AssertionError('%d of %d requests were not satisfied'
+                             % (rounds - len(done), rounds))
+    # The storage is sampled in a separate round, so that the timing is not
+    # affected by the sampling
+    peak_buffer = 0
+    session.expect(pattern_list)
+    for chunk in chunks:
+        peak_buffer = max(peak_buffer, len(session._buffer._data) + len(chunk))
+        session.expectDataReceived(chunk)
+    return summarize(rounds * len(data), elapsed, latencies, peak_buffer)
+
+
+def hot_path_suite(total=262144):
+    r"""The hot path benchmarks: one chunk size, buffer size, pattern count
+    or kind of the patterns varies at a time.
+
+    @return: Pairs of a name and the arguments of L{hot_path}
+    @rtype: C{list}
+
+    """
+    suite = []
+    def add(chunk_size, buffer_size, pattern_count=1, regex=False):
+        name = 'hot_path chunk=%d buffer=%d patterns=%d %s' % (
+            chunk_size, buffer_size, pattern_count, 'regex' if regex else 'literal')
+        if name not in dict(suite):
+            suite.append((name, (chunk_size, buffer_size, pattern_count, regex, total)))
+    for chunk_size in CHUNK_SIZES:
+        add(chunk_size, 65536)
+    for buffer_size in BUFFER_SIZES:
+        add(4096, buffer_size)
+    for pattern_count in PATTERN_COUNTS:
+        for regex in (False, True):
+            add(4096, 16384, pattern_count, regex)
+    return suite
+
+
+def converse(session, command, prompt, rounds, reply_size):
+    r"""Write a command to the session and read the reply up to the prompt,
+    a number of times.
+
+    @return: A L{Deferred}, that fires with the result of the benchmark
+    @rtype: L{Deferred}
+
+    """
+    latencies = []
+    result = Deferred()
+    state = {}
+    def request(ignored=None):
+        if len(latencies) == rounds:
+            result.callback(summarize(rounds * reply_size,
+                                      default_timer() - state['start'], latencies))
+            return
+        state['began'] = default_timer()
+        session.write(command)
+        d = session.read_until(prompt)
+        d.addCallback(answered)
+        d.addErrback(result.errback)
+    def answered(data):
+        latencies.append(default_timer() - state['began'])
+        request()
+    state['start'] = default_timer()
+    request()
+    return result
+
+
+class ReplyServer(Protocol):
+    r"""Answers each line with a reply of the factory's C{reply_size}."""
+
+    def connectionMade(self):
+        self._reply = reply(self.factory.reply_size)
+        self._pending = ''
+
+    def dataReceived(self, data):
+        self._pending += data
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self.transport.write(self._reply)
+
+
+def telnet(rounds=200, reply_size=1024, _reactor=None):
+    r"""Converse with a Telnet server on the loopback interface.
+
+    @return: A L{Deferred}, that fires with the result of the benchmark
+    @rtype: L{Deferred}
+
+    """
+    if _reactor is None:
+        from twisted.internet import reactor as _reactor
+    factory = ServerFactory()
+    factory.protocol = ReplyServer
+    factory.reply_size = reply_size
+    port = _reactor.listenTCP(0, factory, interface='127.0.0.1')
+    creator = ClientCreator(_reactor, TelnetExpect, timeout=30)
+    d = creator.connectTCP('127.0.0.1', port.getHost().port)
+    def connected(session):
+        d = converse(session, 'show\n', PROMPT, rounds, reply_size)
+        def close(result):
+            session.transport.loseConnection()
+            return result
+        return d.addBoth(close)
+    d.addCallback(connected)
+    def stop(result):
+        port.stopListening()
+        return result
+    return d.addBoth(stop)
+
+
+_CHILD = r'''
+import sys
+reply = %r
+while sys.stdin.readline():
+    sys.stdout.write(reply)
+    sys.stdout.flush()
+'''
+
+# Does not flush, it relies on the terminal to make its output line buffered
+_PTY_CHILD = r'''
+import sys
+reply = %r
+while sys.stdin.readline():
+    sys.stdout.write(reply + '\n')
+'''
+
+
+def process(rounds=200, reply_size=1024, _reactor=None):
+    r"""Converse with a subprocess through its stdin and stdout.
+
+    @return: A L{Deferred}, that fires with the result of the benchmark
+    @rtype: L{Deferred}
+
+    """
+    if _reactor is None:
+        from twisted.internet import reactor as _reactor
+    session = ProcessExpect(timeout=30)
+    _reactor.spawnProcess(session, sys.executable,
+                          [sys.executable, '-c', _CHILD % reply(reply_size)])
+    d = converse(session, 'show\n', PROMPT, rounds, reply_size)
+    def close(result):
+        session.transport.closeStdin()
+        return session.read_all().addBoth(lambda ign: result)
+    return d.addBoth(close)
+
+
+def pty(rounds=200, reply_size=1024, _reactor=None):
+    r"""Converse with a subprocess through a pseudo-terminal. The subprocess
+    does not flush its output, so, unlike L{process}, this measures how
+    soon the prompts arrive, when the program leaves the flushing to the
+    terminal.
+
+    @return: A L{Deferred}, that fires with the result of the benchmark
+    @rtype: L{Deferred}
+
+    """
+    if _reactor is None:
+        from twisted.internet import reactor as _reactor
+    session = PTYProcessExpect(timeout=30, echo=False)
+    _reactor.spawnProcess(session, sys.executable,
+                          [sys.executable, '-c', _PTY_CHILD % reply(reply_size)],
+                          usePTY=True)
+    d = converse(session, 'show\n', PROMPT, rounds, reply_size)
+    def close(result):
+        # End of file for the terminal (there is no stdin to close)
+        session.transport.write('\x04')
+        return session.read_all().addBoth(lambda ign: result)
+    return d.addBoth(close)
+
+
+def end_to_end_suite(rounds=200):
+    r"""The end to end benchmarks.
+
+    @return: Pairs of a name and a function, that takes the reactor and
+    returns a L{Deferred} of the result
+    @rtype: C{list}
+
+    """
+    suite = []
+    kinds = [('telnet', telnet), ('process', process)]
+    if termios is not None:
+        kinds.append(('pty', pty))
+    for reply_size in (1024, 65536):
+        for kind, func in kinds:
+            name = '%s reply=%d' % (kind, reply_size)
+            suite.append((name, lambda reactor, func=func, reply_size=reply_size:
+                          func(rounds, reply_size, _reactor=reactor)))
+    return suite
+
+
+def compare(results, baseline, threshold=0.1):
+    r"""Compare the results with the ones of a previous run.
+
+    @param results: Results of the benchmarks by their names
+    @type results: C{dict}
+    @param baseline: Results of the previous run
+    @type baseline: C{dict}
+    @param threshold: Relative change of a metric for the worse, that counts
+    as a regression
+    @type threshold: C{float}
+    @return: Tuples of the benchmark's name, the metric, the old value, the
+    new value, the relative change and whether it is a regression, for the
+    benchmarks, that were run both times
+    @rtype: C{list}
+
+    """
+    changes = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric, more_is_better in METRICS:
+            old = baseline[name].get(metric)
+            new = results[name].get(metric)
+            if not old or new is None:
+                continue
+            change = float(new - old) / old
+            worse = -change if more_is_better else change
+            changes.append((name, metric, old, new, change, worse > threshold))
+    return changes
+
+
+def save(results, path):
+    r"""Store the results in a JSON file along with a description of the
+    environment.
+
+    """
+    document = {'time': time.time(),
+                'python': sys.version,
+                'platform': platform.platform(),
+                'results': results}
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=1, sort_keys=True)
+
+
+def load(path):
+    r"""Load the results, that were stored with L{save}."""
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+class Options(usage.Options):
+
+    synopsis = 'python -m texpect.benchmark [options]'
+
+    optFlags = [
+        ['hot-path-only', None, 'Skip the end to end benchmarks'],
+    ]
+
+    optParameters = [
+        ['total', 't', 262144, 'Number of bytes to feed in each hot path benchmark', int],
+        ['rounds', 'r', 200, 'Number of round trips in each end to end benchmark', int],
+        ['filter', 'f', None, 'Only run the benchmarks, whose names contain this string'],
+        ['save', 's', None, 'Store the results in this file'],
+        ['compare', 'c', None, 'Compare the results with the ones stored in this file'],
+        ['threshold', None, 0.1, 'Relative change for the worse, that counts as a '
+                                 'regression', float],
+    ]
+
+
+def _report(name, result, out):
+    out.write('%-50s %10.2f MB/s  p50 %9.1f us  p99 %9.1f us\n' % (
+        name, result['bytes_per_sec'] / 2 ** 20, result['p50_us'], result['p99_us']))
+
+
+def main(argv=None, out=sys.stdout):
+    config = Options()
+    try:
+        config.parseOptions(argv)
+    except usage.UsageError as e:
+        raise SystemExit('%s\n%s' % (config, e))
+    selected = lambda name: config['filter'] is None or config['filter'] in name
+    results = {}
+    for name, args in hot_path_suite(config['total']):
+        if selected(name):
+            results[name] = hot_path(*args)
+            _report(name, results[name], out)
+    if not config['hot-path-only']:
+        from twisted.internet import reactor
+        suite = [(name, run) for name, run in end_to_end_suite(config['rounds'])
+                 if selected(name)]
+        def run_next(ignored=None):
+            if not suite:
+                reactor.stop()
+                return
+            name, run = suite.pop(0)
+            def done(result):
+                results[name] = result
+                _report(name, result, out)
+            d = run(reactor)
+            d.addCallback(done)
+            d.addErrback(lambda failure: out.write('%s failed: %s\n'
+                                                   % (name, failure.getErrorMessage())))
+            d.addCallback(run_next)
+        reactor.callWhenRunning(run_next)
+        reactor.run()
+    if config['save']:
+        save(results, config['save'])
+    regressions = 0
+    if config['compare']:
+        out.write('\n')
+        for name, metric, old, new, change, regression in compare(
+                results, load(config['compare']), config['threshold']):
+            regressions += regression
+            out.write('%-50s %-14s %+7.1f%%%s\n' % (name, metric, change * 100,
+                                                   '  REGRESSION' if regression else ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+@author: shylent
+"""
+
+try:
+    _view = buffer
+except NameError:
+    # Python 3. A memoryview would keep the bytearray from growing for as long
+    # as a match object, that refers to it, exists, so the data is copied.
+    def _view(data, offset=0, size=None):
+        if size is None:
+            return bytes(data[offset:])
+        return bytes(data[offset:offset + size])
+
+
+class ReceiveBuffer(object):
+    r"""A buffer for the received data, that supports cheap appends and cheap
+    removal of the data from its beginning.
+
+    The data is kept in a C{bytearray}, the data, that was consumed, is not
+    removed right away, only the offset of the first unconsumed byte is
+    advanced. The storage is compacted once the consumed part gets large
+    enough, so that both appending and consuming are amortized O(1) per byte.
+
+    The storage is never modified in place, except for appending to it (the
+    compaction replaces it altogether), so the match objects, that were
+    obtained with L{search}, remain valid, while the buffer is modified.
+
+    On Python 3 the searches are carried out on a copy of the data, because
+    a view of a C{bytearray} prevents it from growing, while the view (or a
+    match object, that refers to it) exists.
+
+    @ivar compact_threshold: The consumed part of the storage is only dropped,
+    when it is at least this large (and larger than the unconsumed part).
+    @type compact_threshold: C{int}
+
+    """
+
+    compact_threshold = 65536
+
+    def __init__(self, data=b''):
+        r"""
+        @param data: Initial contents of the buffer. Default: C{b''}
+        @type data: C{str}
+
+        """
+        self._data = bytearray(data)
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._data) - self._offset
+
+    def __str__(self):
+        return self.peek()
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.peek())
+
+    def append(self, data):
+        r"""Add data to the end of the buffer.
+
+        @type data: C{str}
+
+        """
+        self._data.extend(data)
+
+    def view(self):
+        r"""Get a read-only view of the unconsumed data without copying it
+        (on Python 3 the data is copied, see the note on the class).
+
+        @rtype: C{buffer}
+
+        """
+        return _view(self._data, self._offset)
+
+    def search(self, pattern, pos=0):
+        r"""Search the unconsumed data for a pattern without copying the data.
+
+        The positions in the resulting match object are relative to the
+        beginning of the unconsumed data.
+
+        @param pattern: A compiled regular expression object
+        @param pos: Position in the unconsumed data, where the search starts.
+        Default: 0
+        @type pos: C{int}
+        @rtype: C{SRE_Match} or C{None}
+
+        """
+        return pattern.search(self.view(), pos)
+
+    def peek(self, size=None):
+        r"""Get a copy of (a part of) the unconsumed data, without consuming it.
+
+        @param size: Number of bytes to get. Default: C{None}, meaning 'all of them'
+        @type size: C{int}
+        @rtype: C{str}
+
+        """
+        if size is None:
+            return self.view()[:]
+        return _view(self._data, self._offset, size)[:]
+
+    def consume(self, size=None):
+        r"""Remove the data from the beginning of the buffer and return it.
+
+        @param size: Number of bytes to consume. Default: C{None}, meaning
+        'all of them'
+        @type size: C{int}
+        @rtype: C{str}
+
+        """
+        data = self.peek(size)
+        self.discard(size)
+        return data
+
+    def detach(self, size=None):
+        r"""Remove the data from the beginning of the buffer and return it as a
+        C{memoryview}, without copying it, if possible.
+
+        The storage is handed over to the view and the data, that remains in
+        the buffer, is moved to new storage, unless there is more of it, than
+        of the data, that is removed, in which case the removed data is copied
+        instead. The view never prevents the buffer from growing, since the
+        buffer never appends to the storage, that it has handed over.
+
+        @param size: Number of bytes to remove. Default: C{None}, meaning
+        'all of them'
+        @type size: C{int}
+        @rtype: C{memoryview}
+
+        """
+        length = len(self)
+        if size is None or size > length:
+            size = length
+        if length - size > size:
+            return memoryview(self.consume(size))
+        data, start = self._data, self._offset
+        self._data = data[start + size:]
+        self._offset = 0
+        return memoryview(data)[start:start + size]
+
+    def discard(self, size=None):
+        r"""Remove the data from the beginning of the buffer without
+        copying it.
+
+        @param size: Number of bytes to remove. Default: C{None}, meaning
+        'all of them'
+        @type size: C{int}
+
+        """
+        if size is None or size >= len(self):
+            self._data = bytearray()
+            self._offset = 0
+            return
+        self._offset += size
+        if self._offset >= self.compact_threshold and self._offset * 2 >= len(self._data):
+            self._data = self._data[self._offset:]
+            self._offset = 0
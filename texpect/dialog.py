@@ -0,0 +1,204 @@
+"""
+Declarative dialogs: a whole interactive session, described as a set of
+steps, that is carried out by L{ExpectMixin.run<texpect.mixin.ExpectMixin.run>}
+without going through the callback machinery for every step.
+
+A dialog consists of named states, each of which is a list of steps. The steps
+of a state are carried out in order, after the last step of a state the dialog
+is complete. An L{Expect} step may jump to a different state, depending on the
+pattern, that has matched::
+
+    login = Dialog({
+        'start': [Expect(['Username:', 'Password:'], goto=[None, 'password']),
+                  Send('admin\\n'),
+                  Expect('Password:'),
+                  Goto('password')],
+        'password': [Send('secret\\n'),
+                     Expect(['#', 'Login invalid'], goto=[None, 'failed'])],
+        'failed': [Fail('Authentication failed')],
+    }, start='start')
+
+    d = protocol.run(login)
+
+@author: shylent
+"""
+from texpect import matching
+
+
+SEND, EXPECT, GOTO, FAIL, DONE = range(5)
+
+
+class Step(object):
+    r"""Base class for the steps of a dialog."""
+
+
+class Send(Step):
+    r"""Write data to the transport.
+
+    @ivar data: Data to write
+    @type data: C{str}
+
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+
+class Expect(Step):
+    r"""Wait for one of the patterns to match, see
+    L{ExpectMixin.expect<texpect.mixin.ExpectMixin.expect>}.
+
+    @ivar patterns: A list of strings or compiled regular expression objects
+    (a single string or regular expression is put in a list)
+    @type patterns: C{list}
+    @ivar goto: For each of the patterns, the name of the state, that the dialog
+    proceeds to, if the pattern matches, or C{None} to proceed to the next step.
+    @type goto: C{list} or C{dict}
+    @ivar timeout: Timeout in seconds for this step
+    @type timeout: C{int}
+    @ivar save: If set, the data up to and including the match is saved in
+    the result of the dialog under this key
+    @type save: C{str}
+
+    """
+
+    def __init__(self, patterns, goto=None, timeout=None, save=None):
+        if isinstance(patterns, matching.string_types) or hasattr(patterns, 'pattern'):
+            patterns = [patterns]
+        self.patterns = patterns
+        self.goto = goto
+        self.timeout = timeout
+        self.save = save
+
+
+class Goto(Step):
+    r"""Proceed to a different state.
+
+    @ivar state: Name of the state
+    @type state: C{str}
+
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+
+class Fail(Step):
+    r"""Fail the dialog with L{DialogFailed<texpect.errors.DialogFailed>}.
+
+    @ivar message: Message for the exception
+    @type message: C{str}
+
+    """
+
+    def __init__(self, message='Dialog failed'):
+        self.message = message
+
+
+class Dialog(object):
+    r"""A dialog, compiled into a program, that can be carried out by any
+    number of sessions.
+
+    The program is a list of instructions, which are tuples, the first item of
+    which is the opcode:
+        - C{(SEND, data)}
+        - C{(EXPECT, pattern_set, timeout, targets, save)}, where C{targets} is
+          a tuple of the addresses of instructions, one for each pattern, or
+          C{None}, meaning 'the next instruction'
+        - C{(GOTO, address)}
+        - C{(FAIL, message)}
+        - C{(DONE,)}
+
+    @ivar program: The compiled program
+    @type program: C{list}
+    @ivar states: Addresses of the first instructions of the states
+    @type states: C{dict}
+
+    """
+
+    def __init__(self, states, start=None):
+        r"""
+        @param states: A dictionary, that maps the names of the states to lists
+        of L{Step}s, or a single list of steps.
+        @param start: Name of the state, that the dialog starts in. Can be
+        omitted, if there is only one state.
+        @raise ValueError: if a step refers to a state, that does not exist or
+        if the dialog can go round in a loop, that has no L{Expect} step in it
+
+        """
+        if isinstance(states, (list, tuple)):
+            states = {start: states}
+        if start not in states:
+            if len(states) != 1:
+                raise ValueError('Unknown start state: %r' % (start,))
+            start = states.keys()[0]
+        self.program = []
+        self.states = {}
+        fixups = []
+        for name in [start] + sorted(name for name in states if name != start):
+            self.states[name] = len(self.program)
+            for step in states[name]:
+                self._compile(step, fixups)
+            self.program.append((DONE,))
+        for address, fixup in fixups:
+            self.program[address] = fixup(self._resolve)
+        self._check_loops()
+
+    def _resolve(self, state):
+        if state is None:
+            return None
+        try:
+            return self.states[state]
+        except KeyError:
+            raise ValueError('Unknown state: %r' % (state,))
+
+    def _check_loops(self):
+        r"""Make sure, that every loop of the program waits for the data
+        somewhere, a loop of L{Send} and L{Goto} steps would never give the
+        reactor a chance to run.
+
+        @raise ValueError: if there is such a loop
+
+        """
+        checked = set()
+        for address in range(len(self.program)):
+            path = []
+            while address not in checked:
+                instruction = self.program[address]
+                if instruction[0] not in (SEND, GOTO):
+                    break
+                if address in path:
+                    state = max((start, name) for name, start in self.states.items()
+                                if start <= address)[1]
+                    raise ValueError('The dialog loops without an Expect step '
+                                     'in state %r' % (state,))
+                path.append(address)
+                if instruction[0] == SEND:
+                    address += 1
+                else:
+                    address = instruction[1]
+            checked.update(path)
+
+    def _compile(self, step, fixups):
+        address = len(self.program)
+        if isinstance(step, Send):
+            self.program.append((SEND, step.data))
+        elif isinstance(step, Fail):
+            self.program.append((FAIL, step.message))
+        elif isinstance(step, Goto):
+            self.program.append(None)
+            fixups.append((address, lambda resolve: (GOTO, resolve(step.state))))
+        elif isinstance(step, Expect):
+            pattern_set = matching.compile_patterns(step.patterns)
+            goto = step.goto
+            if goto is None:
+                goto = {}
+            elif not isinstance(goto, dict):
+                goto = dict(enumerate(goto))
+            names = [goto.get(index) for index in range(len(pattern_set))]
+            self.program.append(None)
+            fixups.append((address, lambda resolve: (EXPECT, pattern_set, step.timeout,
+                                                     tuple(resolve(name) for name in names),
+                                                     step.save)))
+        else:
+            raise TypeError('Not a dialog step: %r' % (step,))
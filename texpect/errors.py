@@ -68,3 +68,47 @@ class ConnectionAlreadyClosed(RequestFailed):
     def __init__(self, msg='Connection is closed, can not complete the request.',
                  data=None, promise=None):
         super(ConnectionAlreadyClosed, self).__init__(msg, data, promise)
+
+
+class RequestCancelled(RequestFailed):
+    """A queued request was not carried out, because a request, that was
+    queued before it, has failed.
+
+    """
+    def __init__(self, msg='A preceding request has failed, the request was cancelled',
+                 data=None, promise=None):
+        super(RequestCancelled, self).__init__(msg, data, promise)
+
+
+class BufferLimitExceeded(RequestFailed):
+    """The buffer has grown past the
+    L{high_watermark<texpect.mixin.ExpectMixin.high_watermark>}, while the
+    request was waiting for a pattern to match, and nothing bounds it.
+
+    """
+    def __init__(self, msg='The buffer has grown past the high watermark, '
+                 'while the request was waiting', data=None, promise=None):
+        super(BufferLimitExceeded, self).__init__(msg, data, promise)
+
+
+class DialogFailed(RequestFailed):
+    """A dialog has reached a L{Fail<texpect.dialog.Fail>} step."""
+    def __init__(self, msg='Dialog failed', data=None, promise=None):
+        super(DialogFailed, self).__init__(msg, data, promise)
+
+
+class PoolClosed(ExpectError):
+    """A session was requested from a L{SessionPool<texpect.pool.SessionPool>},
+    that has been closed.
+
+    """
+    pass
+
+
+class SSHConnectionFailed(ExpectError):
+    """An SSH connection could not be established: the connection was refused
+    or lost, the host key was not accepted or the authentication failed (see
+    L{SSHClient<texpect.ssh.SSHClient>}).
+
+    """
+    pass
@@ -0,0 +1,272 @@
+"""
+Running the same session against many hosts at once, without opening all of
+the connections at the same time::
+
+    def show_version(session):
+        d = session.read_until('#')
+        d.addCallback(lambda ign: session.write('show version\\n'))
+        d.addCallback(lambda ign: session.read_until('#'))
+        return d
+
+    def report(host, success, result):
+        if success:
+            print host, result
+        else:
+            print host, 'failed:', result.getErrorMessage()
+
+    run = FanOut(show_version, hosts, concurrency=200, rate=50,
+                 on_result=report, timeout=30)
+    d = run.start()
+    d.addCallback(lambda progress: log.msg('Done: %s' % progress))
+
+@author: shylent
+"""
+from texpect.dialog import Dialog
+from texpect.protocols import TelnetExpect
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.protocol import ClientCreator
+from twisted.python import log
+
+
+class Progress(object):
+    r"""Aggregate progress of a L{FanOut}.
+
+    @ivar total: Number of hosts or C{None}, if it is not known yet (the
+    hosts are taken from an iterable one at a time, as the sessions are
+    started)
+    @type total: C{int} or C{NoneType}
+    @ivar started: Number of the sessions, that have been started
+    @type started: C{int}
+    @ivar succeeded: Number of the sessions, that have succeeded
+    @type succeeded: C{int}
+    @ivar failed: Number of the sessions, that have failed
+    @type failed: C{int}
+
+    """
+
+    def __init__(self, total=None):
+        self.total = total
+        self.started = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    @property
+    def finished(self):
+        r"""Number of the sessions, that have finished."""
+        return self.succeeded + self.failed
+
+    @property
+    def active(self):
+        r"""Number of the sessions, that are in progress."""
+        return self.started - self.finished
+
+    def __str__(self):
+        return '%d/%s finished (%d failed), %d in progress' % (
+            self.finished, '?' if self.total is None else self.total,
+            self.failed, self.active)
+
+
+class FanOut(object):
+    r"""Connects to each of the hosts, calls a function with the session and
+    closes the session, when the function is done.
+
+    At most L{concurrency} sessions are in progress at a time and at most
+    L{rate} connections are opened per second. The hosts are taken from the
+    iterable lazily, so it can be a generator.
+
+    The result of each session is reported to L{on_result}, as soon as the
+    session finishes, with the same C{(success, result)} pair, that
+    L{DeferredList<twisted.internet.defer.DeferredList>} uses: if the
+    connection attempt or the function fails (for example, with
+    L{RequestTimeout<texpect.errors.RequestTimeout>} or
+    L{ConnectionAlreadyClosed<texpect.errors.ConnectionAlreadyClosed>}),
+    C{success} is C{False} and C{result} is the L{Failure}.
+
+    @ivar func: A callable, that takes a session and returns a result or a
+    L{Deferred}, or a L{Dialog<texpect.dialog.Dialog>} to carry out with
+    L{run<texpect.mixin.ExpectMixin.run>}
+    @ivar hosts: An iterable of host names or C{(host, port)} tuples
+    @ivar concurrency: Maximum number of sessions in progress
+    @type concurrency: C{int}
+    @ivar rate: Maximum number of connections per second, C{None} means no limit
+    @type rate: C{float} or C{NoneType}
+    @ivar port: Port to connect to, if the host does not specify one
+    @type port: C{int}
+    @ivar on_result: A callable, that is called with the host, the success
+    flag and the result, when a session finishes
+    @ivar progress: The progress so far
+    @type progress: L{Progress}
+    @ivar protocol: The class of the sessions
+    @type protocol: A subclass of L{ExpectMixin<texpect.mixin.ExpectMixin>}
+
+    """
+
+    protocol = TelnetExpect
+
+    def __init__(self, func, hosts, concurrency=100, rate=None, port=23,
+                 on_result=None, timeout=None, connect_timeout=30, _reactor=None):
+        r"""
+        @param func: A callable, that takes a session, or a dialog
+        @type func: C{callable} or L{Dialog<texpect.dialog.Dialog>}
+        @param hosts: An iterable of host names or C{(host, port)} tuples
+        @param concurrency: Maximum number of sessions in progress. Default: 100
+        @type concurrency: C{int}
+        @param rate: Maximum number of connections per second. Default: C{None}
+        @type rate: C{float}
+        @param port: Default port. Default: 23
+        @type port: C{int}
+        @param on_result: A callable, that takes the host, the success flag and
+        the result. Default: C{None}
+        @param timeout: Default timeout for the requests of the sessions.
+        Default: C{None}
+        @type timeout: C{int}
+        @param connect_timeout: Connection timeout in seconds. Default: 30
+        @type connect_timeout: C{int}
+
+        """
+        if _reactor is None:
+            from twisted.internet import reactor as _reactor
+        self._reactor = _reactor
+        if isinstance(func, Dialog):
+            dialog = func
+            func = lambda session: session.run(dialog)
+        self.func = func
+        self.hosts = hosts
+        self.concurrency = concurrency
+        self.rate = rate
+        self.port = port
+        self.on_result = on_result
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        total = None
+        if hasattr(hosts, '__len__'):
+            total = len(hosts)
+        self.progress = Progress(total)
+        self._hosts = None
+        self._next_host = None
+        self._done = None
+        self._next_slot = None
+        self._delayed = None
+        self._filling = False
+        self._refill = False
+
+    def start(self):
+        r"""Start the sessions.
+
+        @return: A L{Deferred}, that fires with L{progress}, when all of the
+        sessions have finished
+        @rtype: L{Deferred}
+
+        """
+        if self._done is None:
+            self._done = Deferred()
+            self._hosts = iter(self.hosts)
+            self._fill()
+        return self._done
+
+    def stop(self):
+        r"""Do not start any more sessions. The ones, that are in progress, are
+        allowed to finish.
+
+        """
+        if self._hosts is not None:
+            self._exhausted()
+            self._fill()
+
+    def _connect(self, host, port):
+        r"""Connect to the host.
+
+        @return: A L{Deferred}, that fires with a new session
+        @rtype: L{Deferred}
+
+        """
+        creator = ClientCreator(self._reactor, self.protocol, timeout=self.timeout,
+                                _reactor=self._reactor)
+        return creator.connectTCP(host, port, self.connect_timeout)
+
+    def _exhausted(self):
+        self._hosts = None
+        self._next_host = None
+        self.progress.total = self.progress.started
+        if self._delayed is not None and self._delayed.active():
+            self._delayed.cancel()
+        self._delayed = None
+
+    def _fill(self):
+        r"""Start the sessions, until one of the limits is reached."""
+        if self._filling:
+            self._refill = True
+            return
+        self._filling = True
+        try:
+            self._refill = True
+            while self._refill:
+                self._refill = False
+                while self._hosts is not None and self.progress.active < self.concurrency:
+                    if self._next_host is None:
+                        try:
+                            self._next_host = (self._hosts.next(),)
+                        except StopIteration:
+                            self._exhausted()
+                            break
+                    if not self._reserve_slot():
+                        break
+                    (host,), self._next_host = self._next_host, None
+                    self._start(host)
+        finally:
+            self._filling = False
+        if self._hosts is None and not self.progress.active and not self._done.called:
+            self._done.callback(self.progress)
+
+    def _reserve_slot(self):
+        r"""Enforce the connection rate.
+
+        @return: Whether a connection may be opened right now. If not, L{_fill}
+        is scheduled to be called, when it may.
+        @rtype: C{bool}
+
+        """
+        if self.rate is None:
+            return True
+        if self._delayed is not None:
+            return False
+        now = self._reactor.seconds()
+        if self._next_slot is not None and now < self._next_slot:
+            self._delayed = self._reactor.callLater(self._next_slot - now, self._slot_ready)
+            return False
+        self._next_slot = max(now, self._next_slot or now) + 1.0 / self.rate
+        return True
+
+    def _slot_ready(self):
+        self._delayed = None
+        self._fill()
+
+    def _start(self, host):
+        self.progress.started += 1
+        if isinstance(host, tuple):
+            hostname, port = host
+        else:
+            hostname, port = host, self.port
+        d = self._connect(hostname, port)
+        d.addCallback(self._connected)
+        d.addCallbacks(self._finished, self._finished,
+                       callbackArgs=(host, True), errbackArgs=(host, False))
+
+    def _connected(self, session):
+        def close(result):
+            if not session.eof:
+                session.close()
+            return result
+        return maybeDeferred(self.func, session).addBoth(close)
+
+    def _finished(self, result, host, success):
+        if success:
+            self.progress.succeeded += 1
+        else:
+            self.progress.failed += 1
+        if self.on_result is not None:
+            try:
+                self.on_result(host, success, result)
+            except:
+                log.err(None, 'Error in the result handler for %s' % (host,))
+        self._fill()
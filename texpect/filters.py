@@ -0,0 +1,232 @@
+"""
+Filters, that clean up the received data before it reaches the buffer of a
+session, so that the patterns do not have to put up with the noise of the
+terminals: the colors and the cursor movements (L{StripANSI}), the assorted
+line endings (L{NormalizeNewlines}) and the overstrikes (L{ApplyBackspaces}).
+The filters of a session are listed in L{filters<texpect.mixin.ExpectMixin.filters>}::
+
+    class RouterSession(TelnetExpect):
+        filters = (StripANSI, NormalizeNewlines)
+
+    d = session.read_until('\\nrouter#')
+
+The filters are streaming: a sequence, that is split between two chunks of
+the data, is held back, until the rest of it arrives, so the result does not
+depend on how the data was chunked.
+
+@author: shylent
+"""
+import re
+
+
+class Filter(object):
+    r"""Base class for the filters. A filter is created for each session, so
+    it may keep the state of the stream.
+
+    """
+
+    def feed(self, data):
+        r"""Filter a chunk of the data.
+
+        @type data: C{str}
+        @return: The filtered data. A part of it may be held back until the
+        next chunk (or L{flush}).
+        @rtype: C{str}
+
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        r"""The stream is over, give up the data, that is held back.
+
+        @rtype: C{str}
+
+        """
+        return b''
+
+
+class StripANSI(Filter):
+    r"""Removes the ANSI (ECMA-48) escape sequences: the control sequences
+    (C{ESC [ ... m} and the like), the strings (C{ESC ] ... BEL}, the window
+    titles and the like) and the other escape sequences (C{ESC ( B},
+    C{ESC =}).
+
+    @ivar max_pending: The longest incomplete sequence, that is held back at
+    the end of a chunk, a longer one is assumed to be garbage and passed on
+    @type max_pending: C{int}
+
+    """
+
+    max_pending = 256
+
+    _complete = re.compile(b'\x1b(?:\\[[0-?]*[ -/]*[@-~]'
+                           b'|[\\]PX^_][^\x07\x1b]*(?:\x07|\x1b\\\\)'
+                           b'|[ -/]*[0-OQ-WYZ\\\\`a-~])')
+    _incomplete = re.compile(b'\x1b(?:\\[[0-?]*[ -/]*'
+                             b'|[\\]PX^_][^\x07\x1b]*\x1b?'
+                             b'|[ -/]*)\\Z')
+
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, data):
+        if self._pending:
+            data = self._pending + data
+            self._pending = b''
+        elif b'\x1b' not in data:
+            return data
+        data = self._complete.sub(b'', data)
+        tail = self._incomplete.search(data, max(0, len(data) - self.max_pending))
+        if tail is not None:
+            self._pending = data[tail.start():]
+            data = data[:tail.start()]
+        return data
+
+    def flush(self):
+        pending, self._pending = self._pending, b''
+        return pending
+
+
+class NormalizeNewlines(Filter):
+    r"""Turns C{CR LF} (and C{CR CR LF}, or any number of C{CR}s before
+    C{LF}) into C{LF}. The lone C{CR}s are left alone, unless L{lone_cr} is
+    set.
+
+    @ivar lone_cr: What a C{CR}, that is not followed by C{LF}, is replaced
+    with, C{None} means that it is kept. Default: C{None}
+    @type lone_cr: C{str} or C{NoneType}
+
+    """
+
+    _newline = re.compile(b'\r+\n')
+    _lone_cr = re.compile(b'\r(?!\n)')
+
+    def __init__(self, lone_cr=None):
+        r"""
+        @param lone_cr: See L{lone_cr}. Default: C{None}
+        @type lone_cr: C{str}
+
+        """
+        self.lone_cr = lone_cr
+        self._pending = b''
+
+    def feed(self, data):
+        if self._pending:
+            data = self._pending + data
+            self._pending = b''
+        elif b'\r' not in data:
+            return data
+        stripped = data.rstrip(b'\r')
+        if len(stripped) < len(data):
+            # The line feed may follow in the next chunk
+            self._pending = data[len(stripped):]
+            data = stripped
+        return self._normalize(data)
+
+    def flush(self):
+        pending, self._pending = self._pending, b''
+        return self._normalize(pending)
+
+    def _normalize(self, data):
+        data = self._newline.sub(b'\n', data)
+        if self.lone_cr is not None:
+            data = self._lone_cr.sub(self.lone_cr, data)
+        return data
+
+
+class ApplyBackspaces(Filter):
+    r"""Carries out the backspaces: a backspace erases the character before
+    it, so that the overstrikes (C{'_\bx'}) and the redrawn parts of a line
+    (a pager's C{'--More--\b\b\b\b\b\b\b\b        \b\b\b\b\b\b\b\b'}) leave
+    only what would be seen on the screen. A backspace does not go back past
+    the beginning of a line.
+
+    Once there is a backspace in a line, the rest of the line is held back,
+    until it is finished, so that the backspaces of the next chunk can erase
+    it. The lines, that have no backspaces, such as the prompts, are passed on
+    at once, the backspaces, that erase the characters of such a line, that
+    were in a previous chunk, are dropped.
+
+    @ivar max_pending: The longest part of a line, that is held back, a
+    longer one is passed on
+    @type max_pending: C{int}
+
+    """
+
+    max_pending = 256
+
+    def __init__(self):
+        self._pending = b''
+        self._editing = False
+
+    def feed(self, data):
+        if self._editing:
+            data = self._pending + data
+            self._pending = b''
+        elif b'\b' not in data:
+            return data
+        line = data.rfind(b'\n') + 1
+        if line:
+            self._editing = False
+        if b'\b' in data[line:]:
+            self._editing = True
+        pieces = data.split(b'\b')
+        out = bytearray(pieces[0])
+        for piece in pieces[1:]:
+            if out and out[-1:] != b'\n':
+                del out[-1]
+            out.extend(piece)
+        if self._editing:
+            line = out.rfind(b'\n') + 1
+            if len(out) - line <= self.max_pending:
+                self._pending = bytes(out[line:])
+                del out[line:]
+        return bytes(out)
+
+    def flush(self):
+        pending, self._pending = self._pending, b''
+        self._editing = False
+        return pending
+
+
+class Pipeline(object):
+    r"""Passes the data through a chain of filters.
+
+    @ivar filters: The filters, in the order, in which they are applied
+    @type filters: C{list} of L{Filter}
+
+    """
+
+    def __init__(self, filters=()):
+        r"""
+        @param filters: The filters. Default: none
+        @type filters: C{list}
+
+        """
+        self.filters = list(filters)
+
+    def feed(self, data):
+        r"""
+        @return: The data, that came out of the last filter
+        @rtype: C{str}
+
+        """
+        for f in self.filters:
+            if not data:
+                break
+            data = f.feed(data)
+        return data
+
+    def flush(self):
+        r"""Flush all of the filters, each one's data goes through the ones,
+        that follow it.
+
+        @rtype: C{str}
+
+        """
+        data = b''
+        for f in self.filters:
+            if data:
+                data = f.feed(data)
+            data += f.flush()
+        return data
@@ -0,0 +1,776 @@
+"""
+Helpers for analysing the patterns, that are used by the 'expect' family of
+requests.
+
+@author: shylent
+"""
+from collections import deque
+from heapq import nsmallest
+from itertools import count
+import re
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+try:
+    unicode
+except NameError:
+    # Python 3
+    unicode = str
+    basestring = (str, bytes)
+    _unichr = chr
+else:
+    _unichr = unichr
+
+#: The types of the patterns, that are not compiled yet
+string_types = (bytes, unicode)
+
+
+def _walk(data):
+    r"""Recursively yield all C{(opcode, argument)} pairs of a parsed pattern.
+
+    @param data: A list of C{(opcode, argument)} pairs, as found in the C{data}
+    attribute of L{sre_parse.SubPattern}.
+
+    """
+    for op, av in data:
+        yield op, av
+        for sub in _subpatterns(av):
+            for item in _walk(sub):
+                yield item
+
+def _subpatterns(av):
+    r"""Find the nested subpatterns in the argument of an opcode."""
+    if isinstance(av, sre_parse.SubPattern):
+        yield av.data
+    elif isinstance(av, (list, tuple)):
+        for item in av:
+            for sub in _subpatterns(item):
+                yield sub
+
+
+_beginnings = (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING)
+_boundaries = (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY)
+
+
+def _context(data):
+    r"""See L{context}, C{data} is the parsed pattern."""
+    width = 0
+    for op, av in _walk(data):
+        if op == sre_constants.AT:
+            if av in _beginnings:
+                return None
+            if av in _boundaries:
+                width = max(width, 1)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) and av[0] < 0:
+            width = max(width, av[1].getwidth()[1])
+    return width
+
+
+def context(pattern):
+    r"""Determine, how many characters before the beginning of a match the
+    pattern may look at: C{\b} and C{\B} look at one, a lookbehind assertion
+    looks at as many, as it may match. If the pattern tells the beginning of
+    the data apart (C{^} and C{\A}), C{None} is returned, since no amount of
+    the preceding data is enough to tell, whether the match is at the beginning
+    or not, once the data is gone.
+
+    @param pattern: A compiled regular expression object
+    @rtype: C{int} or C{None}
+
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (sre_constants.error, TypeError):
+        return None
+    return _context(parsed.data)
+
+
+def lookback(pattern):
+    r"""Determine, how far back from the end of already searched data a search
+    has to be restarted, so that a match, that spans the boundary between
+    the old and the newly received data, is not missed.
+
+    This is the maximum width of the match minus one plus the L{context}, that
+    the pattern looks at before the match. If the width of the match can not
+    be bounded (the pattern contains unbounded repeats, backreferences or
+    lookahead assertions, which may need the data past the end of the match)
+    or the pattern is anchored at the beginning of the data, C{None} is
+    returned.
+
+    @param pattern: A compiled regular expression object
+    @rtype: C{int} or C{None}
+
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (sre_constants.error, TypeError):
+        return None
+    for op, av in _walk(parsed.data):
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return None
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) and av[0] > 0:
+            return None
+    extra = _context(parsed.data)
+    width = parsed.getwidth()[1]
+    if extra is None or width >= sre_constants.MAXREPEAT:
+        return None
+    return max(width - 1, 0) + extra
+
+
+def _has_backreferences(pattern):
+    r"""Check, whether a pattern refers to its groups by number or name."""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (sre_constants.error, TypeError):
+        return True
+    for op, av in _walk(parsed.data):
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return True
+    return False
+
+
+def _combine(patterns):
+    r"""Compile a list of patterns into a single alternation, where each of the
+    patterns is wrapped into a capturing group of its own.
+
+    @param patterns: A list of compiled regular expression objects
+    @return: A tuple of the combined pattern and the list of group numbers of
+    the alternatives or C{None}, if the patterns can not be combined (they
+    use different flags, backreferences and so on)
+
+    """
+    if len(patterns) < 2:
+        return None
+    flags = patterns[0].flags
+    kind = type(patterns[0].pattern)
+    groups = []
+    alternatives = []
+    group = 1
+    for pattern in patterns:
+        if pattern.flags != flags or type(pattern.pattern) is not kind:
+            return None
+        if _has_backreferences(pattern):
+            return None
+        groups.append(group)
+        group += pattern.groups + 1
+        if flags & re.VERBOSE:
+            alternatives.append(_same_kind(kind, '(') + pattern.pattern + _same_kind(kind, '\n)'))
+        else:
+            alternatives.append(_same_kind(kind, '(') + pattern.pattern + _same_kind(kind, ')'))
+    try:
+        combined = re.compile(_same_kind(kind, '|').join(alternatives), flags)
+    except (re.error, AssertionError, OverflowError):
+        # Python 2 can not handle more than 100 groups in a pattern
+        return None
+    return combined, groups
+
+
+def _same_kind(kind, string):
+    r"""Convert an ASCII string to the type of the patterns, which is either
+    a byte string or a unicode string.
+
+    """
+    if kind is bytes:
+        return string.encode('ascii')
+    return kind(string)
+
+
+def literal(pattern):
+    r"""Find out, whether a pattern matches a fixed string, that is, it contains
+    no special characters, and if it does, return this string.
+
+    @param pattern: A compiled regular expression object
+    @rtype: C{str}, C{unicode} or C{None}
+
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (sre_constants.error, TypeError):
+        return None
+    if not parsed.data:
+        return None
+    chars = []
+    for op, av in parsed.data:
+        if op != sre_constants.LITERAL:
+            return None
+        chars.append(av)
+    if isinstance(pattern.pattern, unicode):
+        return u''.join(_unichr(c) for c in chars)
+    return bytes(bytearray(chars))
+
+
+class ScanState(object):
+    r"""The state of an L{AhoCorasick} automaton, that is scanning a stream
+    of data.
+
+    @ivar pos: Position in the data, up to which the data has been scanned
+    @type pos: C{int}
+    @ivar state: Current state of the automaton
+    @type state: C{int}
+
+    """
+
+    __slots__ = ('pos', 'state')
+
+    def __init__(self, pos=0):
+        self.pos = pos
+        self.state = 0
+
+
+class AhoCorasick(object):
+    r"""An U{Aho-Corasick<http://en.wikipedia.org/wiki/Aho-Corasick_algorithm>}
+    automaton, that finds the occurrences of several fixed strings in a single
+    pass over the data.
+
+    The automaton is fed the data incrementally, its state (L{ScanState}) is
+    kept between the calls to L{scan}, so the data is never searched twice,
+    regardless of how it is fragmented. While the automaton is in its initial
+    state, the data is skipped up to the next complete occurrence of any of the
+    strings using a regular expression search, which is considerably faster,
+    than stepping through every character in Python. The automaton only steps
+    through the occurrences themselves (to find all of the overlapping ones)
+    and through the end of the data, where an occurrence may be incomplete.
+
+    """
+
+    def __init__(self, literals):
+        r"""
+        @param literals: A list of tuples: the index of the pattern and the
+        string, that it matches.
+
+        """
+        goto = [{}]
+        out = [[]]
+        state_of = {}
+        for index, string in literals:
+            state = 0
+            for char in string:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    out.append([])
+                    goto[state][char] = next_state
+                state = next_state
+            out[state].append(index)
+            state_of[string] = state
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[next_state] = goto[f].get(char, 0)
+                out[next_state] = sorted(out[next_state] + out[fail[next_state]])
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._first = min(index for index, string in literals)
+        self._first_string = dict(literals)[self._first]
+        self._first_state = state_of[self._first_string]
+        self._longest = max(len(string) for index, string in literals)
+        self._skip = re.compile(_same_kind(type(self._first_string), '|').join(
+            re.escape(string) for index, string in literals))
+
+    def scan(self, string, scan, bound):
+        r"""Scan the data, starting at the position, recorded in the scan
+        state, and find the occurrence of the string with the lowest index.
+
+        @param string: The data to scan
+        @type string: C{str} or C{buffer}
+        @param scan: The state of the scan, it is updated in place
+        @type scan: L{ScanState}
+        @param bound: Only the strings with the index lower, than this, are of
+        interest.
+        @type bound: C{int}
+        @return: The index of the string and the position of the end of its
+        first occurrence in the data.
+        @rtype: C{(int, int)} or C{None}
+
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        skip = self._skip.search
+        state, pos, end = scan.state, scan.pos, len(string)
+        best = None
+        tail = False
+        while pos < end:
+            if not state and not tail:
+                match = skip(string, pos)
+                if match is None:
+                    # None of the strings occurs in the rest of the data, only
+                    # the state of the automaton at its end is of interest
+                    tail = True
+                    pos = max(pos, end - self._longest + 1)
+                    continue
+                if self._first < bound and match.group() == self._first_string:
+                    # Nothing can beat the string with the lowest index, so
+                    # there is no need to step through it
+                    scan.state, scan.pos = self._first_state, match.end()
+                    return self._first, match.end()
+                pos = match.start()
+            char = string[pos]
+            pos += 1
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                index = out[state][0]
+                if index < bound and (best is None or index < best[0]):
+                    best = (index, pos)
+                    if index == self._first:
+                        break
+        scan.state, scan.pos = state, pos
+        return best
+
+
+class PatternSet(object):
+    r"""A list of patterns, that have been prepared for searching.
+
+    The patterns are tried in the order, in which they are present in the list,
+    that is, if a pattern matches anywhere in the data, the patterns, that
+    follow it, are not considered.
+
+    The patterns, that match fixed strings (see L{literal}), are searched for
+    with an L{AhoCorasick} automaton. Whenever possible, the rest of them are
+    combined into a single alternation, so that the data is scanned once to find
+    the earliest position, where any of the patterns matches. Only the patterns,
+    that precede the winning one in the list, have to be tried after that
+    position.
+
+    @ivar patterns: The compiled patterns
+    @type patterns: C{tuple}
+    @ivar lookbacks: The L{lookback} of each of the patterns
+    @type lookbacks: C{tuple}
+    @ivar contexts: The L{context} of each of the patterns
+    @type contexts: C{tuple}
+
+    """
+
+    def __init__(self, patterns):
+        r"""
+        @param patterns: A list of compiled regular expression objects
+        """
+        self.patterns = tuple(patterns)
+        self.lookbacks = tuple(lookback(pattern) for pattern in self.patterns)
+        self.contexts = tuple(context(pattern) for pattern in self.patterns)
+        literals = []
+        self._regexes = []
+        for index, pattern in enumerate(self.patterns):
+            string = literal(pattern)
+            if string is None:
+                self._regexes.append(index)
+            else:
+                literals.append((index, string))
+        self._lengths = dict((index, len(string)) for index, string in literals)
+        self._automaton = AhoCorasick(literals) if literals else None
+        combined = _combine([self.patterns[index] for index in self._regexes])
+        if combined is None:
+            self._combined = self._groups = None
+        else:
+            self._combined, self._groups = combined
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def scan(self):
+        r"""Create a new state for the incremental search of the fixed strings
+        (see L{search}).
+
+        @rtype: L{ScanState}
+
+        """
+        return ScanState()
+
+    def search(self, string, offsets=None, scan=None):
+        r"""Find the first pattern in the list, that matches the string.
+
+        @param string: The data to search
+        @type string: C{str} or C{buffer}
+        @param offsets: For each pattern, the position in the string, where the
+        search should start. Default: C{None}, meaning 'search the whole string'.
+        @type offsets: C{list} of C{int}
+        @param scan: The state of the search for the fixed strings, which was
+        used, when the beginning of the same string was searched before. It
+        is updated in place. Default: C{None}, meaning that the search for the
+        fixed strings starts at the offsets, provided for them.
+        @type scan: L{ScanState}
+        @return: The index of the pattern, that matched and the match object
+        @rtype: C{(int, SRE_Match)} or C{None}
+
+        """
+        if offsets is None:
+            offsets = [0] * len(self.patterns)
+        found = self._search_regexes(string, offsets)
+        if self._automaton is None:
+            return found
+        if scan is None:
+            scan = ScanState(min(offsets[index] for index in self._lengths))
+        bound = len(self.patterns) if found is None else found[0]
+        hit = self._automaton.scan(string, scan, bound)
+        if hit is None:
+            return found
+        index, end = hit
+        return index, self.patterns[index].match(string, end - self._lengths[index])
+
+    def start(self, offsets=None, scan=None, length=0):
+        r"""Get the position in the string, from which L{search} with the same
+        arguments starts reading it.
+
+        @param length: Length of the string (only L{TailPatternSet} needs it)
+        @type length: C{int}
+        @rtype: C{int}
+
+        """
+        if offsets is None:
+            return 0
+        positions = []
+        if self._regexes:
+            positions.append(min(offsets[index] for index in self._regexes))
+        if self._automaton is not None:
+            if scan is None:
+                positions.append(min(offsets[index] for index in self._lengths))
+            else:
+                positions.append(scan.pos)
+        return min(positions)
+
+    def _search_regexes(self, string, offsets):
+        r"""Find the first pattern in the list, that is not a fixed string,
+        that matches the string (see L{search}).
+
+        """
+        if self._combined is None:
+            return self._search_each(string, offsets)
+        match = self._combined.search(string, min(offsets[index] for index in self._regexes))
+        if not match:
+            return None
+        for position, group in enumerate(self._groups):
+            if match.start(group) != -1:
+                break
+        start = match.start()
+        if start < offsets[self._regexes[position]]:
+            # The pattern matched in the data, that it has to skip (see
+            # L{resume}), the others may still match at the same position
+            return self._search_each(string, offsets)
+        # The patterns, that precede the winning one, did not match at or
+        # before the position of the match, but may still match further on
+        for index in self._regexes[:position]:
+            earlier = self.patterns[index].search(string, max(offsets[index], start + 1))
+            if earlier:
+                return index, earlier
+        index = self._regexes[position]
+        return index, self.patterns[index].match(string, start)
+
+    def _search_each(self, string, offsets):
+        r"""Search for the patterns, that are not fixed strings, one by one."""
+        for index in self._regexes:
+            match = self.patterns[index].search(string, offsets[index])
+            if match:
+                return index, match
+        return None
+
+
+class TailPatternSet(PatternSet):
+    r"""A list of patterns, that may only match at the end of the data, such
+    as the prompts: a device sends its prompt last, before it waits for
+    input. Only the last L{tail} bytes of the data are searched, so the cost
+    of a search does not depend on how much data has been received.
+
+    The match has to start within the tail, so it should be longer, than any
+    of the prompts, a pattern like C{r'\S+#'} matches only a part of a
+    longer prompt.
+
+    @ivar tail: Number of bytes at the end of the data, that are searched
+    @type tail: C{int}
+
+    """
+
+    def __init__(self, patterns, tail):
+        r"""
+        @param patterns: A list of compiled regular expression objects
+        @param tail: See L{tail}
+        @type tail: C{int}
+
+        """
+        self.patterns = tuple(patterns)
+        self.lookbacks = (0,) * len(self.patterns)
+        self.contexts = (0,) * len(self.patterns)
+        self.tail = tail
+        self._anchored = [self._anchor(pattern) for pattern in self.patterns]
+
+    @staticmethod
+    def _anchor(pattern):
+        kind = type(pattern.pattern)
+        if pattern.flags & re.VERBOSE:
+            end = '\n)\\Z'
+        else:
+            end = ')\\Z'
+        anchored = _same_kind(kind, '(?:') + pattern.pattern + _same_kind(kind, end)
+        return re.compile(anchored, pattern.flags)
+
+    def scan(self):
+        return None
+
+    def search(self, string, offsets=None, scan=None):
+        r"""Find the first pattern in the list, that matches at the end of
+        the string. The offsets and the scan state are ignored, only the tail
+        of the string is searched.
+
+        @return: The index of the pattern, that matched and the match object
+        (of the pattern, anchored at the end of the data, the groups are the
+        same, as the ones of the original pattern)
+        @rtype: C{(int, SRE_Match)} or C{None}
+
+        """
+        start = self.start(length=len(string))
+        for index, pattern in enumerate(self._anchored):
+            match = pattern.search(string, start)
+            if match:
+                return index, match
+        return None
+
+    def start(self, offsets=None, scan=None, length=0):
+        return max(length - self.tail, 0)
+
+
+def _offsets(request, searched):
+    r"""Get the position in the data, where the search for each of the
+    patterns of a request (re)starts, given how much of the data has been
+    searched (see L{lookback}).
+
+    @param request: The state of the search (see L{resume})
+    @param searched: Length of the data, that has been searched
+    @type searched: C{int}
+    @rtype: C{list} of C{int}
+
+    """
+    return [0 if lb is None else max(searched - lb, 0) for lb in request.lookbacks]
+
+
+def _search_offsets(request):
+    r"""Get the position in the data, where the search for each of the
+    patterns of a request resumes. Once the beginning of the data has been
+    removed (see L{release} and L{truncate}), a pattern can not match, where
+    it would look at the data, that is gone (see L{context}).
+
+    @param request: The state of the search (see L{resume})
+    @rtype: C{list} of C{int}
+
+    """
+    offsets = _offsets(request, request.searched)
+    if request.truncated:
+        offsets = [max(offset, 1 if width is None else width)
+                   for offset, width in zip(offsets, request.matcher.contexts)]
+    return offsets
+
+
+def resume(string, request):
+    r"""Continue the search for the patterns of a request, that is waiting for
+    more data, skipping the data, that the request has already searched (as
+    far as the L{lookback} of each of the patterns allows).
+
+    @param string: All of the data, that the request is interested in,
+    including the data, that has already been searched
+    @type string: C{str} or C{buffer}
+    @param request: The state of the search, an object with these attributes:
+        - C{matcher}: the patterns (a L{PatternSet})
+        - C{lookbacks}: a sequence of the L{lookback}s of the patterns
+        - C{searched}: the length of the data, that has been searched
+        - C{scan}: a L{ScanState}, that was obtained from C{matcher}
+        - C{truncated}: whether the beginning of the data has been removed
+    C{searched} is updated, if no pattern matches.
+    @return: The index of the pattern, that matched and the match object
+    @rtype: C{(int, SRE_Match)} or C{None}
+
+    """
+    found = request.matcher.search(string, _search_offsets(request), request.scan)
+    if not found:
+        request.searched = len(string)
+    return found
+
+
+def release(request, length):
+    r"""Find out, how much of the beginning of the data the search for the
+    patterns of a request, that is waiting for more data, will never read
+    again, and shift the positions, that the request keeps, as if this data
+    was removed.
+
+    @param request: The state of the search (see L{resume})
+    @param length: Length of the data, that has been searched
+    @type length: C{int}
+    @return: Number of bytes, that may be removed from the beginning of the data
+    @rtype: C{int}
+
+    """
+    offsets = _offsets(request, request.searched)
+    # Without the scan state, the fixed strings are searched from their offsets,
+    # which go back far enough for the occurrence, that the automaton is in
+    size = request.matcher.start(offsets, None, length)
+    if size:
+        request.truncated = True
+        request.searched -= size
+        if request.scan is not None:
+            request.scan.pos -= size
+    return size
+
+
+def truncate(request, size):
+    r"""Shift the positions, that a request, that is waiting for more data,
+    keeps, as if the first C{size} bytes of the data were removed, whether or
+    not the search still needs them (unlike L{release}): the matches, that
+    would start in the removed data, are lost.
+
+    @param request: The state of the search (see L{resume})
+    @param size: Number of bytes, that are removed from the beginning of the data
+    @type size: C{int}
+
+    """
+    searched = max(request.searched - size, 0)
+    request.searched = searched
+    request.truncated = True
+    scan = request.scan
+    if scan is None:
+        return
+    if scan.state or scan.pos < size:
+        # The occurrence, that the automaton is in the middle of, may start in
+        # the removed data, what is left of it is scanned again
+        request.scan = ScanState(request.matcher.start(_offsets(request, searched)))
+    else:
+        scan.pos -= size
+
+
+def resume_start(request, length=0):
+    r"""Get the position in the data, from which L{resume} starts searching
+    for the patterns of a request.
+
+    @param length: Length of the data
+    @type length: C{int}
+    @rtype: C{int}
+
+    """
+    return request.matcher.start(_search_offsets(request), request.scan, length)
+
+
+class _LRUCache(object):
+    r"""A simple mapping, that only keeps a limited number of the most recently
+    used items.
+
+    A hit only stamps the item with the value of a counter, so that it is as
+    cheap, as a plain dictionary lookup. The least recently used items are
+    only looked for, when the cache overflows, which only happens, when a new
+    item, that is expensive to make anyway, is added.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = {}
+        self._clock = count()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        item[1] = next(self._clock)
+        return item[0]
+
+    def set(self, key, value):
+        self._items[key] = [value, next(self._clock)]
+        self.resize(self.size)
+
+    def resize(self, size):
+        self.size = size
+        excess = len(self._items) - size
+        if excess > 0:
+            oldest = nsmallest(excess, self._items.items(), key=lambda item: item[1][1])
+            for key, item in oldest:
+                del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+
+_pattern_sets = _LRUCache(512)
+_plain_flags = re.compile('').flags
+
+
+def _cache_key(pattern):
+    r"""Get the part of the key of L{_pattern_sets}, that corresponds to a
+    pattern, other than a plain string (which is its own key).
+
+    A compiled pattern has the same key as the string, that it was compiled
+    from, if it has no flags.
+
+    """
+    if isinstance(pattern, basestring):
+        return (type(pattern), pattern, 0)
+    if type(pattern.pattern) is str and pattern.flags == _plain_flags:
+        return pattern.pattern
+    return (type(pattern.pattern), pattern.pattern, pattern.flags)
+
+
+def _list_key(pattern_list):
+    r"""Get the key of L{_pattern_sets}, that corresponds to a list of patterns."""
+    return tuple([pattern if type(pattern) is str else _cache_key(pattern)
+                  for pattern in pattern_list])
+
+
+def _compile_list(pattern_list):
+    r"""Compile the patterns of a list, that are not compiled yet."""
+    return [re.compile(pattern) if isinstance(pattern, basestring) else pattern
+            for pattern in pattern_list]
+
+
+def compile_patterns(pattern_list):
+    r"""Prepare a list of patterns for searching.
+
+    The results are cached, so that preparing a list of patterns, that has been
+    seen recently (possibly by a different session), is cheap. The size of the
+    cache can be adjusted with L{set_cache_size}.
+
+    @param pattern_list: A list of strings or compiled regular expression objects
+    @rtype: L{PatternSet}
+
+    """
+    key = _list_key(pattern_list)
+    pattern_set = _pattern_sets.get(key)
+    if pattern_set is None:
+        pattern_set = PatternSet(_compile_list(pattern_list))
+        _pattern_sets.set(key, pattern_set)
+    return pattern_set
+
+
+def compile_prompts(pattern_list, tail):
+    r"""Prepare a list of patterns, that may only match at the end of the
+    data (see L{TailPatternSet}). The results are cached along with the ones
+    of L{compile_patterns}.
+
+    @param pattern_list: A list of strings or compiled regular expression objects
+    @param tail: Number of bytes at the end of the data, that are searched
+    @type tail: C{int}
+    @rtype: L{TailPatternSet}
+
+    """
+    key = (TailPatternSet, tail) + _list_key(pattern_list)
+    pattern_set = _pattern_sets.get(key)
+    if pattern_set is None:
+        pattern_set = TailPatternSet(_compile_list(pattern_list), tail)
+        _pattern_sets.set(key, pattern_set)
+    return pattern_set
+
+
+def set_cache_size(size):
+    r"""Set the maximum number of L{PatternSet}s, that are kept by
+    L{compile_patterns}.
+
+    @type size: C{int}
+
+    """
+    _pattern_sets.resize(size)
@@ -0,0 +1,262 @@
+"""
+Observing the sessions: what the requests are doing, how long they take and
+how much data goes through the sessions.
+
+An observer is set on L{ExpectMixin<texpect.mixin.ExpectMixin>} (on the
+class, so that it sees all of the sessions, or on a single session) and is
+told about the events as they happen. L{Metrics} is an observer, that only
+counts the events and keeps histograms of the request durations, so it is
+cheap enough to be left on::
+
+    metrics = Metrics()
+    ExpectMixin.observer = metrics
+    ...
+    log.msg('Sessions: %r' % metrics.snapshot())
+
+@author: shylent
+"""
+from bisect import bisect_left
+from collections import Counter
+
+
+class SessionObserver(object):
+    r"""Base class for the observers of the sessions. The events, that an
+    observer is not interested in, may be left alone, all of the methods do
+    nothing by default.
+
+    The methods are called synchronously, in the middle of processing the
+    data, so they should be quick.
+
+    """
+
+    def requestStarted(self, session, kind):
+        r"""A request has been made.
+
+        @param session: The session
+        @type session: L{ExpectMixin<texpect.mixin.ExpectMixin>}
+        @param kind: The kind of the request: C{'expect'}, C{'read_until'},
+        C{'expect_prompt'}, C{'read_lazy'}, C{'read_all'}, C{'run'} or C{'write'}
+        @type kind: C{str}
+
+        """
+
+    def requestFinished(self, session, kind, duration, error):
+        r"""A request has completed or failed.
+
+        @param duration: Time from the moment the request was made (queued,
+        if L{queue_requests<texpect.mixin.ExpectMixin.queue_requests>} is set)
+        until it was complete in seconds
+        @type duration: C{float}
+        @param error: The class of the exception, that the request failed
+        with (for example, L{RequestTimeout<texpect.errors.RequestTimeout>}),
+        C{None}, if it succeeded
+        @type error: C{type} or C{NoneType}
+
+        """
+
+    def dataReceived(self, session, size):
+        r"""Data has arrived.
+
+        @param size: Number of bytes
+        @type size: C{int}
+
+        """
+
+    def bytesScanned(self, session, size):
+        r"""The patterns of a request have been searched for (a match attempt).
+
+        @param size: Number of bytes of the buffer, that were searched
+        @type size: C{int}
+
+        """
+
+    def bufferGrew(self, session, size):
+        r"""The buffer of the session has grown larger, than it has ever been.
+
+        @param size: Number of bytes in the buffer
+        @type size: C{int}
+
+        """
+
+    def connectionLost(self, session, reason):
+        r"""The connection is lost.
+
+        @param reason: The reason, as it was passed to
+        L{connectionLost<texpect.mixin.ExpectMixin.connectionLost>}
+
+        """
+
+
+class Histogram(object):
+    r"""A histogram with exponentially growing buckets. Recording a value
+    takes a binary search in a short list, the percentiles are estimated
+    with the upper bounds of the buckets, so they are at most L{factor} times
+    the real ones.
+
+    @ivar bounds: Upper bounds of the buckets, the values, that are greater
+    than the last one, are counted in an extra bucket
+    @type bounds: C{list}
+    @ivar counts: Number of the values in each bucket
+    @type counts: C{list}
+    @ivar count: Number of the values
+    @type count: C{int}
+    @ivar total: Sum of the values
+    @type total: C{float}
+    @ivar max: The largest value
+    @type max: C{float}
+
+    """
+
+    def __init__(self, smallest=0.0001, factor=2, buckets=24):
+        r"""
+        @param smallest: Upper bound of the first bucket. Default: 0.0001
+        (100 microseconds)
+        @type smallest: C{float}
+        @param factor: Ratio of the upper bounds of the adjacent buckets.
+        Default: 2
+        @type factor: C{float}
+        @param buckets: Number of the buckets. Default: 24, which goes up to
+        about 14 minutes with the other defaults.
+        @type buckets: C{int}
+
+        """
+        self.factor = factor
+        self.bounds = [smallest * factor ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def add(self, value):
+        r"""Record a value."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        r"""Estimate a percentile.
+
+        @param fraction: Which percentile, for example, 0.99
+        @type fraction: C{float}
+        @return: The upper bound of the bucket, that the percentile falls into
+        (or the largest value, if that is less), C{None}, if there are no values
+        @rtype: C{float} or C{NoneType}
+
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        r"""
+        @return: Number of the values, their mean, median, 90th and 99th
+        percentiles and the largest value
+        @rtype: C{dict}
+
+        """
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(0.5),
+                'p90': self.percentile(0.9),
+                'p99': self.percentile(0.99),
+                'max': self.max}
+
+
+class Metrics(SessionObserver):
+    r"""An observer, that aggregates the events of all of the sessions, it
+    observes.
+
+    @ivar started: Number of the requests, that were made, by kind
+    @type started: C{Counter}
+    @ivar finished: Number of the requests, that have completed or failed, by kind
+    @type finished: C{Counter}
+    @ivar errors: Number of the requests, that have failed, by the name of
+    the exception class
+    @type errors: C{Counter}
+    @ivar durations: Histograms of the durations of the requests, by kind
+    @type durations: C{dict}
+    @ivar bytes_received: Number of bytes, that were received
+    @type bytes_received: C{int}
+    @ivar bytes_scanned: Number of bytes, that were searched for the patterns
+    @type bytes_scanned: C{int}
+    @ivar match_attempts: Number of the searches for the patterns
+    @type match_attempts: C{int}
+    @ivar peak_buffer: The largest size of a session's buffer
+    @type peak_buffer: C{int}
+    @ivar connections_lost: Number of the sessions, whose connections were lost
+    @type connections_lost: C{int}
+
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        r"""Forget everything, that has been observed so far."""
+        self.started = Counter()
+        self.finished = Counter()
+        self.errors = Counter()
+        self.durations = {}
+        self.bytes_received = 0
+        self.bytes_scanned = 0
+        self.match_attempts = 0
+        self.peak_buffer = 0
+        self.connections_lost = 0
+
+    @property
+    def active(self):
+        r"""Number of the requests in progress."""
+        return sum(self.started.values()) - sum(self.finished.values())
+
+    def requestStarted(self, session, kind):
+        self.started[kind] += 1
+
+    def requestFinished(self, session, kind, duration, error):
+        self.finished[kind] += 1
+        if error is not None:
+            self.errors[error.__name__] += 1
+        histogram = self.durations.get(kind)
+        if histogram is None:
+            histogram = self.durations[kind] = Histogram()
+        histogram.add(duration)
+
+    def dataReceived(self, session, size):
+        self.bytes_received += size
+
+    def bytesScanned(self, session, size):
+        self.bytes_scanned += size
+        self.match_attempts += 1
+
+    def bufferGrew(self, session, size):
+        if size > self.peak_buffer:
+            self.peak_buffer = size
+
+    def connectionLost(self, session, reason):
+        self.connections_lost += 1
+
+    def snapshot(self):
+        r"""
+        @return: Everything, that has been observed so far, as plain data (for
+        logging or exporting)
+        @rtype: C{dict}
+
+        """
+        return {'started': dict(self.started),
+                'finished': dict(self.finished),
+                'active': self.active,
+                'errors': dict(self.errors),
+                'durations': dict((kind, histogram.summary())
+                                  for kind, histogram in self.durations.items()),
+                'bytes_received': self.bytes_received,
+                'bytes_scanned': self.bytes_scanned,
+                'match_attempts': self.match_attempts,
+                'peak_buffer': self.peak_buffer,
+                'connections_lost': self.connections_lost}
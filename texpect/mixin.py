@@ -2,26 +2,40 @@
 @author: shylent
 """
 from texpect.errors import (RequestInterruptedByConnectionLoss, RequestTimeout,
-    OutOfSequenceError, EOFReached, ConnectionAlreadyClosed)
-from twisted.internet.defer import fail, Deferred, maybeDeferred
+    OutOfSequenceError, EOFReached, ConnectionAlreadyClosed, RequestCancelled,
+    DialogFailed, BufferLimitExceeded)
+from texpect import dialog, matching
+from texpect.buffer import ReceiveBuffer
+from texpect.filters import Pipeline
+from texpect.transcript import MemoryTranscript
+from twisted.internet.defer import fail, succeed, Deferred, maybeDeferred
 from twisted.python import log
 from twisted.python.failure import Failure
-import re
+from collections import deque
+import codecs
 
 
 class Promise(Deferred):
     r"""Base class for Deferred extensions, that are used in this module
     A request in progress.
 
+    @ivar kind: The name of the request, that is reported to the
+    L{observer<ExpectMixin.observer>}
+    @type kind: C{str}
+
     """
 
+    kind = None
+    _timeout = None
+
     def __init__(self, timeout=None):
         r"""
         @param timeout: Timeout object.
         @type timeout: Any object, providing L{IDelayedCall<twisted.internet.interfaces.IDelayedCall>}
 
         """
-        self._timeout = timeout
+        if timeout is not None:
+            self._timeout = timeout
         Deferred.__init__(self)
 
     def callback(self, *args, **kwargs):
@@ -38,10 +52,55 @@ class Promise(Deferred):
         return self.__class__.__name__
 
 class ReadAll(Promise):
-    pass
+
+    kind = 'read_all'
+
+class ReadStream(ReadAll):
+    r"""A request to read all data until the connection is lost, that passes
+    the data to a consumer as it arrives, instead of collecting it.
+
+    @ivar consumer: Where the data goes
+    @ivar received: Number of bytes, that were passed to the consumer so far
+    @type received: C{int}
+    @ivar producer: The producer, that was registered with the consumer, if any
+    @type producer: L{IPushProducer<twisted.internet.interfaces.IPushProducer>}
+
+    """
+
+    def __init__(self, consumer, timeout=None):
+        r"""
+        @param consumer: A callable or an object with a C{write} method (such as
+        a file or a L{IConsumer<twisted.internet.interfaces.IConsumer>}), that
+        will be called with each chunk of the data.
+
+        """
+        Promise.__init__(self, timeout)
+        self.consumer = consumer
+        self.received = 0
+        self.producer = None
+        self._write = getattr(consumer, 'write', consumer)
+
+    def feed(self, data):
+        r"""Pass the data to the consumer."""
+        self.received += len(data)
+        self._write(data)
+
+    def callback(self, *args, **kwargs):
+        self._unregister()
+        return ReadAll.callback(self, *args, **kwargs)
+
+    def errback(self, *args, **kwargs):
+        self._unregister()
+        return ReadAll.errback(self, *args, **kwargs)
+
+    def _unregister(self):
+        if self.producer is not None:
+            self.producer = None
+            self.consumer.unregisterProducer()
 
 class ReadLazy(Promise):
-    pass
+
+    kind = 'read_lazy'
 
 
 class Expect(Promise):
@@ -49,30 +108,68 @@ class Expect(Promise):
 
     @ivar expecting: A list of patterns, that we are 'expecting' (sorry).
     @type expecting: C{list}
+    @ivar matcher: The patterns, prepared for searching
+    @type matcher: L{PatternSet<texpect.matching.PatternSet>}
     @ivar as_tuple: Whether the callback should be called with a tuple or not. Tuple
     items are: the index in the list of patterns of the pattern, that matched,
     the match object, the data up to and including the match. If L{is_tuple} is C{False},
     the callback will only be called with the data up to and including the match.
     @type as_tuple: C{bool}
+    @ivar lookbacks: For each pattern, how far back from L{searched} the search
+    has to be restarted, when more data arrives, C{None} meaning 'from the
+    beginning of the buffer'.
+    @type lookbacks: C{list}
+    @ivar searched: Length of the buffer, that has already been searched
+    without finding a match.
+    @type searched: C{int}
+    @ivar scan: State of the search for the patterns, that match fixed strings
+    @type scan: L{ScanState<texpect.matching.ScanState>}
+    @ivar truncated: Whether the data at the beginning of the buffer has been
+    dropped, while the request was waiting (see L{keep_data})
+    @type truncated: C{bool}
+    @ivar keep_data: Whether the data up to and including the match is
+    returned. If it is not, the data is dropped, as soon as it has been
+    searched, and the last item of the result is C{None}.
+    @type keep_data: C{bool}
 
     """
 
-    def __init__(self, expect, timeout=None, as_tuple=True):
+    kind = 'expect'
+    as_tuple = True
+    keep_data = True
+    searched = 0
+    truncated = False
+
+    def __init__(self, expect, timeout=None, as_tuple=True, keep_data=True):
         r"""
         @param expect: List of patterns, that will be matched against the buffer
+        @type expect: C{list} or L{PatternSet<texpect.matching.PatternSet>}
         @param timeout: Timeout in seconds for this request.
         @type timeout:C{int}
         @param as_tuple: If set to False, first two items of the result are dropped
         and only the gathered data is returned via the callback.
         @type as_tuple: C{bool}
+        @param keep_data: See L{keep_data}. Default: C{True}
+        @type keep_data: C{bool}
 
         """
         Promise.__init__(self, timeout)
-        self.expecting = expect
-        self.as_tuple = as_tuple
+        if not isinstance(expect, matching.PatternSet):
+            expect = matching.compile_patterns(expect)
+        self.matcher = expect
+        if as_tuple is not self.as_tuple:
+            self.as_tuple = as_tuple
+        if not keep_data:
+            self.keep_data = False
+        self.lookbacks = list(expect.lookbacks)
+        self.scan = expect.scan()
+
+    @property
+    def expecting(self):
+        return list(self.matcher.patterns)
 
     def callback(self, res, *args, **kwargs):
-        if not self.as_tuple and not isinstance(res, basestring):
+        if not self.as_tuple and isinstance(res, tuple):
             res = res[2]
         return Promise.callback(self, res, *args, **kwargs)
 
@@ -82,8 +179,65 @@ class Expect(Promise):
 
 class ReadUntil(Expect):
 
-    def __init__(self, expect, timeout=None, as_tuple=False):
-        Expect.__init__(self, expect, timeout, as_tuple)
+    kind = 'read_until'
+    as_tuple = False
+
+    def __init__(self, expect, timeout=None, as_tuple=False, keep_data=True):
+        Expect.__init__(self, expect, timeout, as_tuple, keep_data)
+
+
+class ExpectPrompt(Expect):
+    r"""A request, whose patterns may only match at the end of the data
+    (see L{ExpectMixin.expect_prompt}).
+
+    @ivar matcher: The patterns, prepared for searching
+    @type matcher: L{TailPatternSet<texpect.matching.TailPatternSet>}
+
+    """
+
+    kind = 'expect_prompt'
+
+
+class RunDialog(Promise):
+    r"""A dialog in progress (see L{ExpectMixin.run}).
+
+    While the dialog is waiting for data, it has the same attributes, that
+    describe the search in progress, as L{Expect}.
+
+    @ivar dialog: The dialog
+    @type dialog: L{Dialog<texpect.dialog.Dialog>}
+    @ivar step_timeout: Timeout for the steps, that do not specify their own
+    @type step_timeout: C{int}
+    @ivar pc: Address of the current instruction of the dialog's program
+    @type pc: C{int}
+    @ivar results: The data, that was saved by the L{Expect<texpect.dialog.Expect>} steps
+    @type results: C{dict}
+    @ivar last: The data up to and including the last match
+    @type last: C{str}
+    @ivar matcher: Patterns of the current step, C{None}, if the dialog is
+    not waiting for data
+    @type matcher: L{PatternSet<texpect.matching.PatternSet>}
+
+    """
+
+    kind = 'run'
+    keep_data = True
+
+    def __init__(self, dialog, timeout=None):
+        Promise.__init__(self)
+        self.dialog = dialog
+        self.step_timeout = timeout
+        self.pc = 0
+        self.results = {}
+        self.last = None
+        self.matcher = None
+        self.lookbacks = None
+        self.searched = 0
+        self.scan = None
+        self.truncated = False
+
+    def __str__(self):
+        return "%s: step %d" % (self.__class__.__name__, self.pc)
 
 
 class ExpectMixin(object):
@@ -129,6 +283,16 @@ class ExpectMixin(object):
     This also applies to writing to the transport, which can be only done when
     no requests are in progress.
 
+    Alternatively, set L{queue_requests}, and the requests, that are made, while
+    another request is in progress, will be queued and carried out in order::
+
+        t = ExpectMixin()
+        t.queue_requests = True
+        t.write('show version\n')
+        d1 = t.read_until('#')
+        t.write('show interfaces\n')
+        d2 = t.read_until('#')
+
     @note: Some L{telnetlib.Telnet}'s functionality is currently missing, namely L{read_some},
     that is supposed to return I{at least one byte} of data. Session interaction, which is
     similar to Expect's U{interact<http://wiki.tcl.tk/3914>} command is also missing. It may be
@@ -136,23 +300,147 @@ class ExpectMixin(object):
 
     @ivar timeout: Default timeout value.
     @type timeout: C{int} 
+    @ivar lookback: How far back from the end of the already searched data
+    the search for a pattern, whose match width can not be determined (see
+    L{lookback<texpect.matching.lookback>}), is restarted, when more data
+    arrives. C{None} (the default) means, that such patterns are searched
+    from the beginning of the buffer every time. Setting this to a positive
+    value makes the cost of processing each chunk of data independent of the
+    size of the buffer, at the expense of missing the matches, that are
+    longer than C{lookback + 1}.
+    @type lookback: C{int} or C{NoneType}
+    @ivar search_window: How many bytes at the end of the buffer a request,
+    that is waiting for a pattern to match (L{expect}, L{read_until},
+    L{expect_prompt} and the steps of L{run}), keeps: the older data is
+    dropped after each chunk, so the matches have to start within the last
+    C{search_window} bytes and the data, that such a request returns, is no
+    longer, than that plus the chunk, in which the match was found. C{None} (the default) means, that all of the data is
+    kept, until the request completes.
+    @type search_window: C{int} or C{NoneType}
+    @ivar max_buffer: The largest the buffer may grow: once a chunk of data
+    has been searched, the oldest data is dropped to make room for the newer
+    one, whether there is a request in progress or not (the matches, that start in the dropped data,
+    are lost and L{read_all} without a consumer only returns the newest data).
+    The L{transcript} still gets all of the data, a
+    L{SpillTranscript<texpect.transcript.SpillTranscript>} keeps it on disk.
+    C{None} (the default) means, that the buffer is not limited.
+    @type max_buffer: C{int} or C{NoneType}
+    @ivar error_tail: How many bytes at the end of the data the errors
+    (L{RequestTimeout}, L{RequestInterruptedByConnectionLoss} and
+    L{ConnectionAlreadyClosed}) of the requests, that wait for a pattern,
+    carry, the rest of the data is dropped. C{None} (the default) means 'all
+    of the data'.
+    @type error_tail: C{int} or C{NoneType}
+    @ivar prompt_tail: How many bytes at the end of the buffer are searched
+    by L{expect_prompt}, it should be longer, than any of the prompts.
+    Default: 256
+    @type prompt_tail: C{int}
+    @ivar high_watermark: When the buffer grows larger, than this, and there
+    is no request in progress, the transport is paused (see
+    L{IPushProducer<twisted.internet.interfaces.IPushProducer>}), so that a
+    peer, that keeps sending data, that nobody reads, can not make the buffer
+    grow indefinitely. The transport is resumed, when a request, that needs
+    more data, is made or when the buffer shrinks to L{low_watermark}.
+    A request, that is waiting for a pattern to match, keeps the transport
+    reading (pausing it would only stall the request), if the buffer grows
+    larger, than this, while it is waiting, and neither L{search_window} nor
+    L{max_buffer} bounds the buffer, the request fails with
+    L{BufferLimitExceeded}. C{None} (the default) disables the flow control.
+    @type high_watermark: C{int} or C{NoneType}
+    @ivar low_watermark: See L{high_watermark}. C{None} (the default) means
+    half of L{high_watermark}.
+    @type low_watermark: C{int} or C{NoneType}
+    @ivar queue_requests: If set, the requests (L{expect}, L{read_until},
+    L{read_lazy}, L{read_all}, L{run} and L{write}), that are made, while another one is
+    in progress, do not fail with L{OutOfSequenceError}, they are queued
+    instead. When a request completes, the next one is carried out immediately,
+    so it is evaluated against the data, that remains in the buffer, without
+    waiting for more data to arrive. If a request fails, the requests, that
+    are queued after it, fail with L{RequestCancelled}. Default: C{False}
+    @type queue_requests: C{bool}
+    @ivar timer: Where the timeouts of the requests are scheduled. Set it
+    (on the class, so that it is shared by all of the sessions) to a
+    L{TimingWheel<texpect.timer.TimingWheel>} to avoid scheduling a reactor
+    call for every request, which matters with tens of thousands of sessions,
+    at the expense of the timeouts only being as precise as the resolution of
+    the wheel. C{None} (the default) means, that the timeouts are scheduled
+    with the reactor.
+    @type timer: L{TimingWheel<texpect.timer.TimingWheel>} or C{NoneType}
+    @ivar observer: Where the events of the session (the requests, the data,
+    the connection loss) are reported. Set it on the class to observe all of
+    the sessions at once, for example, with L{Metrics<texpect.metrics.Metrics>}.
+    Default: C{None}
+    @type observer: L{SessionObserver<texpect.metrics.SessionObserver>} or C{NoneType}
+    @ivar zero_copy: If set, the data, that the requests return, is a
+    C{memoryview} of the storage of the buffer, rather than a copy (see
+    L{ReceiveBuffer.detach<texpect.buffer.ReceiveBuffer.detach>}), which saves
+    copying the data of the sessions, that receive a lot of it. Default: C{False}
+    @type zero_copy: C{bool}
+    @ivar encoding: If set, the data, that the requests return, is decoded
+    with an incremental decoder, so that a character, that is split between
+    two results, is returned with the latter one. The patterns are still
+    matched against the received bytes. C{None} (the default) means, that the
+    data is returned as it was received.
+    @type encoding: C{str} or C{NoneType}
+    @ivar decode_errors: How the decoding errors are handled (see
+    L{codecs.register_error}). Default: C{'replace'}
+    @type decode_errors: C{str}
+    @ivar filters: The classes (or other callables, that take no arguments)
+    of the filters, that the received data goes through, before it reaches
+    the buffer (see L{texpect.filters}), for example,
+    C{(StripANSI, NormalizeNewlines)}. A filter is created for each session.
+    The transcript and the observer get the data, as it was received.
+    Default: none
+    @type filters: C{tuple}
+    @ivar pipeline: The filters of the session, C{None}, if there are none
+    @type pipeline: L{Pipeline<texpect.filters.Pipeline>} or C{NoneType}
     @ivar debug: Debug flag
     @type debug: C{bool}
-    @ivar _buf: Internal buffer, which is flushed each time a request is completed.
+    @ivar _buffer: Internal buffer, which is flushed each time a request is completed.
+    @type _buffer: L{ReceiveBuffer}
+    @ivar _buf: Contents of L{_buffer} as a string. Assigning to it replaces
+    the contents of L{_buffer}.
     @type _buf: C{str}
-    @ivar _debug_buf: Buffer, that holds all the received data
+    @ivar transcript: Record of the received data
+    @type transcript: L{Transcript<texpect.transcript.Transcript>} or C{NoneType}
+    @ivar _debug_buf: All of the data, that is kept by L{transcript}, if it is
+    able to return it (see L{MemoryTranscript<texpect.transcript.MemoryTranscript>}
+    and L{RingTranscript<texpect.transcript.RingTranscript>})
     @type _debug_buf: C{str}
     @ivar promise: Current pending request
     @type promise: L{Promise} or C{None}
 
     """
 
-    def __init__(self, debug=False, timeout=None, _reactor=None, *args, **kwargs):
+    lookback = None
+    search_window = None
+    max_buffer = None
+    error_tail = None
+    prompt_tail = 256
+    high_watermark = None
+    low_watermark = None
+    queue_requests = False
+    timer = None
+    observer = None
+    zero_copy = False
+    encoding = None
+    decode_errors = 'replace'
+    filters = ()
+
+    def __init__(self, debug=False, timeout=None, _reactor=None, transcript=None,
+                 *args, **kwargs):
         r"""
         @param debug: Enable debug mode, - there will be more log messages
-        and the entire buffer will be kept in the _debug_buf attribute indefinitely.
+        and, unless a transcript is provided, the entire buffer will be kept
+        in the _debug_buf attribute indefinitely.
         @param timeout: Set a default timeout in seconds for all requests, wherever applicable.
         @type timeout:C{int}
+        @param transcript: Where to record the received data, regardless of
+        the debug mode. Use L{RingTranscript<texpect.transcript.RingTranscript>}
+        or L{SpillTranscript<texpect.transcript.SpillTranscript>} to keep
+        a record of a long-lived session in a fixed amount of memory.
+        Default: C{None}
+        @type transcript: L{Transcript<texpect.transcript.Transcript>}
 
         """
         if _reactor is not None:
@@ -162,9 +450,37 @@ class ExpectMixin(object):
             self._reactor = reactor
         self.timeout = timeout
         self.debug = debug
-        self._buf = self._debug_buf = ''
+        self._buffer = ReceiveBuffer()
+        if transcript is None and debug:
+            transcript = MemoryTranscript()
+        self.transcript = transcript
         self.promise = None
         self.eof = False
+        self._paused = False
+        self._queue = deque()
+        self._dispatching = False
+        self._lost_observers = []
+        self._peak_buffer = 0
+        self._decoder = None
+        self.pipeline = None
+        if self.filters:
+            self.pipeline = Pipeline([factory() for factory in self.filters])
+
+    def _get_buf(self):
+        return self._buffer.peek()
+
+    def _set_buf(self, data):
+        self._buffer = ReceiveBuffer(data)
+
+    _buf = property(_get_buf, _set_buf)
+
+    def _get_debug_buf(self):
+        getvalue = getattr(self.transcript, 'getvalue', None)
+        if getvalue is None:
+            return ''
+        return getvalue()
+
+    _debug_buf = property(_get_debug_buf)
 
     def connectionLost(self, reason=None):
         r"""Connection loss is handled here. When using the mixin, one should
@@ -181,33 +497,281 @@ class ExpectMixin(object):
         else:
             reason = getattr(reason, 'value', reason)
             log.msg("Connection lost, reason: %s" % reason)
+        if self.pipeline is not None:
+            data = self.pipeline.flush()
+            if data:
+                self._receive(data)
         self.eof = True
-        buf = self._buf
-        self._buf = ''
+        self._notify('connectionLost', reason)
+        if self.transcript is not None:
+            self.transcript.close()
         promise = self.promise
+        if isinstance(promise, ReadStream):
+            buf = self._take(final=True)
+        elif isinstance(promise, (Expect, RunDialog)):
+            buf = self._take_tail(final=True)
+        else:
+            buf = self._take(final=True)
         self.promise = None
-        if isinstance(promise, ReadAll):
+        if isinstance(promise, ReadStream):
+            if not buf or self._stream(promise, buf):
+                promise.callback(promise.received)
+        elif isinstance(promise, ReadAll):
             promise.callback(buf)
-        elif isinstance(promise, Expect):
+        elif isinstance(promise, (Expect, RunDialog)):
             promise.errback(Failure(RequestInterruptedByConnectionLoss(data=buf, promise=promise)))
+        self._next_request()
+        observers, self._lost_observers = self._lost_observers, []
+        for observer in observers:
+            observer.callback(None)
+
+    def notifyConnectionLost(self):
+        r"""Get notified, when the connection is lost.
+
+        @return: A L{Deferred}, that fires with C{None}, after
+        L{connectionLost} has been called (immediately, if it already has).
+        @rtype: L{Deferred}
+
+        """
+        if self.eof:
+            return succeed(None)
+        d = Deferred()
+        self._lost_observers.append(d)
+        return d
 
     def expectDataReceived(self, data):
         r"""Process incoming data, see if a match has occured."""
 
         if self.debug:
             log.msg('Received data: %r' % data)
-        self._buf += data
-        if self.debug:
-            self._debug_buf += data
+        if self.transcript is not None:
+            self.transcript.write(data)
+        self._notify('dataReceived', len(data))
+        if self.pipeline is not None:
+            data = self.pipeline.feed(data)
+            if not data:
+                return
+        self._receive(data)
+
+    def _receive(self, data):
+        r"""Put the data, that has gone through the filters, into the buffer
+        (or pass it on to the stream in progress).
+
+        This method is considered private and should not be called directly.
+
+        """
+        observer = self.observer
+        if isinstance(self.promise, ReadStream):
+            try:
+                data = self._convert(data)
+                if data:
+                    self._stream(self.promise, data)
+            finally:
+                self._update_flow()
+            return
+        self._buffer.append(data)
+        if observer is not None and len(self._buffer) > self._peak_buffer:
+            self._peak_buffer = len(self._buffer)
+            self._notify('bufferGrew', self._peak_buffer)
         if isinstance(self.promise, Expect):
-            res = self._process_buffer(self.promise.expecting)
-            if res:
-                self._buf = self._buf[res[1].end():]
-                promise = self.promise
+            self._process_request(self.promise)
+        elif isinstance(self.promise, RunDialog):
+            self._advance_dialog(self.promise)
+        self._next_request()
+        if self.max_buffer is not None and len(self._buffer) > self.max_buffer:
+            self._overflow()
+        self._update_flow()
+
+    def _update_flow(self):
+        r"""Pause the transport, if the buffer has grown past the high watermark
+        and there is no request to consume the data, resume it, once the data
+        has been consumed or there is a request, that is waiting for more data.
+        Fail the request, that is waiting for a pattern to match, if the buffer
+        has grown past the high watermark and nothing else bounds it.
+
+        This method is considered private and should not be called directly.
+
+        """
+        if self.high_watermark is None:
+            return
+        promise = self.promise
+        if (isinstance(promise, (Expect, RunDialog))
+                and len(self._buffer) > self.high_watermark
+                and self.search_window is None and self.max_buffer is None):
+            self._buffer_limit_exceeded(promise)
+            return
+        if self._paused:
+            low = self.low_watermark
+            if low is None:
+                low = self.high_watermark // 2
+            if promise is not None or len(self._buffer) <= low:
+                self._paused = False
+                self._resume_reading()
+        elif promise is None and len(self._buffer) > self.high_watermark:
+            if self.debug:
+                log.msg('Buffer is over the high watermark, pausing the transport')
+            self._paused = True
+            self._pause_reading()
+
+    def _buffer_limit_exceeded(self, promise):
+        r"""Fail a request, that is waiting for a pattern to match, because the
+        buffer has grown past the L{high_watermark} (see L{_update_flow}).
+
+        This method is considered private and should not be called directly.
+
+        @param promise: The pending request
+        @type promise: L{Expect} or L{RunDialog}
+
+        """
+        if self.debug:
+            log.msg('Buffer is over the high watermark, terminating promise %s' % promise)
+        self.promise = None
+        promise.errback(Failure(BufferLimitExceeded(data=self._take_tail(), promise=promise)))
+        self._next_request()
+        self._update_flow()
+
+    def _pause_reading(self):
+        r"""Stop reading the data, that goes to the buffer (see L{_update_flow}).
+
+        This method is considered private and should not be called directly.
+
+        """
+        self.transport.pauseProducing()
+
+    def _resume_reading(self):
+        self.transport.resumeProducing()
+
+    def _stream(self, promise, data):
+        r"""Pass the data to the consumer of a L{ReadStream} request. If the
+        consumer fails, the request fails.
+
+        This method is considered private and should not be called directly.
+
+        @return: Whether the data was successfully consumed
+        @rtype: C{bool}
+
+        """
+        try:
+            promise.feed(data)
+        except Exception:
+            if self.promise is promise:
+                self.promise = None
+            promise.errback(Failure())
+            return False
+        return True
+
+    def _process_request(self, promise):
+        r"""Search the part of the buffer, that the pending L{Expect} request
+        has not yet seen, and complete the request, if a pattern matches.
+
+        This method is considered private and should not be called directly.
+
+        @param promise: The pending request
+        @type promise: L{Expect}
+        @return: The result of the match, if any
+        @rtype: C{(int, SRE_Match, str)} or C{None}
+
+        """
+        res = self._search(promise)
+        if res:
+            self.promise = None
+            promise.callback(res)
+        return res
+
+    def _search(self, promise):
+        r"""Search the part of the buffer, that a request has not yet seen,
+        and consume the data up to and including the match, if a pattern
+        matches.
+
+        This method is considered private and should not be called directly.
+
+        @param promise: The pending request
+        @type promise: L{Expect} or L{RunDialog}
+        @return: The result of the match, if any
+        @rtype: C{(int, SRE_Match, str)} or C{None}
+
+        """
+        view = self._buffer.view()
+        if self.observer is not None:
+            self._notify('bytesScanned', len(view) - matching.resume_start(promise, len(view)))
+        found = matching.resume(view, promise)
+        if found:
+            index, match = found
+            if not promise.keep_data:
+                self._drop(match.end())
+                return self._matched(index, match, None)
+            return self._matched(index, match, self._take(match.end()))
+        self._trim(promise, len(view))
+
+    def _advance_dialog(self, promise):
+        r"""Carry out the steps of a dialog, until it has to wait for more data
+        or is complete.
+
+        This method is considered private and should not be called directly.
+
+        @param promise: The pending request
+        @type promise: L{RunDialog}
+
+        """
+        program = promise.dialog.program
+        while self.promise is promise:
+            instruction = program[promise.pc]
+            op = instruction[0]
+            if op == dialog.EXPECT:
+                if promise.matcher is None:
+                    self._enter_step(promise, instruction)
+                res = self._search(promise)
+                if not res:
+                    if self.eof:
+                        self.promise = None
+                        promise.errback(Failure(ConnectionAlreadyClosed(
+                            data=self._take_tail(final=True), promise=promise)))
+                    return
+                promise.matcher = None
+                promise.last = res[2]
+                if instruction[4] is not None:
+                    promise.results[instruction[4]] = res[2]
+                target = instruction[3][res[0]]
+                promise.pc = promise.pc + 1 if target is None else target
+            elif op == dialog.SEND:
+                self._send(instruction[1])
+                promise.pc += 1
+            elif op == dialog.GOTO:
+                promise.pc = instruction[1]
+            elif op == dialog.FAIL:
+                self.promise = None
+                promise.errback(Failure(DialogFailed(instruction[1], data=promise.last,
+                                                     promise=promise)))
+            else:
                 self.promise = None
-                promise.callback(res)
+                promise.callback(promise.results)
 
-    def _process_buffer(self, pattern_list):
+    def _enter_step(self, promise, instruction):
+        r"""Prepare to search for the patterns of an C{EXPECT} instruction
+        of a dialog.
+
+        This method is considered private and should not be called directly.
+
+        """
+        matcher = instruction[1]
+        promise.matcher = matcher
+        promise.lookbacks = [self.lookback if lb is None else lb
+                             for lb in matcher.lookbacks]
+        promise.searched = 0
+        promise.scan = matcher.scan()
+        promise.truncated = False
+        if promise._timeout is not None and promise._timeout.active():
+            promise._timeout.cancel()
+        promise._timeout = None
+        timeout = instruction[2]
+        if timeout is None:
+            timeout = promise.step_timeout
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            promise._timeout = self._call_later(timeout, self._handle_timeout)
+
+    def _process_buffer(self, pattern_list, offsets=None, scan=None):
         r"""Process the buffer, trying the patterns provided. In case of the match,
         the result is returned as a 3-tuple, where the items are: the index
         in the list of patterns of the pattern, that matched, the match object,
@@ -216,17 +780,152 @@ class ExpectMixin(object):
         This method is considered private and should not be called directly.
 
         @param pattern_list: A list of regex objects to check the buffer against
+        @type pattern_list: C{list} or L{PatternSet<texpect.matching.PatternSet>}
+        @param offsets: For each pattern, the position in the buffer, where the
+        search should start. Default: C{None}, meaning 'search the whole buffer'.
+        @type offsets: C{list} of C{int}
+        @param scan: State of the incremental search for the fixed strings.
+        Default: C{None}, meaning 'search the whole buffer'.
+        @type scan: L{ScanState<texpect.matching.ScanState>}
         @rtype: C{(int, SRE_Match, str)} or C{None}
 
         """
-        for pattern_index, pattern in enumerate(pattern_list):
-            s = pattern.search(self._buf)
-            if s:
-                result = self._buf[:s.end()]
-                if self.debug:
-                    log.msg('Pattern %s matched - returning (%r, %r, %r)' %
-                            (pattern.pattern, pattern_index, s, result))
-                return (pattern_index, s, result)
+        if not isinstance(pattern_list, matching.PatternSet):
+            pattern_list = matching.compile_patterns(pattern_list)
+        found = pattern_list.search(self._buffer.view(), offsets, scan)
+        if found:
+            return self._result(*found)
+
+    def _result(self, pattern_index, s):
+        r"""Make the result of a match: the index of the pattern, that matched,
+        the match object and the data up to and including the match, without
+        consuming the data.
+
+        This method is considered private and should not be called directly.
+
+        """
+        return self._matched(pattern_index, s, self._buffer.peek(s.end()))
+
+    def _matched(self, pattern_index, s, result):
+        if self.debug:
+            log.msg('Pattern %s matched - returning (%r, %r, %r)' %
+                    (s.re.pattern, pattern_index, s, result))
+        return (pattern_index, s, result)
+
+    def _take(self, size=None, final=False):
+        r"""Consume the data, that is returned to the caller of a request (see
+        L{zero_copy} and L{encoding}).
+
+        This method is considered private and should not be called directly.
+
+        @param size: Number of bytes. Default: C{None}, meaning 'all of them'
+        @type size: C{int}
+        @param final: Whether this is the last of the data, so that the bytes,
+        that the decoder holds on to, are decoded as well. Default: C{False}
+        @type final: C{bool}
+
+        """
+        if self.encoding is not None:
+            return self._convert(self._buffer.consume(size), final)
+        if self.zero_copy:
+            return self._buffer.detach(size)
+        return self._buffer.consume(size)
+
+    def _convert(self, data, final=False):
+        r"""Turn the received data, that does not go through the buffer (see
+        L{read_all}), into what the requests return (see L{zero_copy} and
+        L{encoding}).
+
+        This method is considered private and should not be called directly.
+
+        @param final: See L{_take}
+        @type final: C{bool}
+
+        """
+        if self.encoding is not None:
+            decoder = self._decoder
+            if decoder is None:
+                decoder = self._decoder = codecs.getincrementaldecoder(self.encoding)(
+                    self.decode_errors)
+            return decoder.decode(data, final)
+        if self.zero_copy:
+            return memoryview(data)
+        return data
+
+    def _trim(self, promise, length):
+        r"""Drop the data at the beginning of the buffer, that a request, that
+        is waiting for a pattern to match, does not need (see L{expect}'s
+        C{keep_data}) or may not keep (see L{search_window}).
+
+        This method is considered private and should not be called directly.
+
+        @param promise: The pending request
+        @type promise: L{Expect} or L{RunDialog}
+        @param length: Length of the buffer, that has been searched
+        @type length: C{int}
+
+        """
+        size = 0
+        if not promise.keep_data:
+            size = matching.release(promise, length)
+            length -= size
+        window = self.search_window
+        if window is not None and length > window:
+            matching.truncate(promise, length - window)
+            size += length - window
+        self._drop(size)
+
+    def _overflow(self):
+        r"""Drop the oldest data, so that the buffer is no larger, than
+        L{max_buffer}.
+
+        This method is considered private and should not be called directly.
+
+        """
+        size = len(self._buffer) - self.max_buffer
+        if self.debug:
+            log.msg('The buffer is full, dropping %d bytes' % size)
+        promise = self.promise
+        if isinstance(promise, (Expect, RunDialog)) and promise.matcher is not None:
+            matching.truncate(promise, size)
+        self._drop(size)
+
+    def _take_tail(self, final=False):
+        r"""Consume all of the data for the error of a request, that was
+        waiting for a pattern to match, only the last L{error_tail} bytes of
+        it are returned.
+
+        This method is considered private and should not be called directly.
+
+        @param final: See L{_take}
+        @type final: C{bool}
+
+        """
+        tail = self.error_tail
+        if tail is not None and len(self._buffer) > tail:
+            self._drop(len(self._buffer) - tail)
+        return self._take(final=final)
+
+    def _drop(self, size):
+        r"""Consume the data, that nobody is going to see (see L{expect}'s
+        C{keep_data}), without copying it.
+
+        This method is considered private and should not be called directly.
+
+        @param size: Number of bytes
+        @type size: C{int}
+
+        """
+        if size:
+            self._buffer.discard(size)
+            if self._decoder is not None:
+                self._decoder.reset()
+
+    def _call_later(self, delay, func):
+        r"""Schedule a timeout with L{timer} or with the reactor."""
+        if self.timer is not None:
+            return self.timer.callLater(delay, func)
+        return self._reactor.callLater(delay, func)
 
     def _handle_timeout(self):
         r"""Handle the timeout according to request type. This method is considered
@@ -237,10 +936,113 @@ class ExpectMixin(object):
             log.msg('Timeout reached, terminating promise %s' % self.promise)
         promise = self.promise
         self.promise = None
-        buf = self._buf
-        self._buf = ''
-        if isinstance(promise, Expect):
+        buf = self._take_tail()
+        if isinstance(promise, (Expect, RunDialog)):
             promise.errback(Failure(RequestTimeout(data=buf, promise=promise)))
+        self._next_request()
+        self._update_flow()
+
+    def _request(self, kind, method, *args):
+        r"""Carry out a request or queue it (see L{queue_requests}) and report
+        it to the L{observer}.
+
+        This method is considered private and should not be called directly.
+
+        @param kind: The name of the request
+        @type kind: C{str}
+        @param method: The method, that carries out the request
+        @return: A L{Deferred}, that will be fired with the result of the request
+        @rtype: L{Deferred}
+
+        """
+        observer = self.observer
+        if observer is None:
+            if self.queue_requests:
+                return self._enqueue(method, *args)
+            return method(*args)
+        started = self._reactor.seconds()
+        self._notify('requestStarted', kind)
+        if self.queue_requests:
+            d = self._enqueue(method, *args)
+        else:
+            d = method(*args)
+        d.addBoth(self._request_finished, observer, kind, started)
+        return d
+
+    def _request_finished(self, result, observer, kind, started):
+        error = None
+        if isinstance(result, Failure):
+            error = result.type
+        self._notify('requestFinished', kind, self._reactor.seconds() - started, error,
+                     observer=observer)
+        return result
+
+    def _notify(self, event, *args, **kwargs):
+        r"""Report an event to the L{observer}, if there is one. A broken observer
+        must not break the session, so the errors, that it raises, are logged
+        and otherwise ignored.
+
+        This method is considered private and should not be called directly.
+
+        @param event: The name of the method to call, see
+            L{SessionObserver<texpect.metrics.SessionObserver>}
+        @type event: C{str}
+        @keyword observer: The observer to report to (defaults to L{observer})
+
+        """
+        observer = kwargs.get('observer', self.observer)
+        if observer is None:
+            return
+        try:
+            getattr(observer, event)(self, *args)
+        except:
+            log.err(None, 'Error in the observer %r' % (observer,))
+
+    def _enqueue(self, method, *args):
+        r"""Queue a request (see L{queue_requests}).
+
+        This method is considered private and should not be called directly.
+
+        @param method: The method, that carries out the request
+        @return: A L{Deferred}, that will be fired with the result of the request
+        @rtype: L{Deferred}
+
+        """
+        d = Deferred()
+        self._queue.append((method, args, d))
+        self._next_request()
+        return d
+
+    def _next_request(self):
+        r"""Carry out the queued requests, until one of them has to wait.
+
+        This method is considered private and should not be called directly.
+
+        """
+        if self._dispatching:
+            # The requests, that complete immediately (and the requests, that are
+            # queued by their callbacks) are taken care of by the loop below
+            return
+        self._dispatching = True
+        try:
+            while self.promise is None and self._queue:
+                method, args, d = self._queue.popleft()
+                result = maybeDeferred(method, *args)
+                result.addErrback(self._cancel_queue)
+                result.chainDeferred(d)
+        finally:
+            self._dispatching = False
+
+    def _cancel_queue(self, failure):
+        r"""Fail all of the queued requests, because a request has failed.
+
+        This method is considered private and should not be called directly.
+
+        """
+        queue, self._queue = self._queue, deque()
+        for method, args, d in queue:
+            d.errback(Failure(RequestCancelled()))
+        return failure
 
     def read_lazy(self, _promise_class=ReadLazy):
         r"""A request to return all data, that is currently in the buffer.
@@ -260,46 +1062,85 @@ class ExpectMixin(object):
         @rtype: L{ReadLazy}
 
         """
+        return self._request(_promise_class.kind, self._read_lazy, _promise_class)
+
+    def _read_lazy(self, _promise_class=ReadLazy):
         promise = _promise_class()
         if self.promise is not None:
             promise.errback(Failure(OutOfSequenceError('Unable to process request, '
                                 'there is another one pending: %s' % self.promise)))
             self.transport.loseConnection()
             return promise
-        if not self._buf and self.eof:
+        if not self._buffer and self.eof:
             promise.errback(Failure(EOFReached('The connection is closed and no data is available')))
             return promise
         else:
-            data = self._buf
-            self._buf = ''
+            data = self._take(final=self.eof)
             promise.callback(data)
+            self._update_flow()
             return promise
 
 
-    def read_all(self):
+    def read_all(self, consumer=None):
         r"""A request to read all data until the connection is lost.
 
+        If a consumer is provided, the data is not collected, but is passed to
+        the consumer as soon as it arrives instead, so the memory usage does
+        not depend on the amount of the data. If the consumer is an
+        L{IConsumer<twisted.internet.interfaces.IConsumer>} (has a
+        C{registerProducer} method), the transport is registered with it as a
+        streaming producer for the duration of the request, so the consumer
+        may pause the transport, if it can not keep up.
+
+        @param consumer: A callable or an object with a C{write} method (such as
+        a file or a L{IConsumer<twisted.internet.interfaces.IConsumer>}), that
+        will be called with each chunk of the data. Default: C{None}
+
         @return: A L{Deferred} (L{ReadAll}), that will be fired with the contents
         of the buffer, when the connection closes (possibly an empty string).
+        If a consumer was provided, a L{ReadStream} is returned, that will be
+        fired with the number of bytes, that were passed to the consumer.
         Errback argument types:
             - L{EOFReached}: if the connection is already closed by the time the
             request is made and there is no data available
             - L{OutOfSequenceError}: if there is another request in progress
+            - Any exception, raised by the consumer
         @rtype: L{ReadAll}
 
         """
+        return self._request(ReadAll.kind, self._read_all, consumer)
+
+    def _read_all(self, consumer=None):
         if self.promise is not None:
             failed = fail(OutOfSequenceError('Unable to process request, '
                                 'there is another one pending: %s' % self.promise))
             self.transport.loseConnection()
             return failed
+        if consumer is None:
+            if self.eof:
+                return self._read_lazy(_promise_class=ReadAll)
+            else:
+                self.promise = promise = ReadAll()
+                self._update_flow()
+                return promise
+        promise = ReadStream(consumer)
+        if not self._buffer and self.eof:
+            promise.errback(Failure(EOFReached('The connection is closed and no data is available')))
+            return promise
+        if self._buffer and not self._stream(promise, self._take(final=self.eof)):
+            self._update_flow()
+            return promise
         if self.eof:
-            return self.read_lazy(_promise_class=ReadAll)
-        else:
-            self.promise = ReadAll()
-            return self.promise
+            promise.callback(promise.received)
+            return promise
+        self.promise = promise
+        if hasattr(consumer, 'registerProducer'):
+            promise.producer = self.transport
+            consumer.registerProducer(self.transport, True)
+        self._update_flow()
+        return promise
 
-    def expect(self, pattern_list, timeout=None, _promise_class=Expect):
+    def expect(self, pattern_list, timeout=None, keep_data=True, _promise_class=Expect):
         r"""A request to read data until a pattern from a pattern list matches the buffer.
 
         The patterns are tested in the order, in which they are present in the list.
@@ -310,11 +1151,26 @@ class ExpectMixin(object):
         three items as an argument, the items are: the index in the list of patterns 
         of the pattern, that matched, the match object, the data up to and including the match.
 
+        The patterns, that contain no special characters (such as C{'Password:'}),
+        are searched for with an L{AhoCorasick<texpect.matching.AhoCorasick>}
+        automaton, which keeps its state between the chunks of incoming data,
+        instead of a regular expression search.
+
+        If the data is of no interest (a banner or the output of a command,
+        that is only waited for), set C{keep_data} to C{False}: the data up
+        to and including the match is not returned (the last item of the
+        result is C{None}) and the data, that has been searched, is dropped
+        right away, as far as the L{lookback<texpect.matching.lookback>}s of
+        the patterns allow (see L{lookback}), so that the buffer does not grow,
+        while the request is waiting for the match. The errors carry only the
+        data, that has not been dropped.
 
         @param pattern_list: A list of strings or compiled regular expression objects.
         @param timeout: A number of seconds to wait for the match. Overrides the instance
         default.
         @type timeout: C{int}
+        @param keep_data: Whether to return the data. Default: C{True}
+        @type keep_data: C{bool}
         @param _promise_class: A L{Promise} class, that will be used for this request. This
         argument is used internally and should not be used directly.
 
@@ -333,52 +1189,100 @@ class ExpectMixin(object):
         @rtype: L{Expect}
 
         """
+        return self._request(_promise_class.kind, self._expect, pattern_list, timeout,
+                             keep_data, _promise_class)
+
+    def _expect(self, pattern_list, timeout=None, keep_data=True, _promise_class=Expect):
         if self.promise is not None:
             failed = fail(OutOfSequenceError('Unable to process request, '
                                            'there is another one pending: %s' % self.promise))
             self.transport.loseConnection()
             return failed
-        #Be nice, if a string was passed (should've been a list), make a list out of it
-        if isinstance(pattern_list, basestring):
+        #Be nice, if a string or a regex was passed (should've been a list), make a list out of it
+        if isinstance(pattern_list, matching.string_types) or hasattr(pattern_list, 'pattern'):
             pattern_list = [pattern_list]
 
-        #Compile the patterns
-        expecting = []
-        for pattern in pattern_list:
-            if isinstance(pattern, basestring):
-                pattern = re.compile(pattern)
-            expecting.append(pattern)
-
-        self.promise = _promise_class(expecting)
-        promise = self.promise
+        #Compile the patterns (or find them in the cache)
+        if not isinstance(pattern_list, matching.PatternSet):
+            pattern_list = matching.compile_patterns(pattern_list)
+        promise = _promise_class(pattern_list, keep_data=keep_data)
         #Attempt to match right away
-        res = self._process_buffer(self.promise.expecting)
+        buf = self._buffer
+        if buf and self.observer is not None:
+            self._notify('bytesScanned', len(buf) - promise.matcher.start(length=len(buf)))
+        found = buf and promise.matcher.search(buf.view(), None, promise.scan)
+        if found:
+            # The request is complete before anyone has seen it, so it is fired
+            # directly, without going through the overridden callback methods
+            # and without ever becoming pending
+            if keep_data:
+                data = self._take(found[1].end())
+            else:
+                self._drop(found[1].end())
+                data = None
+            index, match, data = self._matched(found[0], found[1], data)
+            Deferred.callback(promise, (index, match, data) if promise.as_tuple else data)
+            if self.high_watermark is not None:
+                self._update_flow()
+            return promise
 
         if self.eof:
-            if not self._buf:
+            if not buf:
                 promise.errback(Failure(EOFReached('The connection is closed and no data is available')))
-                return promise
             else:
-                if not res:
-                    buf = self._buf
-                    self._buf = ''
-                    self.promise = None
-                    promise.errback(Failure(ConnectionAlreadyClosed(data=buf, promise=promise)))
-                    return promise
+                promise.errback(Failure(ConnectionAlreadyClosed(
+                    data=self._take_tail(final=True), promise=promise)))
+            return promise
 
-        if res:
-            self._buf = self._buf[res[1].end():]
-            self.promise = None
-            promise.callback(res)
-        else:
-            if timeout is None and self.timeout is not None:
-                timeout = self.timeout
-            if timeout is not None:
-                promise._timeout = self._reactor.callLater(timeout,
-                                                           self._handle_timeout)
+        self.promise = promise
+        if self.lookback is not None:
+            promise.lookbacks = [self.lookback if lb is None else lb
+                                 for lb in promise.lookbacks]
+        promise.searched = len(buf)
+        self._trim(promise, len(buf))
+        if timeout is None and self.timeout is not None:
+            timeout = self.timeout
+        if timeout is not None:
+            promise._timeout = self._call_later(timeout, self._handle_timeout)
+        self._update_flow()
         return promise
 
-    def read_until(self, expected, timeout=None):
+    def expect_prompt(self, pattern_list, timeout=None, tail=None, keep_data=True):
+        r"""A request to read data until a pattern from a pattern list matches
+        at the end of the buffer, like a prompt, after which the peer waits for
+        input. The data, that is followed by more data, is not matched, so
+        a prompt, that is echoed in the output of a command, is not mistaken
+        for the real one.
+
+        Only the last L{tail<prompt_tail>} bytes of the buffer are searched,
+        whenever a chunk of data arrives, so the cost of processing a chunk
+        does not depend on the size of the buffer, even with the patterns, that
+        L{expect} would have to search from the beginning of the buffer (see
+        L{lookback}). The match has to start within the tail.
+
+        The result and the errors are the same, as the ones of L{expect}.
+
+        @param pattern_list: A list of strings or compiled regular expression objects.
+        @param timeout: A number of seconds to wait for the match. Overrides the instance
+        default.
+        @type timeout: C{int}
+        @param tail: How many bytes at the end of the buffer are searched.
+        Default: L{prompt_tail}
+        @type tail: C{int}
+        @param keep_data: Whether to return the data (see L{expect}).
+        Default: C{True}
+        @type keep_data: C{bool}
+        @rtype: L{ExpectPrompt}
+
+        """
+        if isinstance(pattern_list, matching.string_types) or hasattr(pattern_list, 'pattern'):
+            pattern_list = [pattern_list]
+        if tail is None:
+            tail = self.prompt_tail
+        return self.expect(matching.compile_prompts(pattern_list, tail), timeout,
+                           keep_data, _promise_class=ExpectPrompt)
+
+    def read_until(self, expected, timeout=None, keep_data=True):
         r"""A request to read until a specified pattern matches. This method is
         provided to mimic telnetlib.Telnet's read_until method.
 
@@ -387,6 +1291,9 @@ class ExpectMixin(object):
         @param timeout: A number of seconds to wait for the match, C{None} to wait
         indefinitely. Overrides the instance default.
         @type timeout: C{int}
+        @param keep_data: Whether to return the data (see L{expect}).
+        Default: C{True}
+        @type keep_data: C{bool}
 
         @return: L{Expect} instance, that will be fired with a tuple of three items.
         The items are: the index in the list of patterns of the pattern, that matched, 
@@ -403,7 +1310,53 @@ class ExpectMixin(object):
         @rtype: L{Expect}
 
         """
-        return self.expect([expected], timeout, _promise_class=ReadUntil)
+        return self.expect([expected], timeout, keep_data, _promise_class=ReadUntil)
+
+    def run(self, dialog, timeout=None):
+        r"""A request to carry out a dialog.
+
+        The whole dialog is carried out as a single request, its steps are
+        executed directly, as the data arrives, without creating a L{Deferred}
+        for each of them.
+
+        @param dialog: The dialog
+        @type dialog: L{Dialog<texpect.dialog.Dialog>}
+        @param timeout: Timeout in seconds for the steps of the dialog, that
+        do not specify their own. Overrides the instance default.
+        @type timeout: C{int}
+
+        @return: L{RunDialog} instance, that will be fired with a dictionary of
+        the data, that was saved by the L{Expect<texpect.dialog.Expect>} steps,
+        when the dialog is complete.
+        Errback argument types:
+            - L{OutOfSequenceError}: when the request is issued and another request is in progress
+            - L{EOFReached}: if the connection is already closed by the time the
+            request is made and there is no data available
+            - L{ConnectionAlreadyClosed}: the connection is closed and the data
+            in the buffer is not sufficient to complete a step
+            - L{RequestInterruptedByConnectionLoss}: the connection is closed,
+            while a step is in progress
+            - L{RequestTimeout}: when a step has timed out
+            - L{DialogFailed}: when the dialog reaches a L{Fail<texpect.dialog.Fail>} step
+        @rtype: L{RunDialog}
+
+        """
+        return self._request(RunDialog.kind, self._run, dialog, timeout)
+
+    def _run(self, dialog, timeout=None):
+        if self.promise is not None:
+            failed = fail(OutOfSequenceError('Unable to process request, '
+                                           'there is another one pending: %s' % self.promise))
+            self.transport.loseConnection()
+            return failed
+        promise = RunDialog(dialog, timeout)
+        if not self._buffer and self.eof:
+            promise.errback(Failure(EOFReached('The connection is closed and no data is available')))
+            return promise
+        self.promise = promise
+        self._advance_dialog(promise)
+        self._update_flow()
+        return promise
 
     def write(self, bytes):
         r"""Write data to the transport.
@@ -416,12 +1369,39 @@ class ExpectMixin(object):
             - L{OutOfSequenceError}: when the request is issued and another request is in progress
         @rtype: L{Deferred}
 
+        """
+        return self._request('write', self._write, bytes)
+
+    def discard_buffer(self):
+        r"""Drop the data, that is in the buffer, without returning it to
+        anyone, for example, the data, that a session has received, while it was
+        idle. If the transport was paused (see L{high_watermark}), it is resumed.
+
+        @raise OutOfSequenceError: if a request is in progress
+
         """
+        if self.promise is not None:
+            raise OutOfSequenceError('Unable to discard the buffer, request is in progress: %r'
+                                     % self.promise)
+        self._drop(len(self._buffer))
+        self._update_flow()
+
+    def _write(self, bytes):
         if self.promise is not None:
             failure = fail(OutOfSequenceError('Unable to write, request is in progress: %r' % self.promise))
             self.transport.loseConnection()
             return failure
-        return maybeDeferred(self.transport.write, bytes)
+        return maybeDeferred(self._send, bytes)
+
+    def _send(self, bytes):
+        r"""Send the data of a L{write} request or of a L{Send<texpect.dialog.Send>}
+        step of a dialog to the transport. The protocols, that need to encode the
+        data on the way, override this.
+
+        This method is considered private and should not be called directly.
+
+        """
+        self.transport.write(bytes)
 
     def close(self):
         """Close the connection immediately.
@@ -0,0 +1,393 @@
+"""
+A pool of sessions, that are already logged in, so that the time, that it
+takes to connect to a device and to log into it, is only spent once and not
+for every command, that is run on the device::
+
+    def login(session, credentials):
+        username, password = credentials
+        d = session.read_until('Username:')
+        d.addCallback(lambda ign: session.write(username + '\\n'))
+        d.addCallback(lambda ign: session.read_until('Password:'))
+        d.addCallback(lambda ign: session.write(password + '\\n'))
+        d.addCallback(lambda ign: session.read_until('#'))
+        return d
+
+    def show_version(session):
+        session.write('show version\\n')
+        return session.read_until('#')
+
+    pool = SessionPool(login, probe=Dialog([Send('\\n'), Expect('#')]),
+                       max_size=2, idle_ttl=300)
+    d = pool.run(show_version, 'router1', credentials=('admin', 'secret'))
+
+@author: shylent
+"""
+from texpect.errors import PoolClosed
+from texpect.protocols import TelnetExpect
+from twisted.internet.defer import Deferred, DeferredList, fail, maybeDeferred
+from twisted.internet.protocol import ClientCreator
+from twisted.python import log
+from twisted.python.failure import Failure
+from collections import deque, OrderedDict
+
+
+class SessionPool(object):
+    r"""Keeps the sessions, that are logged in, and hands them out on request.
+
+    The sessions are keyed by the host, the port and the credentials, that
+    were used to log in. A session, that is released, is kept idle, until it
+    is acquired again (with the same key), until it is idle for longer than
+    L{idle_ttl} or until the connection is lost, whichever comes first. Before
+    an idle session is handed out, the data, that it has received, while it
+    was idle, is discarded and it is checked with L{probe}, and if the check
+    fails, the session is discarded and another one is used.
+
+    When there are L{max_size} sessions for a key, the subsequent requests
+    for a session with that key wait, until one of the sessions is released
+    (or evicted).
+
+    @ivar protocol: The class of the sessions, that are created by the pool
+    @type protocol: A subclass of L{ExpectMixin<texpect.mixin.ExpectMixin>}
+    @ivar login: A callable, that is called with a new session and the
+    credentials and returns a L{Deferred}, that fires, when the session is
+    logged in
+    @ivar probe: A dialog, that is carried out on an idle session, before
+    it is handed out. The session is considered to be broken, if it fails.
+    @type probe: L{Dialog<texpect.dialog.Dialog>} or C{NoneType}
+    @ivar probe_timeout: Timeout in seconds for the steps of L{probe}
+    @type probe_timeout: C{int}
+    @ivar max_size: Maximum number of sessions per key (including the ones,
+    that are being established). C{None} means no limit.
+    @type max_size: C{int} or C{NoneType}
+    @ivar max_total: Maximum number of sessions in the pool. When it is
+    reached, the idle session, that was released the earliest, is closed
+    to make room for a new one. C{None} means no limit.
+    @type max_total: C{int} or C{NoneType}
+    @ivar idle_ttl: Number of seconds, after which an idle session is closed.
+    C{None} means, that the idle sessions are kept indefinitely.
+    @type idle_ttl: C{int} or C{NoneType}
+    @ivar timeout: Default timeout for the requests of the sessions
+    @type timeout: C{int}
+    @ivar connect_timeout: Number of seconds to wait for a connection to be
+    established
+    @type connect_timeout: C{int}
+    @ivar size: Number of sessions in the pool (including the ones, that are
+    being established)
+    @type size: C{int}
+    @ivar closed: Whether the pool has been closed
+    @type closed: C{bool}
+
+    """
+
+    protocol = TelnetExpect
+
+    def __init__(self, login, probe=None, probe_timeout=None, max_size=None,
+                 max_total=None, idle_ttl=None, timeout=None, connect_timeout=30,
+                 _reactor=None):
+        r"""
+        @param login: A callable, that takes a new session and the credentials
+        and returns a L{Deferred}, that fires, when the session is logged in
+        @param probe: A dialog, that checks whether an idle session is alive.
+        Default: C{None}, meaning that the sessions are not checked.
+        @type probe: L{Dialog<texpect.dialog.Dialog>}
+        @param probe_timeout: Timeout in seconds for the steps of the probe.
+        Default: C{None}
+        @type probe_timeout: C{int}
+        @param max_size: Maximum number of sessions per key. Default: C{None}
+        @type max_size: C{int}
+        @param max_total: Maximum number of sessions. Default: C{None}
+        @type max_total: C{int}
+        @param idle_ttl: Number of seconds to keep an idle session. Default: C{None}
+        @type idle_ttl: C{int}
+        @param timeout: Default timeout for the requests of the sessions.
+        Default: C{None}
+        @type timeout: C{int}
+        @param connect_timeout: Connection timeout in seconds. Default: 30
+        @type connect_timeout: C{int}
+
+        """
+        if _reactor is None:
+            from twisted.internet import reactor as _reactor
+        self._reactor = _reactor
+        self.login = login
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.max_size = max_size
+        self.max_total = max_total
+        self.idle_ttl = idle_ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.size = 0
+        self.closed = False
+        self._keys = {}
+        self._counts = {}
+        self._idle = OrderedDict()
+        self._idle_by_key = {}
+        self._waiting = {}
+        self._dispatching = False
+        self._redispatch = False
+
+    @property
+    def idle(self):
+        r"""Number of idle sessions.
+
+        @rtype: C{int}
+
+        """
+        return len(self._idle)
+
+    def acquire(self, host, port=23, credentials=None):
+        r"""Get a session, that is logged in.
+
+        @param host: Host to connect to
+        @type host: C{str}
+        @param port: Port to connect to. Default: 23
+        @type port: C{int}
+        @param credentials: Passed to L{login}, must be hashable.
+        Default: C{None}
+
+        @return: A L{Deferred}, that fires with the session. The session must
+        be returned to the pool with L{release}, when it is no longer needed.
+        Errback argument types:
+            - L{PoolClosed}: when the pool is closed
+            - Whatever the connection attempt or L{login} fails with
+        @rtype: L{Deferred}
+
+        """
+        if self.closed:
+            return fail(PoolClosed('The pool is closed'))
+        key = (host, port, credentials)
+        d = Deferred()
+        self._waiting.setdefault(key, deque()).append(d)
+        self._dispatch()
+        return d
+
+    def release(self, session):
+        r"""Return a session to the pool.
+
+        The session is closed, if the connection has been lost, if there is
+        a request in progress or if the pool has been closed. Otherwise, the
+        data, that is left in its buffer, is discarded and it becomes idle.
+
+        @param session: A session, that was obtained with L{acquire}
+
+        """
+        key = self._keys.get(session)
+        if key is None:
+            return
+        if self.closed or session.eof or session.promise is not None:
+            self._evict(session)
+        else:
+            session.discard_buffer()
+            timer = None
+            if self.idle_ttl is not None:
+                timer = self._reactor.callLater(self.idle_ttl, self.discard, session)
+            self._idle[session] = timer
+            self._idle_by_key.setdefault(key, []).append(session)
+        self._dispatch()
+
+    def discard(self, session):
+        r"""Close a session, that was obtained with L{acquire}, instead of
+        returning it to the pool.
+
+        """
+        if self._evict(session) is not None:
+            self._dispatch()
+
+    def run(self, func, host, port=23, credentials=None):
+        r"""Acquire a session, call C{func} with it and release it.
+
+        If C{func} fails, the state of the session is unknown, so it is
+        discarded instead of being released.
+
+        @param func: A callable, that takes a session and returns a result
+        or a L{Deferred}
+        @param host: See L{acquire}
+        @param port: See L{acquire}
+        @param credentials: See L{acquire}
+
+        @return: A L{Deferred}, that fires with the result of C{func}
+        @rtype: L{Deferred}
+
+        """
+        def got_session(session):
+            d = maybeDeferred(func, session)
+            d.addCallbacks(done, failed, callbackArgs=(session,), errbackArgs=(session,))
+            return d
+        def done(result, session):
+            self.release(session)
+            return result
+        def failed(failure, session):
+            self.discard(session)
+            return failure
+        return self.acquire(host, port, credentials).addCallback(got_session)
+
+    def close(self):
+        r"""Close the pool.
+
+        The requests, that are waiting for a session, fail with L{PoolClosed},
+        the idle sessions are closed right away, the ones, that are in use, are
+        closed, when they are released.
+
+        @return: A L{Deferred}, that fires, when all of the sessions have been
+        closed.
+        @rtype: L{Deferred}
+
+        """
+        self.closed = True
+        waiting, self._waiting = self._waiting, {}
+        for requests in waiting.values():
+            for d in requests:
+                d.errback(Failure(PoolClosed('The pool has been closed')))
+        closing = DeferredList([session.notifyConnectionLost() for session in self._keys])
+        for session in list(self._idle):
+            self._evict(session)
+        return closing
+
+    def _connect(self, host, port):
+        r"""Connect to the host.
+
+        @return: A L{Deferred}, that fires with a new session
+        @rtype: L{Deferred}
+
+        """
+        creator = ClientCreator(self._reactor, self.protocol, timeout=self.timeout,
+                                _reactor=self._reactor)
+        return creator.connectTCP(host, port, self.connect_timeout)
+
+    def _dispatch(self):
+        r"""Hand out the idle sessions and open new ones for the requests,
+        that are waiting.
+
+        """
+        if self._dispatching:
+            self._redispatch = True
+            return
+        self._dispatching = True
+        try:
+            self._redispatch = True
+            while self._redispatch:
+                self._redispatch = False
+                for key in list(self._waiting):
+                    waiting = self._waiting.get(key)
+                    while waiting:
+                        idle = self._idle_by_key.get(key)
+                        if idle:
+                            session = idle.pop()
+                            if not idle:
+                                del self._idle_by_key[key]
+                            self._cancel_timer(self._idle.pop(session))
+                            self._check_out(session, waiting.popleft())
+                        elif self._has_room(key):
+                            self._open(key, waiting.popleft())
+                        else:
+                            break
+                    if not waiting and self._waiting.get(key) is waiting:
+                        del self._waiting[key]
+        finally:
+            self._dispatching = False
+
+    def _has_room(self, key):
+        if self.max_size is not None and self._counts.get(key, 0) >= self.max_size:
+            return False
+        if self.max_total is not None and self.size >= self.max_total:
+            if not self._idle:
+                return False
+            self._evict(next(iter(self._idle)))
+        return True
+
+    def _open(self, key, d):
+        host, port, credentials = key
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.size += 1
+        connecting = self._connect(host, port)
+        connecting.addCallbacks(self._connected, self._not_connected,
+                                callbackArgs=(key, d), errbackArgs=(key, d))
+
+    def _connected(self, session, key, d):
+        self._keys[session] = key
+        session.notifyConnectionLost().addCallback(self._lost, session)
+        if self.closed:
+            self._evict(session)
+            d.errback(Failure(PoolClosed('The pool has been closed')))
+            return
+        logging_in = maybeDeferred(self.login, session, key[2])
+        logging_in.addCallbacks(self._logged_in, self._login_failed,
+                                callbackArgs=(session, d), errbackArgs=(session, d))
+
+    def _not_connected(self, failure, key, d):
+        self._free(key)
+        d.errback(failure)
+        self._dispatch()
+
+    def _logged_in(self, ignored, session, d):
+        if self.closed:
+            self._evict(session)
+            d.errback(Failure(PoolClosed('The pool has been closed')))
+            return
+        d.callback(session)
+
+    def _login_failed(self, failure, session, d):
+        self._evict(session)
+        d.errback(failure)
+        self._dispatch()
+
+    def _check_out(self, session, d):
+        # The data, that has arrived, while the session was idle
+        session.discard_buffer()
+        if self.probe is None:
+            d.callback(session)
+            return
+        probing = session.run(self.probe, self.probe_timeout)
+        probing.addCallbacks(self._probed, self._probe_failed,
+                             callbackArgs=(session, d), errbackArgs=(session, d))
+
+    def _probed(self, ignored, session, d):
+        d.callback(session)
+
+    def _probe_failed(self, failure, session, d):
+        key = self._evict(session)
+        if key is None or self.closed:
+            d.errback(Failure(PoolClosed('The pool has been closed')))
+            return
+        log.msg('Health check of a session with %s:%s failed, evicting it: %s'
+                % (key[0], key[1], failure.getErrorMessage()))
+        self._waiting.setdefault(key, deque()).appendleft(d)
+        self._dispatch()
+
+    def _lost(self, ignored, session):
+        if self._forget(session) is not None:
+            self._dispatch()
+
+    def _evict(self, session):
+        r"""Remove the session from the pool and close it.
+
+        @return: The key of the session or C{None}, if it was not in the pool
+        """
+        key = self._forget(session)
+        if key is not None and not session.eof:
+            session.close()
+        return key
+
+    def _forget(self, session):
+        key = self._keys.pop(session, None)
+        if key is None:
+            return None
+        self._free(key)
+        if session in self._idle:
+            self._cancel_timer(self._idle.pop(session))
+            idle = self._idle_by_key[key]
+            idle.remove(session)
+            if not idle:
+                del self._idle_by_key[key]
+        return key
+
+    def _free(self, key):
+        self.size -= 1
+        self._counts[key] -= 1
+        if not self._counts[key]:
+            del self._counts[key]
+
+    def _cancel_timer(self, timer):
+        if timer is not None and timer.active():
+            timer.cancel()
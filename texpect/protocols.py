@@ -4,37 +4,338 @@
 from texpect.mixin import ExpectMixin
 from twisted.conch import telnet
 from twisted.internet.protocol import ProcessProtocol
+import re
+import struct
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # Not a POSIX system, there are no pseudo-terminals
+    termios = None
 
 
 class TelnetExpect(telnet.Telnet, ExpectMixin):
     """A ready-made combination of L{Telnet} and L{Expect}, that lets you
     utilize L{Expect}'s functionality to automate the Telnet session.
 
+    L{Telnet} looks at the received data byte by byte, here the bytes, that
+    need attention (C{IAC} and C{CR}), are found with a regular expression
+    and the runs of the application data between them are passed on as
+    slices, usually the whole chunk goes to the buffer at once. Only the
+    commands go through the state machine of L{Telnet}, so they are handled
+    exactly the same way.
+
     """
 
-    def __init__(self, debug=False, timeout=None, _reactor=None):
-        ExpectMixin.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor)
+    _special = re.compile(b'[\xff\r]')
+
+    def __init__(self, debug=False, timeout=None, _reactor=None, transcript=None):
+        ExpectMixin.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor,
+                             transcript=transcript)
         telnet.Telnet.__init__(self)
 
+    def dataReceived(self, data):
+        pos, end = 0, len(data)
+        # A command (or a line ending), that the previous chunk ended in the
+        # middle of
+        while pos < end and self.state != 'data':
+            telnet.Telnet.dataReceived(self, data[pos:pos + 1])
+            pos += 1
+        out = []
+        while pos < end:
+            match = self._special.search(data, pos)
+            if match is None:
+                out.append(data[pos:])
+                break
+            start = match.start()
+            out.append(data[pos:start])
+            char, following = data[start:start + 1], data[start + 1:start + 2]
+            if not following:
+                # The state machine remembers the byte until the next chunk
+                self._application_data(out)
+                telnet.Telnet.dataReceived(self, char)
+                return
+            if char == b'\r':
+                if following == b'\n':
+                    out.append(b'\n')
+                elif following == b'\0':
+                    out.append(b'\r')
+                elif following == telnet.IAC:
+                    out.append(b'\r')
+                    pos = start + 1
+                    continue
+                else:
+                    out.append(data[start:start + 2])
+                pos = start + 2
+            elif following == telnet.IAC:
+                out.append(telnet.IAC)
+                pos = start + 2
+            else:
+                self._application_data(out)
+                pos = start
+                while pos < end:
+                    telnet.Telnet.dataReceived(self, data[pos:pos + 1])
+                    pos += 1
+                    if self.state == 'data':
+                        break
+        self._application_data(out)
+
+    def _application_data(self, out):
+        data = b''.join(out)
+        del out[:]
+        if data:
+            self.applicationDataReceived(data)
+
     def applicationDataReceived(self, data):
         self.expectDataReceived(data)
 
+    def write(self, bytes):
+        r"""Write data to the transport, see L{ExpectMixin.write}. C{IAC} is
+        doubled (here and in the L{Send<texpect.dialog.Send>} steps of the
+        dialogs), so that the data reaches the other side as is.
+
+        L{Telnet} has a C{_write} of its own (for the commands), that would
+        shadow the one of L{ExpectMixin}, so the latter is named explicitly.
+
+        """
+        return self._request('write', ExpectMixin._write, self, bytes)
+
+    def _send(self, bytes):
+        self.transport.write(bytes.replace(telnet.IAC, telnet.IAC + telnet.IAC))
+
     def connectionLost(self, reason):
         telnet.Telnet.connectionLost(self, reason)
         ExpectMixin.connectionLost(self, reason)
 
 
+#: What L{ProcessExpect} does with the data, that the process writes to stderr
+MERGE = 'merge'
+SEPARATE = 'separate'
+DISCARD = 'discard'
+
+
+class StderrChannel(ExpectMixin):
+    r"""The stderr of a process, that is read separately from its stdout
+    (see L{ProcessExpect}). It has its own buffer and its own requests, that
+    are independent of the ones of the process's stdout::
+
+        d = session.err.read_until('error: ')
+
+    Writing to the channel writes to the process's stdin, closing it kills
+    the process.
+
+    The channel never pauses the process (pausing it would stop stdout as
+    well), instead, while there is no request in progress, its buffer is
+    drained down to the last L{limit} bytes, so the process never blocks,
+    writing to a stderr, that nobody is watching.
+
+    @ivar limit: Number of bytes, that are kept, while no request is in
+    progress, C{None} means 'all of them'
+    @type limit: C{int} or C{NoneType}
+
+    """
+
+    high_watermark = None
+
+    def __init__(self, process, limit=None):
+        r"""
+        @param process: The process
+        @type process: L{ProcessExpect}
+        @param limit: Number of bytes, that are kept, while no request is in
+        progress. Default: C{None}
+        @type limit: C{int}
+
+        """
+        ExpectMixin.__init__(self, debug=process.debug, timeout=process.timeout,
+                             _reactor=process._reactor)
+        self.process = process
+        self.limit = limit
+
+    @property
+    def transport(self):
+        return self.process.transport
+
+    def expectDataReceived(self, data):
+        ExpectMixin.expectDataReceived(self, data)
+        if self.promise is None and self.limit is not None and len(self._buffer) > self.limit:
+            self._buffer.discard(len(self._buffer) - self.limit)
+
+
 class ProcessExpect(ProcessProtocol, ExpectMixin):
     """One of the possible ways to "talk" to a subprocess, writing to its stdin
     and reading from stdout.
 
+    What happens to the data, that the process writes to stderr, depends on
+    L{stderr}:
+        - L{DISCARD}: it is read and thrown away
+        - L{MERGE}: it goes to the same buffer, as stdout, the session is
+          over, when both of them are closed
+        - L{SEPARATE}: it goes to a separate L{StderrChannel} (L{err}), that
+          has its own requests
+
+    The process is never paused because of the stderr data, when the buffer
+    of stdout reaches the L{high_watermark<ExpectMixin.high_watermark>}, only
+    stdout is paused, so a process, that writes to stderr a lot, can not get
+    stuck.
+
+    @ivar stderr: L{MERGE}, L{SEPARATE} or L{DISCARD}. Default: L{DISCARD}
+    @type stderr: C{str}
+    @ivar stderr_limit: L{limit<StderrChannel.limit>} of the separate stderr
+    channel. Default: 65536
+    @type stderr_limit: C{int} or C{NoneType}
+    @ivar err: The stderr channel, if L{stderr} is L{SEPARATE}, C{None} otherwise
+    @type err: L{StderrChannel} or C{NoneType}
+
     """
 
-    def __init__(self, debug=False, timeout=None, _reactor=None):
-        ExpectMixin.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor)
+    stderr = DISCARD
+    stderr_limit = 65536
+
+    def __init__(self, debug=False, timeout=None, _reactor=None, transcript=None,
+                 stderr=None):
+        r"""
+        @param stderr: What to do with the data, that the process writes to
+        stderr, L{MERGE}, L{SEPARATE} or L{DISCARD}. Default: L{stderr}
+        @type stderr: C{str}
+
+        """
+        ExpectMixin.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor,
+                             transcript=transcript)
+        if stderr is not None:
+            if stderr not in (MERGE, SEPARATE, DISCARD):
+                raise ValueError('Unknown stderr mode: %r' % (stderr,))
+            self.stderr = stderr
+        self.err = None
+        if self.stderr == SEPARATE:
+            self.err = StderrChannel(self, self.stderr_limit)
+        self._open = set([1, 2]) if self.stderr == MERGE else set([1])
 
     def outReceived(self, data):
         self.expectDataReceived(data)
 
+    def errReceived(self, data):
+        if self.stderr == MERGE:
+            self.expectDataReceived(data)
+        elif self.stderr == SEPARATE:
+            self.err.expectDataReceived(data)
+
     def outConnectionLost(self):
-        ExpectMixin.connectionLost(self, "stdout closed")
+        self._channel_lost(1)
+
+    def errConnectionLost(self):
+        if self.err is not None:
+            self.err.connectionLost("stderr closed")
+        self._channel_lost(2)
+
+    def _channel_lost(self, fd):
+        if fd not in self._open:
+            return
+        self._open.discard(fd)
+        if not self._open:
+            ExpectMixin.connectionLost(self, "stderr closed" if fd == 2 else "stdout closed")
+
+    def _pause_reading(self):
+        stdout = getattr(self.transport, 'pipes', {}).get(1)
+        if stdout is None:
+            self.transport.pauseProducing()
+        else:
+            stdout.pauseProducing()
+
+    def _resume_reading(self):
+        stdout = getattr(self.transport, 'pipes', {}).get(1)
+        if stdout is None:
+            self.transport.resumeProducing()
+        else:
+            stdout.resumeProducing()
+
+
+class PTYProcessExpect(ProcessExpect):
+    """Talks to a subprocess through a pseudo-terminal::
+
+        session = PTYProcessExpect(echo=False, window=(50, 200))
+        reactor.spawnProcess(session, 'ssh', ['ssh', 'router'], usePTY=True)
+
+    Most programs buffer their output in large blocks, when it goes to a
+    pipe, so a prompt, that is written to a pipe, may only arrive, when the
+    buffer fills up or the program exits. A terminal makes them flush their
+    output line by line (and the interactive ones flush their prompts), so
+    the data arrives as it is produced.
+
+    The terminal merges stderr with stdout (so L{stderr<ProcessExpect.stderr>}
+    does not apply) and, as usual for a terminal, turns the line feeds,
+    that the program writes, into C{'\\r\\n'} and echoes what is written to it,
+    unless the echo is turned off.
+
+    The subclasses, that override C{connectionMade}, should call this one,
+    it applies L{echo} and L{window}.
+
+    @ivar echo: Whether the terminal echoes the data, that is written to the
+    program. Default: C{True}
+    @type echo: C{bool}
+    @ivar window: Size of the terminal window, C{(rows, columns)}, C{None}
+    means 'leave it as it is'. Default: C{None}
+    @type window: C{tuple} or C{NoneType}
+
+    """
+
+    echo = True
+    window = None
+
+    def __init__(self, debug=False, timeout=None, _reactor=None, transcript=None,
+                 echo=None, window=None):
+        r"""
+        @param echo: Whether the terminal echoes the written data. Default: L{echo}
+        @type echo: C{bool}
+        @param window: Size of the terminal window, C{(rows, columns)}.
+        Default: L{window}
+        @type window: C{tuple}
+
+        """
+        ProcessExpect.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor,
+                               transcript=transcript, stderr=DISCARD)
+        if echo is not None:
+            self.echo = echo
+        if window is not None:
+            self.window = window
+
+    def connectionMade(self):
+        if not self.echo:
+            self.setEcho(False)
+        if self.window is not None:
+            self.setWindowSize(*self.window)
+
+    def setEcho(self, enabled):
+        r"""Turn the echo of the terminal on or off.
+
+        @type enabled: C{bool}
+
+        """
+        if termios is None:
+            raise NotImplementedError('Pseudo-terminals are not supported on this platform')
+        fd = self.transport.fileno()
+        attributes = termios.tcgetattr(fd)
+        if enabled:
+            attributes[3] |= termios.ECHO
+        else:
+            attributes[3] &= ~termios.ECHO
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        self.echo = enabled
+
+    def setWindowSize(self, rows, columns):
+        r"""Resize the terminal window. The program is notified with C{SIGWINCH}.
+
+        @type rows: C{int}
+        @type columns: C{int}
+
+        """
+        if termios is None:
+            raise NotImplementedError('Pseudo-terminals are not supported on this platform')
+        fcntl.ioctl(self.transport.fileno(), termios.TIOCSWINSZ,
+                    struct.pack('HHHH', rows, columns, 0, 0))
+        self.window = (rows, columns)
+
+    def processEnded(self, reason):
+        # The terminal only reports, that the program is gone, there is no
+        # separate notification for the output
+        ExpectMixin.connectionLost(self, reason)
@@ -0,0 +1,553 @@
+"""
+SSH sessions. An L{SSHClient} keeps one authenticated SSH connection to a host
+and opens the sessions (the user's shell or a command) as the channels of
+that connection, so the handshake, the key exchange and the authentication
+are only done once, no matter how many sessions there are::
+
+    client = SSHClient('router1', username='admin', password='secret',
+                       host_key='9d:38:5b:...')
+    d = client.open(pty=True)
+    d.addCallback(lambda session: session.read_until('#'))
+    ...
+    d = client.open('show version')
+    d.addCallback(lambda session: session.read_all())
+    ...
+    client.close()
+
+This module needs twisted.conch with its SSH dependencies (the cryptography
+package and pyasn1), the rest of the package does not.
+
+@author: shylent
+"""
+from texpect.errors import SSHConnectionFailed
+from texpect.mixin import ExpectMixin
+from texpect.protocols import MERGE, DISCARD
+from twisted.conch.ssh import channel, common, connection, session, transport, userauth
+from twisted.internet.defer import Deferred, fail, maybeDeferred, succeed
+from twisted.internet.protocol import ClientCreator
+from twisted.python import log
+from twisted.python.failure import Failure
+from collections import deque
+import struct
+
+
+class SSHExpect(channel.SSHChannel, ExpectMixin):
+    r"""A session channel of an SSH connection, that runs the user's shell or
+    a command. The sessions are normally opened with L{SSHClient.open}.
+
+    The channel is its own transport: writing to it sends the data to the
+    remote program, closing it closes the channel (the connection and the
+    other channels of it stay open).
+
+    When the buffer reaches the L{high_watermark<ExpectMixin.high_watermark>},
+    the channel stops adjusting its window, so the server stops sending the
+    data of this channel only, the others keep going.
+
+    @ivar command: The command, that is run, C{None} means the user's shell
+    @type command: C{str} or C{NoneType}
+    @ivar pty: Whether a pseudo-terminal is requested for the session
+    @type pty: C{bool}
+    @ivar term: The terminal type, that is requested with the pseudo-terminal
+    @type term: C{str}
+    @ivar window: Size of the terminal window, C{(rows, columns)}, C{None}
+    means 24 by 80
+    @type window: C{tuple} or C{NoneType}
+    @ivar stderr: What to do with the stderr data of the session,
+    L{MERGE<texpect.protocols.MERGE>} or L{DISCARD<texpect.protocols.DISCARD>}
+    @type stderr: C{str}
+    @ivar exit_status: The exit status of the remote program, as reported by
+    the server, C{None} until it is (and if it never is)
+    @type exit_status: C{int} or C{NoneType}
+    @ivar opened: A L{Deferred}, that fires with the session, once the shell
+    or the command has been started, or fails with
+    L{SSHConnectionFailed<texpect.errors.SSHConnectionFailed>}, if the channel
+    could not be opened or the server refused to start the program.
+    L{SSHClient.open} hands it out to the caller.
+    @type opened: L{Deferred}
+
+    """
+
+    name = b'session'
+    term = 'vt100'
+    stderr = DISCARD
+
+    def __init__(self, command=None, pty=False, term=None, window=None, stderr=None,
+                 debug=False, timeout=None, _reactor=None, transcript=None, **kwargs):
+        r"""
+        @param command: The command to run. Default: C{None}, the user's shell
+        @type command: C{str}
+        @param pty: Whether to request a pseudo-terminal. Default: C{False}
+        @type pty: C{bool}
+        @param term: The terminal type. Default: L{term}
+        @type term: C{str}
+        @param window: Size of the terminal window. Default: C{None}
+        @type window: C{tuple}
+        @param stderr: What to do with the stderr data. Default: L{stderr}
+        @type stderr: C{str}
+        @param kwargs: Passed to L{SSHChannel}, C{conn} is required
+
+        """
+        channel.SSHChannel.__init__(self, **kwargs)
+        ExpectMixin.__init__(self, debug=debug, timeout=timeout, _reactor=_reactor,
+                             transcript=transcript)
+        if stderr is not None:
+            if stderr not in (MERGE, DISCARD):
+                raise ValueError('Unknown stderr mode: %r' % (stderr,))
+            self.stderr = stderr
+        if term is not None:
+            self.term = term
+        self.command = command
+        self.pty = pty
+        self.window = window
+        self.exit_status = None
+        self.opened = Deferred()
+        self._reading_paused = False
+
+    @property
+    def transport(self):
+        return self
+
+    def write(self, bytes):
+        r"""Write data to the remote program, see L{ExpectMixin.write}.
+
+        L{SSHChannel} has a C{write} of its own, that would shadow the one of
+        L{ExpectMixin}, the data goes through the former only in the end (see
+        L{_send}).
+
+        """
+        return self._request('write', self._write, bytes)
+
+    def writeSequence(self, seq):
+        channel.SSHChannel.write(self, b''.join(seq))
+
+    def _send(self, bytes):
+        channel.SSHChannel.write(self, bytes)
+
+    def addWindowBytes(self, data):
+        # The data, that did not fit in the window, is sent directly, not as
+        # a write request (which would fail, if another request is in progress)
+        buf, self.buf = self.buf, b''
+        channel.SSHChannel.addWindowBytes(self, data)
+        if buf:
+            channel.SSHChannel.write(self, buf)
+
+    def channelOpen(self, specificData):
+        d = succeed(None)
+        if self.pty:
+            rows, columns = self.window or (24, 80)
+            data = session.packRequest_pty_req(self.term, (rows, columns, 0, 0), b'')
+            d.addCallback(self._send_request, b'pty-req', data)
+        if self.command is None:
+            d.addCallback(self._send_request, b'shell', b'')
+        else:
+            d.addCallback(self._send_request, b'exec', common.NS(self.command))
+        d.addCallbacks(self._started, self._not_started)
+
+    def _send_request(self, ignored, request, data):
+        return self.conn.sendRequest(self, request, data, wantReply=True)
+
+    def _started(self, ignored):
+        self.opened.callback(self)
+
+    def _not_started(self, failure):
+        what = 'a shell' if self.command is None else 'command %r' % (self.command,)
+        self.opened.errback(Failure(SSHConnectionFailed(
+            'The server refused to start %s' % (what,))))
+        self.loseConnection()
+
+    def openFailed(self, reason):
+        self.opened.errback(Failure(SSHConnectionFailed(
+            'Could not open a channel: %s' % (reason,))))
+        ExpectMixin.connectionLost(self, reason)
+
+    def dataReceived(self, data):
+        self.expectDataReceived(data)
+
+    def extReceived(self, dataType, data):
+        if dataType == connection.EXTENDED_DATA_STDERR and self.stderr == MERGE:
+            self.expectDataReceived(data)
+
+    def request_exit_status(self, data):
+        self.exit_status = struct.unpack('>L', data)[0]
+        return True
+
+    def closed(self):
+        ExpectMixin.connectionLost(self, 'channel closed')
+
+    def setWindowSize(self, rows, columns):
+        r"""Resize the terminal window of the session (if there is a
+        pseudo-terminal, the server ignores this otherwise).
+
+        @type rows: C{int}
+        @type columns: C{int}
+
+        """
+        self.conn.sendRequest(self, b'window-change',
+                              session.packRequest_window_change((rows, columns, 0, 0)))
+        self.window = (rows, columns)
+
+    def pauseProducing(self):
+        self._reading_paused = True
+
+    def resumeProducing(self):
+        self._reading_paused = False
+        if not self.localClosed and self.localWindowLeft < self.localWindowSize // 2:
+            self.conn.adjustWindow(self, self.localWindowSize - self.localWindowLeft)
+
+    def stopProducing(self):
+        self.loseConnection()
+
+
+class _Connection(connection.SSHConnection):
+    r"""The connection service, that tells the client, when the
+    authentication is complete, and holds back the window adjustments of the
+    channels, that are paused.
+
+    """
+
+    def __init__(self, client):
+        connection.SSHConnection.__init__(self)
+        self.client = client
+
+    def serviceStarted(self):
+        connection.SSHConnection.serviceStarted(self)
+        self.transport.authenticated = True
+        self.client._authenticated(self)
+
+    def serviceStopped(self):
+        self.client._connection_stopped(self)
+        connection.SSHConnection.serviceStopped(self)
+
+    def adjustWindow(self, channel, bytesToAdd):
+        if getattr(channel, '_reading_paused', False):
+            return
+        connection.SSHConnection.adjustWindow(self, channel, bytesToAdd)
+
+
+class _UserAuthClient(userauth.SSHUserAuthClient):
+    r"""Tries the password of the client (once) and its keys."""
+
+    def __init__(self, client, instance):
+        userauth.SSHUserAuthClient.__init__(self, client.username, instance)
+        self._password = client.password
+        self._keys = list(client.keys)
+        self._key = None
+
+    def getPassword(self, prompt=None):
+        password, self._password = self._password, None
+        if password is None:
+            return None
+        return succeed(password)
+
+    def getPublicKey(self):
+        if not self._keys:
+            return None
+        self._key = self._keys.pop(0)
+        return self._key.public()
+
+    def getPrivateKey(self):
+        return succeed(self._key)
+
+
+class _ClientTransport(transport.SSHClientTransport):
+    r"""The transport of the connection, that reports to the client.
+
+    @ivar error: Why the connection was refused, if it was
+    @type error: C{str} or C{NoneType}
+    @ivar authenticated: Whether the authentication has succeeded
+    @type authenticated: C{bool}
+
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.error = None
+        self.authenticated = False
+
+    def connectionMade(self):
+        transport.SSHClientTransport.connectionMade(self)
+        self.client._transport_made(self)
+
+    def verifyHostKey(self, hostKey, fingerprint):
+        d = self.client._verify_host_key(hostKey, fingerprint)
+        d.addErrback(self._rejected)
+        return d
+
+    def _rejected(self, failure):
+        self.error = failure.getErrorMessage()
+        return failure
+
+    def connectionSecure(self):
+        self.requestService(_UserAuthClient(self.client, _Connection(self.client)))
+
+    def sendDisconnect(self, reason, desc):
+        if self.error is None:
+            self.error = desc
+        transport.SSHClientTransport.sendDisconnect(self, reason, desc)
+
+    def receiveError(self, reasonCode, description):
+        if self.error is None:
+            self.error = description
+        transport.SSHClientTransport.receiveError(self, reasonCode, description)
+
+    def connectionLost(self, reason):
+        transport.SSHClientTransport.connectionLost(self, reason)
+        self.client._transport_lost(self, reason)
+
+
+class SSHClient(object):
+    r"""One SSH connection to a host, over which any number of sessions are
+    opened.
+
+    The connection is established and authenticated, when the first session
+    is requested (or when L{connect} is called), and it is shared by all of
+    the sessions. If it is lost, the sessions are lost with it and the next
+    request for a session establishes a new one.
+
+    The authentication is attempted with the password (if there is one),
+    then with each of the keys.
+
+    @ivar protocol: The class of the sessions
+    @type protocol: A subclass of L{SSHExpect}
+    @ivar host: Host to connect to
+    @type host: C{str}
+    @ivar port: Port to connect to
+    @type port: C{int}
+    @ivar username: The user to log in as
+    @type username: C{str}
+    @ivar password: The password of the user, C{None} means that the password
+    authentication is not attempted
+    @type password: C{str} or C{NoneType}
+    @ivar keys: The private keys of the user
+    @type keys: C{list} of L{Key<twisted.conch.ssh.keys.Key>}
+    @ivar host_key: How the host key is verified: the expected fingerprint
+    of the key (C{'9d:38:5b:...'}), a callable, that takes the key (as a
+    string) and its fingerprint and returns a C{bool} or a L{Deferred} of it,
+    or C{None}, meaning that any key is accepted (and logged)
+    @ivar max_channels: Maximum number of sessions, that are open at the same
+    time, the subsequent requests for a session wait, until one of them is
+    closed. C{None} means no limit.
+    @type max_channels: C{int} or C{NoneType}
+    @ivar timeout: Default timeout for the requests of the sessions
+    @type timeout: C{int}
+    @ivar connect_timeout: Number of seconds to wait for the TCP connection
+    to be established
+    @type connect_timeout: C{int}
+    @ivar connection: The connection service, while the client is connected
+    and authenticated, C{None} otherwise
+    @type connection: L{SSHConnection<twisted.conch.ssh.connection.SSHConnection>}
+    @ivar sessions: The sessions, that are open or being opened
+    @type sessions: C{set}
+    @ivar closed: Whether the client has been closed
+    @type closed: C{bool}
+
+    """
+
+    protocol = SSHExpect
+
+    def __init__(self, host, port=22, username=None, password=None, keys=(),
+                 host_key=None, max_channels=None, timeout=None, connect_timeout=30,
+                 _reactor=None):
+        r"""
+        @param host: Host to connect to
+        @type host: C{str}
+        @param port: Port to connect to. Default: 22
+        @type port: C{int}
+        @param username: The user to log in as. Default: C{None}, the current
+        user
+        @type username: C{str}
+        @param password: The password. Default: C{None}
+        @type password: C{str}
+        @param keys: The private keys. Default: none
+        @type keys: C{list}
+        @param host_key: How to verify the host key. Default: C{None}
+        @param max_channels: Maximum number of open sessions. Default: C{None}
+        @type max_channels: C{int}
+        @param timeout: Default timeout for the requests of the sessions.
+        Default: C{None}
+        @type timeout: C{int}
+        @param connect_timeout: Connection timeout in seconds. Default: 30
+        @type connect_timeout: C{int}
+
+        """
+        if _reactor is None:
+            from twisted.internet import reactor as _reactor
+        if username is None:
+            import getpass
+            username = getpass.getuser()
+        self._reactor = _reactor
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keys = keys
+        self.host_key = host_key
+        self.max_channels = max_channels
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.connection = None
+        self.sessions = set()
+        self.closed = False
+        self._transport = None
+        self._connecting = None
+        self._waiting = deque()
+        self._disconnected = []
+
+    def connect(self):
+        r"""Establish and authenticate the connection, unless it already is.
+
+        @return: A L{Deferred}, that fires with the client, once the
+        connection is authenticated.
+        Errback argument types:
+            - L{SSHConnectionFailed}: when the connection is refused or lost,
+              the host key is not accepted, the authentication fails or the
+              client has been closed
+        @rtype: L{Deferred}
+
+        """
+        if self.closed:
+            return fail(SSHConnectionFailed('The client is closed'))
+        if self.connection is not None:
+            return succeed(self)
+        d = Deferred()
+        if self._connecting is None:
+            self._connecting = []
+            creator = ClientCreator(self._reactor, _ClientTransport, self)
+            connecting = creator.connectTCP(self.host, self.port, self.connect_timeout)
+            connecting.addErrback(self._not_connected)
+        self._connecting.append(d)
+        return d
+
+    def open(self, command=None, pty=False, term=None, window=None, stderr=None):
+        r"""Open a session, connecting first, if necessary.
+
+        @param command: The command to run. Default: C{None}, the user's shell
+        @type command: C{str}
+        @param pty: Whether to request a pseudo-terminal. Default: C{False}
+        @type pty: C{bool}
+        @param term: The terminal type. Default: L{SSHExpect.term}
+        @type term: C{str}
+        @param window: Size of the terminal window, C{(rows, columns)}.
+        Default: C{None}
+        @type window: C{tuple}
+        @param stderr: What to do with the stderr data, see L{SSHExpect.stderr}
+        @type stderr: C{str}
+
+        @return: A L{Deferred}, that fires with the session (an instance of
+        L{protocol}), once the shell or the command has been started.
+        Errback argument types:
+            - L{SSHConnectionFailed}: when the connection could not be
+              established or the session could not be opened
+        @rtype: L{Deferred}
+
+        """
+        options = dict(command=command, pty=pty, term=term, window=window, stderr=stderr)
+        d = Deferred()
+        self._waiting.append((d, options))
+        connecting = self.connect()
+        connecting.addCallbacks(self._dispatch, self._fail_waiting)
+        return d
+
+    def close(self):
+        r"""Close the client and its connection. The requests for the
+        sessions, that are waiting, fail, the open sessions are lost.
+
+        @return: A L{Deferred}, that fires, when the connection is closed
+        @rtype: L{Deferred}
+
+        """
+        self.closed = True
+        self._fail_waiting(Failure(SSHConnectionFailed('The client has been closed')))
+        if self._transport is None and self._connecting is None:
+            return succeed(None)
+        d = Deferred()
+        self._disconnected.append(d)
+        if self._transport is not None:
+            self._transport.transport.loseConnection()
+        return d
+
+    def _verify_host_key(self, key, fingerprint):
+        if self.host_key is None:
+            log.msg('Accepting the host key of %s:%s without verification: %s'
+                    % (self.host, self.port, fingerprint))
+            return succeed(True)
+        if callable(self.host_key):
+            d = maybeDeferred(self.host_key, key, fingerprint)
+        else:
+            d = succeed(fingerprint == self.host_key)
+        def check(accepted):
+            if not accepted:
+                raise SSHConnectionFailed('The host key %s was not accepted' % (fingerprint,))
+            return True
+        return d.addCallback(check)
+
+    def _dispatch(self, ignored=None):
+        r"""Open the sessions, that are waiting, while there is room for them.
+
+        This method is considered private and should not be called directly.
+
+        """
+        while self._waiting and self.connection is not None:
+            if self.max_channels is not None and len(self.sessions) >= self.max_channels:
+                break
+            d, options = self._waiting.popleft()
+            session = self.protocol(timeout=self.timeout, _reactor=self._reactor,
+                                    conn=self.connection, **options)
+            self.sessions.add(session)
+            session.notifyConnectionLost().addCallback(self._session_lost, session)
+            session.opened.chainDeferred(d)
+            self.connection.openChannel(session)
+
+    def _session_lost(self, ignored, session):
+        self.sessions.discard(session)
+        self._dispatch()
+
+    def _fail_waiting(self, failure):
+        waiting, self._waiting = self._waiting, deque()
+        for d, options in waiting:
+            d.errback(failure)
+
+    def _transport_made(self, transport):
+        self._transport = transport
+        if self.closed:
+            transport.transport.loseConnection()
+
+    def _authenticated(self, connection):
+        self.connection = connection
+        connecting, self._connecting = self._connecting, None
+        for d in connecting or ():
+            d.callback(self)
+
+    def _connection_stopped(self, connection):
+        if self.connection is connection:
+            self.connection = None
+
+    def _not_connected(self, failure):
+        self._not_authenticated(SSHConnectionFailed(
+            'Could not connect to %s:%s: %s' % (self.host, self.port, failure.getErrorMessage())))
+        self._notify_disconnected()
+
+    def _transport_lost(self, transport, reason):
+        if transport is self._transport:
+            self._transport = None
+        if transport.authenticated:
+            # The sessions are lost with the connection, the requests, that
+            # wait for a channel, get a new one
+            if self._waiting and not self.closed:
+                self.connect().addCallbacks(self._dispatch, self._fail_waiting)
+        else:
+            error = transport.error or reason.getErrorMessage()
+            self._not_authenticated(SSHConnectionFailed(
+                'Could not connect to %s:%s: %s' % (self.host, self.port, error)))
+        self._notify_disconnected()
+
+    def _not_authenticated(self, error):
+        connecting, self._connecting = self._connecting, None
+        for d in connecting or ():
+            d.errback(Failure(error))
+        self._fail_waiting(Failure(error))
+
+    def _notify_disconnected(self):
+        disconnected, self._disconnected = self._disconnected, []
+        for d in disconnected:
+            d.callback(None)
@@ -0,0 +1,189 @@
+"""
+@author: shylent
+"""
+from texpect.errors import (EOFReached, OutOfSequenceError, ConnectionAlreadyClosed,
+    RequestInterruptedByConnectionLoss, RequestTimeout)
+from twisted.trial import unittest
+import os.path
+import sys
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+else:
+    from texpect import aio
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncioTestCase(unittest.TestCase):
+
+    if asyncio is None:
+        skip = 'asyncio is not available'
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_until_complete(self, future):
+        return self.loop.run_until_complete(future)
+
+    def assertRaisesAsync(self, exception, future):
+        return self.assertRaises(exception, self.run_until_complete, future)
+
+
+class ExpectTestCase(AsyncioTestCase):
+
+    def setUp(self):
+        AsyncioTestCase.setUp(self)
+        self.t = aio.ExpectMixin(loop=self.loop)
+        self.t.transport = FakeTransport()
+
+    def test_immediate(self):
+        self.t.expectDataReceived(b'foo bar')
+        future = self.t.expect([b'baz', b'bar'])
+        self.assertTrue(future.done())
+        index, match, data = future.result()
+        self.assertEqual((index, match.group(), data), (1, b'bar', b'foo bar'))
+        self.assertIdentical(self.t.request, None)
+
+    def test_incremental(self):
+        future = self.t.read_until(b'router#')
+        self.loop.call_soon(self.t.expectDataReceived, b'out rou')
+        self.loop.call_soon(self.t.expectDataReceived, b'ter# more')
+        self.assertEqual(self.run_until_complete(future), b'out router#')
+        self.assertEqual(self.t._buffer.peek(), b' more')
+
+    def test_regex(self):
+        import re
+        future = self.t.expect([re.compile(br'\d+ packets')])
+        self.t.expectDataReceived(b'sent 12')
+        self.t.expectDataReceived(b' packets')
+        self.assertEqual(future.result()[1].group(), b'12 packets')
+
+    def test_timeout(self):
+        future = self.t.read_until(b'never', timeout=0.01)
+        self.t.expectDataReceived(b'foo')
+        error = self.assertRaisesAsync(RequestTimeout, future)
+        self.assertEqual(error.data, b'foo')
+        self.assertIdentical(self.t.request, None)
+
+    def test_cancelled(self):
+        future = self.t.read_until(b'never', timeout=10)
+        self.assertRaisesAsync(asyncio.TimeoutError, asyncio.wait_for(future, 0.01))
+        self.assertIdentical(self.t.request, None)
+        self.t.expectDataReceived(b'never')
+        self.assertEqual(self.run_until_complete(self.t.read_lazy()), b'never')
+
+    def test_out_of_sequence(self):
+        self.t.read_until(b'foo')
+        self.assertRaisesAsync(OutOfSequenceError, self.t.read_until(b'bar'))
+        self.assertTrue(self.t.transport.closed)
+
+    def test_connection_lost(self):
+        future = self.t.read_until(b'foo')
+        self.t.expectDataReceived(b'bar')
+        self.t.expectConnectionLost()
+        error = self.assertRaisesAsync(RequestInterruptedByConnectionLoss, future)
+        self.assertEqual(error.data, b'bar')
+
+    def test_closed(self):
+        self.t.expectDataReceived(b'bar')
+        self.t.expectConnectionLost()
+        self.assertRaisesAsync(ConnectionAlreadyClosed, self.t.read_until(b'foo'))
+        self.assertRaisesAsync(EOFReached, self.t.read_until(b'foo'))
+
+    def test_read_all(self):
+        future = self.t.read_all()
+        self.t.expectDataReceived(b'foo')
+        self.t.expectDataReceived(b'bar')
+        self.assertFalse(future.done())
+        self.t.expectConnectionLost()
+        self.assertEqual(self.run_until_complete(future), b'foobar')
+
+
+class TelnetParserTestCase(AsyncioTestCase):
+
+    def setUp(self):
+        AsyncioTestCase.setUp(self)
+        self.replies = []
+        self.parser = aio.TelnetParser(self.replies.append)
+
+    def test_plain(self):
+        self.assertEqual(self.parser.feed(b'hello'), b'hello')
+
+    def test_newlines(self):
+        self.assertEqual(self.parser.feed(b'a\r\nb\r\0c\rd'), b'a\nb\rc\rd')
+
+    def test_negotiation(self):
+        data = self.parser.feed(b'a\xff\xfb\x01b\xff\xfd\x18c\xff\xfc\x01')
+        self.assertEqual(data, b'abc')
+        self.assertEqual(self.replies, [b'\xff\xfe\x01', b'\xff\xfc\x18'])
+
+    def test_escaped_iac(self):
+        self.assertEqual(self.parser.feed(b'a\xff\xffb'), b'a\xffb')
+
+    def test_subnegotiation(self):
+        self.assertEqual(self.parser.feed(b'a\xff\xfa\x18\x01\xff\xf0b'), b'ab')
+
+    def test_split(self):
+        data = b'a\r\nb\xff\xfb\x01c\xff\xfa\x18\x01\xff\xf0d\xff\xffe'
+        out = [self.parser.feed(data[i:i + 1]) for i in range(len(data))]
+        self.assertEqual(b''.join(out), b'a\nbcd\xffe')
+        self.assertEqual(self.replies, [b'\xff\xfe\x01'])
+
+
+class TelnetTestCase(AsyncioTestCase):
+
+    def test_telnet(self):
+        class Server(asyncio.Protocol):
+            def connection_made(self, transport):
+                self.transport = transport
+                transport.write(b'\xff\xfb\x01Username:')
+            def data_received(self, data):
+                if data == b'\xff\xfe\x01':
+                    return
+                self.transport.write(data + b'\r\nrouter#')
+                if data.startswith(b'quit'):
+                    self.transport.close()
+        server = self.run_until_complete(
+            self.loop.create_server(Server, '127.0.0.1', 0))
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+        session = self.run_until_complete(aio.connect('127.0.0.1', port, timeout=5,
+                                                      loop=self.loop))
+        self.assertIsInstance(session, aio.TelnetExpect)
+        self.assertEqual(self.run_until_complete(session.read_until(b'Username:')),
+                         b'Username:')
+        session.write(b'admin')
+        index, match, data = self.run_until_complete(session.expect([b'denied', b'#']))
+        self.assertEqual((index, data), (1, b'admin\nrouter#'))
+        session.write(b'quit')
+        self.assertEqual(self.run_until_complete(session.read_all()), b'quit\nrouter#')
+
+
+class ProcessTestCase(AsyncioTestCase):
+
+    def test_process(self):
+        session = self.run_until_complete(aio.spawn(
+            [sys.executable, '-m', 'mock_process'], timeout=5, loop=self.loop,
+            cwd=os.path.dirname(os.path.abspath(__file__))))
+        self.assertIsInstance(session, aio.ProcessExpect)
+        self.assertEqual(self.run_until_complete(session.read_until(b'llo')), b'hello')
+        session.write(b'something')
+        session.transport.get_pipe_transport(0).close()
+        self.assertEqual(self.run_until_complete(session.read_all()), b'farewell')
+        self.assertEqual(self.run_until_complete(session.exited), 0)
+        session.close()
@@ -0,0 +1,89 @@
+"""
+@author: shylent
+"""
+from texpect import benchmark
+from twisted.trial import unittest
+from StringIO import StringIO
+import re
+
+
+class HotPathTestCase(unittest.TestCase):
+
+    def test_reply(self):
+        data = benchmark.reply(100)
+        self.assertEqual(len(data), 100)
+        self.assertTrue(data.endswith(benchmark.PROMPT))
+        self.assertEqual(data.count(benchmark.PROMPT), 1)
+
+    def test_patterns(self):
+        data = benchmark.reply(1000)
+        for regex in (False, True):
+            pattern_list = benchmark.patterns(4, regex)
+            self.assertEqual(len(pattern_list), 4)
+            found = [bool(re.search(p if regex else re.escape(p), data))
+                     for p in pattern_list]
+            self.assertEqual(found, [False, False, False, True])
+
+    def test_hot_path(self):
+        result = benchmark.hot_path(7, 100, pattern_count=3, regex=True, total=1000)
+        self.assertEqual(result['requests'], 10)
+        self.assertEqual(result['bytes'], 1000)
+        self.assertTrue(result['bytes_per_sec'] > 0)
+        self.assertTrue(result['p50_us'] <= result['p99_us'] <= result['max_us'])
+        self.assertTrue(result['peak_buffer'] >= 100)
+
+    def test_suite(self):
+        names = [name for name, args in benchmark.hot_path_suite()]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn('hot_path chunk=1 buffer=65536 patterns=1 literal', names)
+        self.assertIn('hot_path chunk=4096 buffer=16384 patterns=64 regex', names)
+
+
+class CompareTestCase(unittest.TestCase):
+
+    def test_compare(self):
+        baseline = {'a': {'bytes_per_sec': 100.0, 'p50_us': 10.0},
+                    'gone': {'bytes_per_sec': 100.0}}
+        results = {'a': {'bytes_per_sec': 80.0, 'p50_us': 10.5},
+                   'new': {'bytes_per_sec': 100.0}}
+        changes = benchmark.compare(results, baseline, threshold=0.1)
+        self.assertEqual([(name, metric, regression)
+                          for name, metric, old, new, change, regression in changes],
+                         [('a', 'bytes_per_sec', True), ('a', 'p50_us', False)])
+        self.assertAlmostEqual(changes[0][4], -0.2)
+
+    def test_save(self):
+        path = self.mktemp()
+        results = {'a': {'bytes_per_sec': 100.0}}
+        benchmark.save(results, path)
+        self.assertEqual(benchmark.load(path), results)
+
+    def test_main(self):
+        path = self.mktemp()
+        out = StringIO()
+        argv = ['--hot-path-only', '--total', '100', '--filter', 'chunk=65536']
+        self.assertEqual(benchmark.main(argv + ['--save', path], out), 0)
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+        self.assertEqual(list(benchmark.load(path)),
+                         ['hot_path chunk=65536 buffer=65536 patterns=1 literal'])
+        out = StringIO()
+        benchmark.main(argv + ['--compare', path, '--threshold', '1000'], out)
+        self.assertIn('bytes_per_sec', out.getvalue())
+
+
+class EndToEndTestCase(unittest.TestCase):
+
+    def check(self, result):
+        self.assertEqual(result['requests'], 5)
+        self.assertEqual(result['bytes'], 5 * 2000)
+
+    def test_telnet(self):
+        return benchmark.telnet(rounds=5, reply_size=2000).addCallback(self.check)
+
+    def test_process(self):
+        return benchmark.process(rounds=5, reply_size=2000).addCallback(self.check)
+
+    def test_pty(self):
+        if benchmark.termios is None:
+            raise unittest.SkipTest('Pseudo-terminals are not supported on this platform')
+        return benchmark.pty(rounds=5, reply_size=2000).addCallback(self.check)
@@ -0,0 +1,76 @@
+'''
+@author: shylent
+'''
+from texpect.buffer import ReceiveBuffer
+from twisted.trial import unittest
+import re
+
+
+class ReceiveBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.b = ReceiveBuffer('foo')
+
+    def test_append(self):
+        self.b.append('bar')
+        self.assertEqual(len(self.b), 6)
+        self.assertEqual(self.b.peek(), 'foobar')
+        self.assertEqual(str(self.b), 'foobar')
+
+    def test_consume(self):
+        self.b.append('bar')
+        self.assertEqual(self.b.consume(2), 'fo')
+        self.assertEqual(self.b.peek(), 'obar')
+        self.assertEqual(self.b.consume(), 'obar')
+        self.assertEqual(len(self.b), 0)
+        self.failIf(self.b)
+
+    def test_peek(self):
+        self.assertEqual(self.b.peek(2), 'fo')
+        self.assertEqual(self.b.peek(), 'foo')
+        self.assertIsInstance(self.b.peek(), str)
+
+    def test_search_relative(self):
+        self.b.append('barfoo')
+        self.b.discard(3)
+        m = self.b.search(re.compile('^bar'))
+        self.assertEqual(m.span(), (0, 3))
+        m = self.b.search(re.compile('foo'), 1)
+        self.assertEqual(m.span(), (3, 6))
+        self.assertIdentical(self.b.search(re.compile('^foo')), None)
+
+    def test_compaction(self):
+        self.b.compact_threshold = 4
+        self.b.append('barbaz')
+        m = self.b.search(re.compile('bar'))
+        self.b.discard(5)
+        self.assertEqual(self.b._offset, 0)
+        self.assertEqual(self.b.peek(), 'rbaz')
+        # Match objects, obtained before the compaction, are not affected
+        self.assertEqual(m.group(), 'bar')
+
+    def test_match_survives_append(self):
+        m = self.b.search(re.compile('o+'))
+        self.b.append('o' * 1000)
+        self.assertEqual(m.group(), 'oo')
+
+    def test_detach(self):
+        self.b.append('barbaz')
+        data = self.b.detach(6)
+        self.assertIsInstance(data, memoryview)
+        self.assertEqual(data.tobytes(), 'foobar')
+        self.assertEqual(self.b.peek(), 'baz')
+        # The buffer does not append to the storage, that it has handed over
+        self.b.append('x' * 1000)
+        self.assertEqual(data.tobytes(), 'foobar')
+        self.assertEqual(len(self.b), 1003)
+
+    def test_detach_copies_smaller_part(self):
+        self.b.append('barbaz')
+        storage = self.b._data
+        data = self.b.detach(2)
+        self.assertEqual(data.tobytes(), 'fo')
+        self.assertIdentical(self.b._data, storage)
+        self.assertEqual(self.b.peek(), 'obarbaz')
+        self.assertEqual(self.b.detach().tobytes(), 'obarbaz')
+        self.assertEqual(len(self.b), 0)
@@ -0,0 +1,152 @@
+'''
+@author: shylent
+'''
+from texpect import dialog
+from texpect.dialog import Dialog, Expect, Send, Goto, Fail
+from texpect.errors import (DialogFailed, RequestTimeout,
+    RequestInterruptedByConnectionLoss, OutOfSequenceError)
+from texpect.mixin import ExpectMixin, RunDialog
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+import re
+
+
+login = Dialog({
+    'start': [Expect(['Username:', 'Password:'], goto=[None, 'password']),
+              Send('admin\n'),
+              Expect('Password:'),
+              Goto('password')],
+    'password': [Send('secret\n'),
+                 Expect(['#', 'Login invalid'], goto=[None, 'failed'], save='prompt')],
+    'failed': [Fail('Authentication failed')],
+}, start='start')
+
+
+class CompileTestCase(unittest.TestCase):
+
+    def test_single_state(self):
+        d = Dialog([Send('foo'), Expect('bar', save='bar')])
+        self.assertEqual([i[0] for i in d.program], [dialog.SEND, dialog.EXPECT, dialog.DONE])
+        self.assertEqual(d.program[1][3], (None,))
+        self.assertEqual(d.program[1][4], 'bar')
+
+    def test_states(self):
+        self.assertEqual(login.states['start'], 0)
+        # start: EXPECT, SEND, EXPECT, GOTO, DONE
+        self.assertEqual(login.program[0][3], (None, login.states['password']))
+        self.assertEqual(login.program[login.states['failed']][0], dialog.FAIL)
+
+    def test_single_regex(self):
+        regex = re.compile('ba+r')
+        self.assertEqual(Expect(regex).patterns, [regex])
+        d = Dialog([Expect(regex, save='bar')])
+        self.assertEqual(d.program[0][3], (None,))
+        t = ExpectMixin(_reactor=Clock())
+        t.expectDataReceived('baaar')
+        d = t.run(d)
+        d.addCallback(self.assertEqual, {'bar': 'baaar'})
+        return d
+
+    def test_goto(self):
+        d = Dialog({'a': [Goto('b')], 'b': [Send('x')]}, start='a')
+        self.assertEqual(d.program[0], (dialog.GOTO, d.states['b']))
+
+    def test_dict_goto(self):
+        d = Dialog({'a': [Expect(['x', 'y', 'z'], goto={2: 'b'})], 'b': []}, start='a')
+        self.assertEqual(d.program[0][3], (None, None, d.states['b']))
+
+    def test_unknown_state(self):
+        self.assertRaises(ValueError, Dialog, {'a': [Goto('b')]}, 'a')
+        self.assertRaises(ValueError, Dialog, {'a': [], 'b': []}, 'c')
+
+    def test_loop_without_expect(self):
+        self.assertRaises(ValueError, Dialog, {'a': [Send('x'), Goto('a')]}, 'a')
+        self.assertRaises(ValueError, Dialog,
+                          {'a': [Goto('b')], 'b': [Send('x'), Goto('a')]}, 'a')
+        self.assertRaises(ValueError, Dialog, {'a': [Goto('a')]}, 'a')
+        # A loop, that waits for the data, is fine
+        Dialog({'a': [Send('x'), Goto('b')], 'b': [Expect('y'), Goto('a')]}, 'a')
+
+    def test_not_a_step(self):
+        self.assertRaises(TypeError, Dialog, ['foo'])
+
+
+class RunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.t = ExpectMixin(_reactor=self.clock)
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_login(self):
+        d = self.t.run(login)
+        self.assertIsInstance(d, RunDialog)
+        self.t.expectDataReceived('Welcome\nUsername:')
+        self.assertEqual(self.t.transport.value(), 'admin\n')
+        self.t.expectDataReceived('Pass')
+        self.failIf(d.called)
+        self.t.expectDataReceived('word:')
+        self.assertEqual(self.t.transport.value(), 'admin\nsecret\n')
+        self.t.expectDataReceived('\nrouter# ')
+        self.assertIdentical(self.t.promise, None)
+        self.assertEqual(self.t._buf, ' ')
+        d.addCallback(self.assertEqual, {'prompt': '\nrouter#'})
+        return d
+
+    def test_single_chunk(self):
+        self.t._buf = 'Password:\nrouter#'
+        d = self.t.run(login)
+        self.failUnless(d.called)
+        self.assertEqual(self.t.transport.value(), 'secret\n')
+        d.addCallback(self.assertEqual, {'prompt': '\nrouter#'})
+        return d
+
+    def test_fail(self):
+        d = self.t.run(login)
+        self.t.expectDataReceived('Password:')
+        self.t.expectDataReceived('% Login invalid')
+        self.assertIdentical(self.t.promise, None)
+        def eb(fail):
+            self.assertIsInstance(fail.value, DialogFailed)
+            self.assertEqual(str(fail.value), 'Authentication failed')
+            self.assertEqual(fail.value.data, '% Login invalid')
+        return d.addErrback(eb)
+
+    def test_step_timeout(self):
+        d = self.t.run(Dialog([Expect('foo', timeout=5), Expect('bar')]), timeout=10)
+        self.clock.advance(4)
+        self.t.expectDataReceived('foo')
+        self.clock.advance(9)
+        self.failIf(d.called)
+        self.clock.advance(1)
+        self.assertIdentical(self.t.promise, None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        return self.failUnlessFailure(d, RequestTimeout)
+
+    def test_timeouts_cancelled(self):
+        d = self.t.run(Dialog([Expect('foo', timeout=5), Expect('bar')]), timeout=10)
+        self.t.expectDataReceived('foobar')
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        return d
+
+    def test_connection_loss(self):
+        d = self.t.run(login)
+        self.t.expectDataReceived('Username:')
+        self.t.transport.loseConnection()
+        return self.failUnlessFailure(d, RequestInterruptedByConnectionLoss)
+
+    def test_out_of_sequence(self):
+        self.t.run(login)
+        d = self.t.read_until('foo')
+        return self.failUnlessFailure(d, OutOfSequenceError)
+
+    def test_queued(self):
+        self.t.queue_requests = True
+        d1 = self.t.run(Dialog([Send('foo\n'), Expect('#')]))
+        d2 = self.t.read_lazy()
+        self.t.expectDataReceived('foo\n# bar')
+        d1.addCallback(self.assertEqual, {})
+        d2.addCallback(self.assertEqual, ' bar')
+        return d2
@@ -0,0 +1,210 @@
+"""
+@author: shylent
+"""
+from texpect.dialog import Dialog, Send, Expect
+from texpect.errors import RequestTimeout
+from texpect.fanout import FanOut, Progress
+from texpect.mixin import ExpectMixin
+from twisted.internet.defer import Deferred, succeed, fail
+from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.protocol import Protocol, ServerFactory
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+
+
+class FakeFanOut(FanOut):
+    r"""Creates the sessions on top of string transports."""
+
+    refused = ()
+
+    def __init__(self, *args, **kwargs):
+        FanOut.__init__(self, *args, **kwargs)
+        self.sessions = {}
+
+    def _connect(self, host, port):
+        if host in self.refused:
+            return fail(ConnectionRefusedError(host))
+        session = ExpectMixin(timeout=self.timeout, _reactor=self._reactor)
+        session.transport = StringTransportWithDisconnection()
+        session.transport.protocol = session
+        self.sessions[host] = session
+        return succeed(session)
+
+
+class FanOutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.results = []
+        self.pending = {}
+
+    def on_result(self, host, success, result):
+        self.results.append((host, success, result))
+
+    def wait(self, session):
+        d = Deferred()
+        self.pending[session] = d
+        return d
+
+    def fan_out(self, func, hosts, **kwargs):
+        return FakeFanOut(func, hosts, on_result=self.on_result,
+                          _reactor=self.clock, **kwargs)
+
+    def test_results(self):
+        run = self.fan_out(lambda session: session.write('foo'), ['a', 'b'])
+        d = run.start()
+        self.assertEqual([(host, success) for host, success, result in self.results],
+                         [('a', True), ('b', True)])
+        self.assertTrue(run.sessions['a'].eof)
+        self.assertEqual(run.sessions['a'].transport.value(), 'foo')
+        d.addCallback(self.assertIdentical, run.progress)
+        return d
+
+    def test_concurrency(self):
+        run = self.fan_out(self.wait, ['a', 'b', 'c'], concurrency=2)
+        d = run.start()
+        self.assertEqual(sorted(run.sessions), ['a', 'b'])
+        self.pending[run.sessions['b']].callback('b done')
+        self.assertEqual(self.results, [('b', True, 'b done')])
+        self.assertEqual(sorted(run.sessions), ['a', 'b', 'c'])
+        self.assertEqual(run.progress.active, 2)
+        self.assertFalse(d.called)
+        self.pending[run.sessions['a']].callback(None)
+        self.pending[run.sessions['c']].callback(None)
+        self.assertTrue(d.called)
+        return d
+
+    def test_rate(self):
+        run = self.fan_out(lambda session: None, ['a', 'b', 'c'], rate=2)
+        d = run.start()
+        self.assertEqual(sorted(run.sessions), ['a'])
+        self.clock.advance(0.5)
+        self.assertEqual(sorted(run.sessions), ['a', 'b'])
+        self.clock.advance(0.25)
+        self.assertEqual(sorted(run.sessions), ['a', 'b'])
+        self.clock.advance(0.25)
+        self.assertEqual(sorted(run.sessions), ['a', 'b', 'c'])
+        self.assertTrue(d.called)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        return d
+
+    def test_failures(self):
+        run = self.fan_out(lambda session: session.read_until('#'), ['a', 'b', 'c'],
+                           timeout=5)
+        run.refused = ('b',)
+        d = run.start()
+        self.assertEqual([host for host, success, result in self.results], ['b'])
+        self.results[0][2].trap(ConnectionRefusedError)
+        run.sessions['c'].expectDataReceived('router#')
+        self.clock.advance(5)
+        self.assertEqual([(host, success) for host, success, result in self.results],
+                         [('b', False), ('c', True), ('a', False)])
+        self.results[2][2].trap(RequestTimeout)
+        self.assertEqual((run.progress.succeeded, run.progress.failed), (1, 2))
+        return d
+
+    def test_dialog(self):
+        run = self.fan_out(Dialog([Send('\n'), Expect('#', save='prompt')]), ['a'])
+        run.start()
+        run.sessions['a'].expectDataReceived('router#')
+        self.assertEqual(self.results, [('a', True, {'prompt': 'router#'})])
+
+    def test_lazy_hosts(self):
+        taken = []
+        def hosts():
+            for host in ['a', 'b', 'c']:
+                taken.append(host)
+                yield host
+        run = self.fan_out(self.wait, hosts(), concurrency=1)
+        d = run.start()
+        self.assertEqual(taken, ['a'])
+        self.assertIdentical(run.progress.total, None)
+        self.pending[run.sessions['a']].callback(None)
+        self.assertEqual(taken, ['a', 'b'])
+        self.pending[run.sessions['b']].callback(None)
+        self.pending[run.sessions['c']].callback(None)
+        self.assertEqual(run.progress.total, 3)
+        return d
+
+    def test_ports(self):
+        ports = []
+        class PortFanOut(FakeFanOut):
+            def _connect(self, host, port):
+                ports.append(port)
+                return FakeFanOut._connect(self, host, port)
+        run = PortFanOut(lambda session: None, ['a', ('b', 2323)], port=24,
+                         _reactor=self.clock)
+        run.start()
+        self.assertEqual(ports, [24, 2323])
+
+    def test_stop(self):
+        run = self.fan_out(self.wait, ['a', 'b', 'c'], concurrency=1)
+        d = run.start()
+        run.stop()
+        self.assertFalse(d.called)
+        self.pending[run.sessions['a']].callback(None)
+        self.assertEqual(sorted(run.sessions), ['a'])
+        self.assertEqual(run.progress.total, 1)
+        return d
+
+    def test_result_handler_error(self):
+        def on_result(host, success, result):
+            raise ValueError()
+        run = FakeFanOut(lambda session: None, ['a', 'b'], on_result=on_result,
+                         _reactor=self.clock)
+        d = run.start()
+        self.assertEqual(run.progress.succeeded, 2)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 2)
+        return d
+
+    def test_no_hosts(self):
+        d = self.fan_out(lambda session: None, []).start()
+        d.addCallback(lambda progress: self.assertEqual(str(progress),
+                                                        '0/0 finished (0 failed), 0 in progress'))
+        return d
+
+
+class ProgressTestCase(unittest.TestCase):
+
+    def test_str(self):
+        progress = Progress()
+        progress.started = 5
+        progress.succeeded = 2
+        progress.failed = 1
+        self.assertEqual(str(progress), '3/? finished (1 failed), 2 in progress')
+
+
+class PromptServer(Protocol):
+
+    def connectionMade(self):
+        self.transport.write('router#')
+
+    def dataReceived(self, data):
+        self.transport.write(data + 'router#')
+
+
+class TelnetFanOutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from twisted.internet import reactor
+        factory = ServerFactory()
+        factory.protocol = PromptServer
+        self.port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.addCleanup(self.port.stopListening)
+
+    def test_telnet(self):
+        results = []
+        def command(session):
+            d = session.read_until('#')
+            d.addCallback(lambda ign: session.write('show'))
+            d.addCallback(lambda ign: session.read_until('#'))
+            return d
+        port = self.port.getHost().port
+        hosts = [('127.0.0.1', port)] * 20
+        run = FanOut(command, hosts, concurrency=5, timeout=5,
+                     on_result=lambda host, success, result: results.append((success, result)))
+        d = run.start()
+        d.addCallback(lambda progress: self.assertEqual(progress.succeeded, 20))
+        d.addCallback(lambda ign: self.assertEqual(results, [(True, 'showrouter#')] * 20))
+        return d
@@ -0,0 +1,163 @@
+"""
+@author: shylent
+"""
+from texpect.filters import StripANSI, NormalizeNewlines, ApplyBackspaces, Pipeline
+from texpect.mixin import ExpectMixin
+from texpect.transcript import MemoryTranscript
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+
+
+class FilterTestCase(unittest.TestCase):
+
+    def run_filter(self, factory, chunks):
+        f = factory()
+        return b''.join(f.feed(chunk) for chunk in chunks) + f.flush()
+
+    def check(self, factory, data, expected):
+        r"""The result must not depend on how the data is chunked."""
+        self.assertEqual(self.run_filter(factory, [data]), expected)
+        for i in range(len(data) + 1):
+            self.assertEqual(self.run_filter(factory, [data[:i], data[i:]]), expected,
+                             (data[:i], data[i:]))
+        self.assertEqual(self.run_filter(factory, [data[i:i + 1] for i in range(len(data))]),
+                         expected)
+
+
+class StripANSITestCase(FilterTestCase):
+
+    def test_plain(self):
+        f = StripANSI()
+        data = b'no escapes here'
+        self.assertIdentical(f.feed(data), data)
+
+    def test_csi(self):
+        self.check(StripANSI, b'\x1b[1;31mred\x1b[0m \x1b[2J\x1b[?25lrouter#',
+                   b'red router#')
+
+    def test_strings(self):
+        self.check(StripANSI, b'\x1b]0;title\x07a\x1b]2;other\x1b\\b\x1bPdcs\x1b\\c', b'abc')
+
+    def test_other(self):
+        self.check(StripANSI, b'\x1b(Bx\x1b=y\x1b7z\x1b8', b'xyz')
+
+    def test_incomplete_at_the_end(self):
+        f = StripANSI()
+        self.assertEqual(f.feed(b'abc\x1b[3'), b'abc')
+        self.assertEqual(f.feed(b'1mdef'), b'def')
+        self.assertEqual(f.feed(b'\x1b'), b'')
+        self.assertEqual(f.flush(), b'\x1b')
+
+    def test_garbage(self):
+        f = StripANSI()
+        f.max_pending = 8
+        self.assertEqual(f.feed(b'\x1b]' + b'x' * 10), b'\x1b]' + b'x' * 10)
+
+
+class NormalizeNewlinesTestCase(FilterTestCase):
+
+    def test_newlines(self):
+        self.check(NormalizeNewlines, b'a\r\nb\r\r\nc\nd\re\r', b'a\nb\nc\nd\re\r')
+
+    def test_lone_cr(self):
+        self.check(lambda: NormalizeNewlines(lone_cr=b'\n'), b'a\r\nb\rc\r\r', b'a\nb\nc\n\n')
+
+    def test_held_back(self):
+        f = NormalizeNewlines()
+        self.assertEqual(f.feed(b'line\r'), b'line')
+        self.assertEqual(f.feed(b'\nnext'), b'\nnext')
+
+
+class ApplyBackspacesTestCase(unittest.TestCase):
+
+    def test_backspaces(self):
+        f = ApplyBackspaces()
+        self.assertEqual(f.feed(b'_\bx_\by\n'), b'xy\n')
+        self.assertEqual(f.feed(b'--More--\b\b\b\b\b\b\b\b        \b\b\b\b\b\b\b\bnext\n'),
+                         b'next\n')
+        self.assertEqual(f.feed(b'line\n\b\bnext'), b'line\n')
+        self.assertEqual(f.flush(), b'next')
+
+    def test_previous_chunk(self):
+        f = ApplyBackspaces()
+        self.assertEqual(f.feed(b'abc'), b'abc')
+        self.assertEqual(f.feed(b'\b\bd'), b'')
+        self.assertEqual(f.flush(), b'd')
+
+    def test_split_overstrike(self):
+        data = b'a_\bb_\bc\nnext'
+        for i in range(3, len(data) + 1):
+            f = ApplyBackspaces()
+            self.assertEqual(f.feed(data[:i]) + f.feed(data[i:]) + f.flush(),
+                             b'abc\nnext', (data[:i], data[i:]))
+        f = ApplyBackspaces()
+        self.assertEqual(f.feed(b'a_\bb_'), b'')
+        self.assertEqual(f.feed(b'\bc\nnext'), b'abc\nnext')
+
+    def test_split_redraw(self):
+        f = ApplyBackspaces()
+        self.assertEqual(f.feed(b'line\n--More--'), b'line\n--More--')
+        self.assertEqual(f.feed(b'\b' * 8 + b' ' * 8 + b'\b' * 3), b'')
+        self.assertEqual(f.feed(b'\b' * 5 + b'next\nprompt#'), b'next\nprompt#')
+
+    def test_max_pending(self):
+        f = ApplyBackspaces()
+        f.max_pending = 3
+        self.assertEqual(f.feed(b'x\bab'), b'')
+        self.assertEqual(f.feed(b'cd'), b'abcd')
+        self.assertEqual(f.feed(b'\be'), b'')
+        self.assertEqual(f.flush(), b'e')
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def test_pipeline(self):
+        p = Pipeline([StripANSI(), NormalizeNewlines()])
+        self.assertEqual(p.feed(b'\x1b[1mbold\x1b[0m\r'), b'bold')
+        self.assertEqual(p.feed(b'\x1b[0m'), b'')
+        self.assertEqual(p.feed(b'\nnext\x1b['), b'\nnext')
+        self.assertEqual(p.flush(), b'\x1b[')
+
+    def test_flush(self):
+        p = Pipeline([NormalizeNewlines(), StripANSI()])
+        self.assertEqual(p.feed(b'a\x1b'), b'a')
+        self.assertEqual(p.feed(b'\r'), b'')
+        self.assertEqual(p.flush(), b'\x1b\r')
+
+
+class FilteredSession(ExpectMixin):
+
+    filters = (StripANSI, NormalizeNewlines)
+
+
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = FilteredSession(_reactor=Clock(), transcript=MemoryTranscript())
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_filtered(self):
+        d = self.t.read_until('\nrouter#')
+        self.t.expectDataReceived(b'\x1b[32mok\x1b[0m\r\r')
+        self.t.expectDataReceived(b'\n\x1b[1mrouter\x1b[0m#')
+        d.addCallback(self.assertEqual, 'ok\nrouter#')
+        d.addCallback(lambda ign: self.assertEqual(
+            self.t._debug_buf, b'\x1b[32mok\x1b[0m\r\r\n\x1b[1mrouter\x1b[0m#'))
+        return d
+
+    def test_independent(self):
+        other = FilteredSession(_reactor=Clock())
+        self.t.expectDataReceived(b'a\x1b[')
+        self.assertEqual(other.pipeline.filters[0]._pending, b'')
+
+    def test_no_filters(self):
+        self.assertIdentical(ExpectMixin().pipeline, None)
+
+    def test_connection_lost(self):
+        d = self.t.read_all()
+        self.t.expectDataReceived(b'end\r')
+        self.t.connectionLost('bye')
+        d.addCallback(self.assertEqual, 'end\r')
+        return d
@@ -0,0 +1,352 @@
+'''
+@author: shylent
+'''
+from texpect import matching
+from twisted.trial import unittest
+import re
+
+
+class LookbackTestCase(unittest.TestCase):
+
+    def test_literal(self):
+        self.assertEqual(matching.lookback(re.compile('Password:')), 8)
+        self.assertEqual(matching.lookback(re.compile('#')), 0)
+
+    def test_bounded(self):
+        self.assertEqual(matching.lookback(re.compile('ab?[cd]{2,3}')), 4)
+        self.assertEqual(matching.lookback(re.compile('(foo|quux)$')), 3)
+
+    def test_lookbehind(self):
+        self.assertEqual(matching.lookback(re.compile('(?<=foo)bar')), 5)
+        self.assertEqual(matching.lookback(re.compile('(?<!a)b')), 1)
+
+    def test_boundary(self):
+        self.assertEqual(matching.lookback(re.compile(r'\bfoo')), 3)
+        self.assertEqual(matching.lookback(re.compile(r'x\B')), 1)
+
+    def test_beginning(self):
+        self.assertIdentical(matching.lookback(re.compile('^#')), None)
+        self.assertIdentical(matching.lookback(re.compile('^#', re.M)), None)
+        self.assertIdentical(matching.lookback(re.compile(r'\Alogin')), None)
+
+    def test_unbounded(self):
+        self.assertIdentical(matching.lookback(re.compile(r'\S+[#>] ?$')), None)
+        self.assertIdentical(matching.lookback(re.compile(r'(a)\1')), None)
+        self.assertIdentical(matching.lookback(re.compile('foo(?=bar)')), None)
+
+
+def naive_search(patterns, string):
+    for index, pattern in enumerate(patterns):
+        match = pattern.search(string)
+        if match:
+            return index, match
+
+
+class ContextTestCase(unittest.TestCase):
+
+    def test_context(self):
+        self.assertEqual(matching.context(re.compile('foo$')), 0)
+        self.assertEqual(matching.context(re.compile(r'\bfoo')), 1)
+        self.assertEqual(matching.context(re.compile('(?<=ab)c|(?<!d)e')), 2)
+        self.assertIdentical(matching.context(re.compile('x|^y')), None)
+
+
+class PatternSetTestCase(unittest.TestCase):
+
+    def assertSameResult(self, pattern_set, string):
+        found = pattern_set.search(string)
+        expected = naive_search(pattern_set.patterns, string)
+        if expected is None:
+            self.assertIdentical(found, None)
+        else:
+            self.assertEqual(found[0], expected[0])
+            self.assertEqual(found[1].span(), expected[1].span())
+            self.assertEqual(found[1].groups(), expected[1].groups())
+            self.assertIdentical(found[1].re, expected[1].re)
+
+    def test_combined(self):
+        ps = matching.PatternSet([re.compile('fo+'), re.compile('b(a)r')])
+        self.failIfIdentical(ps._combined, None)
+        for string in ('foobar', 'barfoo', 'bar', 'baz', ''):
+            self.assertSameResult(ps, string)
+
+    def test_list_order(self):
+        ps = matching.PatternSet([re.compile('bar'), re.compile('foo'),
+                                  re.compile('o+b')])
+        found = ps.search('foobar')
+        self.assertEqual((found[0], found[1].span()), (0, (3, 6)))
+        for string in ('foobar', 'foob', 'oobfoo', 'xfoo'):
+            self.assertSameResult(ps, string)
+
+    def test_offsets(self):
+        ps = matching.PatternSet([re.compile('foo'), re.compile('bar')])
+        found = ps.search('foobarfoo', [1, 1])
+        self.assertEqual((found[0], found[1].span()), (0, (6, 9)))
+        found = ps.search('foobar', [1, 1])
+        self.assertEqual((found[0], found[1].span()), (1, (3, 6)))
+
+    def test_not_combined(self):
+        ps = matching.PatternSet([re.compile(r'(a)\1'), re.compile('b')])
+        self.assertIdentical(ps._combined, None)
+        self.assertSameResult(ps, 'baa')
+        ps = matching.PatternSet([re.compile('A', re.I), re.compile('b')])
+        self.assertIdentical(ps._combined, None)
+        self.assertSameResult(ps, 'ba')
+
+    def test_many_groups(self):
+        ps = matching.PatternSet([re.compile('(%d)' % i) for i in range(60)])
+        for string in ('59', '1', 'x'):
+            self.assertSameResult(ps, string)
+
+    def test_verbose(self):
+        ps = matching.PatternSet([re.compile('fo+ # comment', re.X),
+                                  re.compile('ba?r', re.X)])
+        self.failIfIdentical(ps._combined, None)
+        self.assertSameResult(ps, 'xbar')
+
+
+class LiteralTestCase(unittest.TestCase):
+
+    def test_literal(self):
+        self.assertEqual(matching.literal(re.compile('Password:')), 'Password:')
+        self.assertEqual(matching.literal(re.compile(r'\-\-More\-\-')), '--More--')
+        self.assertEqual(matching.literal(re.compile(u'#')), u'#')
+        self.assertIsInstance(matching.literal(re.compile(u'#')), unicode)
+
+    def test_not_literal(self):
+        self.assertIdentical(matching.literal(re.compile('a.c')), None)
+        self.assertIdentical(matching.literal(re.compile('#$')), None)
+        self.assertIdentical(matching.literal(re.compile('abc', re.I)), None)
+        self.assertIdentical(matching.literal(re.compile('')), None)
+
+
+class AhoCorasickTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ac = matching.AhoCorasick([(0, 'he'), (1, 'she'), (2, 'his'), (3, 'hers')])
+
+    def test_scan(self):
+        scan = matching.ScanState()
+        self.assertEqual(self.ac.scan('ushers', scan, 4), (0, 4))
+
+    def test_bound(self):
+        scan = matching.ScanState()
+        self.assertEqual(self.ac.scan('ushers', scan, 0), None)
+        self.assertEqual(scan.pos, 6)
+        scan = matching.ScanState()
+        self.assertEqual(self.ac.scan('hishe', matching.ScanState(), 2), (0, 5))
+
+    def test_streaming(self):
+        scan = matching.ScanState()
+        data = ''
+        for chunk in ('us', 'h'):
+            data += chunk
+            self.assertIdentical(self.ac.scan(data, scan, 4), None)
+            self.assertEqual(scan.pos, len(data))
+        self.assertNotEqual(scan.state, 0)
+        data += 'ers'
+        self.assertEqual(self.ac.scan(data, scan, 4), (0, 4))
+        self.assertEqual(scan.pos, 4)
+
+
+    def test_first_string_skipped(self):
+        # 'he' has the lowest index, the automaton is left in the state, that
+        # it would be in after stepping through the occurrence
+        scan = matching.ScanState()
+        self.assertEqual(self.ac.scan('xxhe', scan, 4), (0, 4))
+        goto = self.ac._goto
+        self.assertEqual((scan.pos, scan.state), (4, goto[goto[0]['h']]['e']))
+        # The scan carries on from that state
+        self.assertEqual(self.ac.scan('xxhers', scan, 4), (3, 6))
+
+    def test_first_string_inside_another(self):
+        ac = matching.AhoCorasick([(0, 'bc'), (1, 'abcd')])
+        self.assertEqual(ac.scan('xabcd', matching.ScanState(), 2), (0, 4))
+
+
+class MixedPatternSetTestCase(PatternSetTestCase):
+
+    def test_literals_and_regexes(self):
+        ps = matching.PatternSet([re.compile('Password:'), re.compile(r'\S+[#>] ?$'),
+                                  re.compile('--More--')])
+        self.assertEqual(ps._regexes, [1])
+        for string in ('login: ', 'router# ', 'Password:', 'foo --More--',
+                       '--More-- router#', 'router# Password:x'):
+            self.assertSameResult(ps, string)
+
+    def test_exhaustive(self):
+        patterns = [re.compile(p) for p in ('ab', 'b+a', 'ba', 'a', 'bb')]
+        ps = matching.PatternSet(patterns)
+        strings = ['']
+        for length in range(5):
+            strings = [s + c for s in strings for c in 'abc']
+            for string in strings:
+                self.assertSameResult(ps, string)
+
+    def test_exhaustive_incremental(self):
+        ps = matching.PatternSet([re.compile(p) for p in ('aba', 'ca', 'ab', 'bc')])
+        strings = ['']
+        for length in range(6):
+            strings = [s + c for s in strings for c in 'abc']
+            for string in strings:
+                scan = ps.scan()
+                for end in range(len(string) + 1):
+                    found = ps.search(string[:end], scan=scan)
+                    if found:
+                        break
+                expected = naive_search(ps.patterns, string[:end])
+                if expected is None:
+                    self.assertIdentical(found, None)
+                else:
+                    self.assertEqual((found[0], found[1].span()),
+                                     (expected[0], expected[1].span()))
+
+    def test_incremental(self):
+        ps = matching.PatternSet([re.compile('Password:'), re.compile('--More--')])
+        scan = ps.scan()
+        data = 'foo --Mo'
+        self.assertIdentical(ps.search(data, scan=scan), None)
+        data += 're-- Pass'
+        found = ps.search(data, scan=scan)
+        self.assertEqual((found[0], found[1].span()), (1, (4, 12)))
+
+    def test_start(self):
+        ps = matching.PatternSet([re.compile('Password:'), re.compile(r'\S+#')])
+        self.assertEqual(ps.start(), 0)
+        self.assertEqual(ps.start([5, 3]), 3)
+        scan = ps.scan()
+        ps.search('login: ', scan=scan)
+        self.assertEqual(ps.start([7, 7], scan), 7)
+        self.assertEqual(ps.start([7, 2], scan), 2)
+
+
+class TailPatternSetTestCase(unittest.TestCase):
+
+    def test_end_only(self):
+        ps = matching.TailPatternSet([re.compile(r'\S+#'), re.compile('>')], 16)
+        self.assertEqual(ps.search('router# show\n'), None)
+        index, match = ps.search('router# show\nrouter#')
+        self.assertEqual((index, match.group(), match.start()), (0, 'router#', 13))
+        self.assertEqual(ps.search('a#\nb>')[0], 1)
+
+    def test_tail(self):
+        ps = matching.TailPatternSet([re.compile('x+#')], 4)
+        index, match = ps.search('xxxxxx#')
+        self.assertEqual(match.group(), 'xxx#')
+        self.assertEqual(ps.start(length=100), 96)
+        self.assertEqual(ps.start(length=2), 0)
+
+    def test_alternation(self):
+        ps = matching.TailPatternSet([re.compile('a#|b>')], 16)
+        self.assertEqual(ps.search('a# c'), None)
+        self.assertEqual(ps.search('c b>')[1].group(), 'b>')
+
+    def test_verbose(self):
+        ps = matching.TailPatternSet([re.compile('a\\# # the prompt', re.VERBOSE)], 16)
+        self.assertEqual(ps.search('xa#')[1].group(), 'a#')
+
+    def test_compile_prompts(self):
+        ps = matching.compile_prompts(['#'], 16)
+        self.assertIsInstance(ps, matching.TailPatternSet)
+        self.assertIdentical(matching.compile_prompts(['#'], 16), ps)
+        self.failIfIdentical(matching.compile_prompts(['#'], 32), ps)
+        self.failIfIdentical(matching.compile_patterns(['#']), ps)
+
+
+class Request(object):
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.lookbacks = list(matcher.lookbacks)
+        self.scan = matcher.scan()
+        self.searched = 0
+        self.truncated = False
+
+
+class ReleaseTestCase(unittest.TestCase):
+
+    def test_release(self):
+        request = Request(matching.PatternSet([re.compile('foobar'), re.compile('a[0-9]b')]))
+        string = 'x' * 20 + 'foo'
+        self.assertEqual(matching.resume(string, request), None)
+        self.assertEqual(matching.release(request, len(string)), 18)
+        self.assertEqual((request.searched, request.scan.pos), (5, 5))
+        string = string[18:] + 'bar'
+        index, match = matching.resume(string, request)
+        self.assertEqual((index, match.start()), (0, 2))
+
+    def test_truncate(self):
+        request = Request(matching.PatternSet([re.compile('abcd'), re.compile('x[0-9]y')]))
+        string = 'xxxxab'
+        self.assertEqual(matching.resume(string, request), None)
+        matching.truncate(request, 3)
+        self.assertEqual(request.searched, 3)
+        string = string[3:] + 'cd'
+        index, match = matching.resume(string, request)
+        self.assertEqual((index, match.start()), (0, 1))
+
+    def test_truncate_partial(self):
+        request = Request(matching.PatternSet([re.compile('abcd')]))
+        self.assertEqual(matching.resume('xxabc', request), None)
+        matching.truncate(request, 3)
+        self.assertEqual(matching.resume('bcabcd', request)[1].start(), 2)
+
+    def test_context(self):
+        request = Request(matching.PatternSet([re.compile(r'\bfoo'), re.compile('a[0-9]b')]))
+        string = 'yyxfoo'
+        self.assertEqual(matching.resume(string, request), None)
+        self.assertEqual(matching.release(request, len(string)), 3)
+        self.assertTrue(request.truncated)
+        # The 'foo', that has been searched, is not at a word boundary,
+        # although the 'x' before it is gone
+        string = string[3:] + ' foo'
+        self.assertEqual(matching.resume(string, request)[1].start(), 4)
+
+    def test_floor(self):
+        request = Request(matching.PatternSet([re.compile(r'\bfoo'), re.compile('a[0-9]b')]))
+        request.truncated = True
+        # The data before 'foo' is gone, it can not be told, whether there is
+        # a word boundary
+        self.assertEqual(matching.resume('foo a1b', request)[0], 1)
+
+    def test_unbounded(self):
+        request = Request(matching.PatternSet([re.compile('a.*b')]))
+        self.assertEqual(matching.resume('x' * 20, request), None)
+        self.assertEqual(matching.release(request, 20), 0)
+        self.assertEqual(request.searched, 20)
+
+
+class CompilePatternsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        matching._pattern_sets.clear()
+        self.addCleanup(matching.set_cache_size, matching._pattern_sets.size)
+
+    def test_cached(self):
+        ps = matching.compile_patterns(['foo', re.compile('bar')])
+        self.assertEqual([p.pattern for p in ps.patterns], ['foo', 'bar'])
+        self.assertIdentical(matching.compile_patterns(['foo', 'bar']), ps)
+        self.failIfIdentical(matching.compile_patterns(['foo', re.compile('bar', re.I)]), ps)
+
+    def test_cache_size(self):
+        matching.set_cache_size(2)
+        ps = matching.compile_patterns(['foo'])
+        matching.compile_patterns(['bar'])
+        self.assertIdentical(matching.compile_patterns(['foo']), ps)
+        matching.compile_patterns(['baz'])
+        matching.compile_patterns(['spam'])
+        self.failIfIdentical(matching.compile_patterns(['foo']), ps)
+
+    def test_least_recently_used(self):
+        matching.set_cache_size(2)
+        ps = matching.compile_patterns(['foo'])
+        matching.compile_patterns(['bar'])
+        matching.compile_patterns(['foo'])
+        matching.compile_patterns(['baz'])
+        self.assertIdentical(matching.compile_patterns(['foo']), ps)
+
+    def test_string_types(self):
+        ps = matching.compile_patterns(['foo'])
+        self.failIfIdentical(matching.compile_patterns([u'foo']), ps)
+        self.assertIdentical(matching.compile_patterns([re.compile(u'foo')]),
+                             matching.compile_patterns([u'foo']))
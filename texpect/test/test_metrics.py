@@ -0,0 +1,197 @@
+"""
+@author: shylent
+"""
+from texpect.errors import RequestTimeout, OutOfSequenceError
+from texpect.metrics import SessionObserver, Histogram, Metrics
+from texpect.mixin import ExpectMixin
+from twisted.internet.defer import gatherResults
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+
+
+class RecordingObserver(SessionObserver):
+
+    def __init__(self):
+        self.events = []
+
+    def requestStarted(self, session, kind):
+        self.events.append(('started', kind))
+
+    def requestFinished(self, session, kind, duration, error):
+        self.events.append(('finished', kind, duration, error))
+
+    def dataReceived(self, session, size):
+        self.events.append(('received', size))
+
+    def bytesScanned(self, session, size):
+        self.events.append(('scanned', size))
+
+    def bufferGrew(self, session, size):
+        self.events.append(('buffer', size))
+
+    def connectionLost(self, session, reason):
+        self.events.append(('lost', reason))
+
+
+class ObserverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.observer = RecordingObserver()
+        self.t = ExpectMixin(_reactor=self.clock)
+        self.t.observer = self.observer
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_expect(self):
+        d = self.t.read_until('foo')
+        self.clock.advance(2)
+        self.t.expectDataReceived('xx')
+        self.t.expectDataReceived('xfoo')
+        self.assertEqual(self.observer.events, [
+            ('started', 'read_until'),
+            ('received', 2), ('buffer', 2), ('scanned', 2),
+            ('received', 4), ('buffer', 6), ('scanned', 4),
+            ('finished', 'read_until', 2, None)])
+        d.addCallback(self.assertEqual, 'xxxfoo')
+        return d
+
+    def test_immediate(self):
+        self.t.expectDataReceived('foo')
+        del self.observer.events[:]
+        d = self.t.expect(['foo'])
+        self.assertEqual(self.observer.events, [
+            ('started', 'expect'), ('scanned', 3), ('finished', 'expect', 0, None)])
+        d.addCallback(lambda res: self.assertEqual(res[2], 'foo'))
+        return d
+
+    def test_buffer_high_water(self):
+        self.t.expectDataReceived('foo')
+        self.t.read_lazy()
+        self.t.expectDataReceived('ba')
+        self.t.expectDataReceived('r')
+        self.assertEqual([e for e in self.observer.events if e[0] == 'buffer'],
+                         [('buffer', 3)])
+
+    def test_timeout(self):
+        d = self.t.read_until('foo', timeout=3)
+        self.clock.advance(3)
+        self.assertEqual(self.observer.events[-1],
+                         ('finished', 'read_until', 3, RequestTimeout))
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_out_of_sequence(self):
+        self.t.read_until('foo')
+        d = self.t.write('bar')
+        self.assertIn(('finished', 'write', 0, OutOfSequenceError), self.observer.events)
+        return self.assertFailure(d, OutOfSequenceError)
+
+    def test_connection_lost(self):
+        d = self.t.read_all()
+        self.t.expectDataReceived('foo')
+        self.t.connectionLost('bye')
+        self.assertEqual(self.observer.events[-2:], [
+            ('lost', 'bye'), ('finished', 'read_all', 0, None)])
+        d.addCallback(self.assertEqual, 'foo')
+        return d
+
+    def test_queued(self):
+        self.t.queue_requests = True
+        self.t.read_until('foo')
+        d = self.t.read_until('bar')
+        self.clock.advance(1)
+        self.t.expectDataReceived('foobar')
+        finished = [e for e in self.observer.events if e[0] == 'finished']
+        self.assertEqual(finished, [('finished', 'read_until', 1, None)] * 2)
+        d.addCallback(self.assertEqual, 'bar')
+        return d
+
+    def test_broken_observer(self):
+        def broken(*args):
+            raise ZeroDivisionError()
+        self.observer.requestFinished = broken
+        self.t.expectDataReceived('foo')
+        d = self.t.read_until('foo')
+        d.addCallback(self.assertEqual, 'foo')
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+        return d
+
+    def test_observer_broken_everywhere(self):
+        names = ('requestStarted', 'requestFinished', 'dataReceived',
+                 'bytesScanned', 'bufferGrew', 'connectionLost')
+        called = set()
+        def broken(name):
+            def raiser(*args):
+                called.add(name)
+                raise ZeroDivisionError()
+            return raiser
+        for name in names:
+            setattr(self.observer, name, broken(name))
+        self.t.expectDataReceived('foo')
+        d = self.t.read_until('foo')
+        d.addCallback(self.assertEqual, 'foo')
+        d2 = self.t.read_all()
+        self.t.expectDataReceived('bar')
+        self.t.connectionLost('bye')
+        d2.addCallback(self.assertEqual, 'bar')
+        self.assertEqual(called, set(names))
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 9)
+        return gatherResults([d, d2])
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = Histogram(smallest=1, factor=2, buckets=4)
+        self.assertEqual(h.percentile(0.5), None)
+        for value in [0.5] * 50 + [3] * 40 + [6] * 9 + [100]:
+            h.add(value)
+        self.assertEqual(h.counts, [50, 0, 40, 9, 1])
+        self.assertEqual(h.percentile(0.5), 1)
+        self.assertEqual(h.percentile(0.9), 4)
+        self.assertEqual(h.percentile(0.99), 8)
+        self.assertEqual(h.percentile(1), 100)
+        summary = h.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['mean'], 2.99)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.metrics = Metrics()
+        self.sessions = []
+        for i in range(2):
+            t = ExpectMixin(_reactor=self.clock)
+            t.observer = self.metrics
+            t.transport = StringTransportWithDisconnection()
+            t.transport.protocol = t
+            self.sessions.append(t)
+
+    def test_aggregate(self):
+        a, b = self.sessions
+        d1 = a.read_until('#')
+        d2 = b.read_until('#', timeout=5)
+        a.expectDataReceived('router#')
+        b.expectDataReceived('switch')
+        self.assertEqual(self.metrics.active, 1)
+        self.clock.advance(5)
+        a.connectionLost()
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['started'], {'read_until': 2})
+        self.assertEqual(snapshot['finished'], {'read_until': 2})
+        self.assertEqual(snapshot['active'], 0)
+        self.assertEqual(snapshot['errors'], {'RequestTimeout': 1})
+        self.assertEqual(snapshot['durations']['read_until']['count'], 2)
+        self.assertEqual(snapshot['durations']['read_until']['max'], 5)
+        self.assertEqual(snapshot['bytes_received'], 13)
+        self.assertEqual(snapshot['bytes_scanned'], 13)
+        self.assertEqual(snapshot['match_attempts'], 2)
+        self.assertEqual(snapshot['peak_buffer'], 7)
+        self.assertEqual(snapshot['connections_lost'], 1)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot()['started'], {})
+        return self.assertFailure(d2, RequestTimeout).addCallback(lambda ign: d1)
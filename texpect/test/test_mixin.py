@@ -1,12 +1,18 @@
 """
 @author: shylent
 """
+from texpect import dialog
 from texpect.errors import (EOFReached, OutOfSequenceError,
-    ConnectionAlreadyClosed, RequestInterruptedByConnectionLoss, RequestTimeout)
-from texpect.mixin import Expect, ExpectMixin
+    ConnectionAlreadyClosed, RequestInterruptedByConnectionLoss, RequestTimeout,
+    RequestCancelled, BufferLimitExceeded)
+from texpect.mixin import Expect, ExpectMixin, ExpectPrompt, ReadStream, ReadUntil
 from twisted.internet import reactor
-from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransport, \
+    StringTransportWithDisconnection
 from twisted.trial import unittest
+from StringIO import StringIO
 import re
 
 
@@ -292,6 +298,274 @@ class ReadUntilTestCase(unittest.TestCase):
         self.failUnlessFailure(d2, OutOfSequenceError)
         
 
+class ScanCounter(object):
+
+    def __init__(self):
+        self.scanned = []
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+    def bytesScanned(self, session, size):
+        self.scanned.append(size)
+
+
+class ExpectPromptTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin(_reactor=Clock())
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_prompt(self):
+        d = self.t.expect_prompt(re.compile(r'\S+# ?'))
+        self.assertIsInstance(d, ExpectPrompt)
+        self.t.expectDataReceived('show run\r\nhostname router#\r\n')
+        self.assertIdentical(self.t.promise, d)
+        self.t.expectDataReceived('echoed\r\nrouter# ')
+        def check(res):
+            self.assertEqual((res[0], res[1].group()), (0, 'router# '))
+            self.assertEqual(res[2], 'show run\r\nhostname router#\r\nechoed\r\nrouter# ')
+        return d.addCallback(check)
+
+    def test_immediate(self):
+        self.t._buf = 'banner router#'
+        d = self.t.expect_prompt(['>', '#'])
+        self.assertIdentical(self.t.promise, None)
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (1, 'banner router#')))
+        return d
+
+    def test_not_immediate(self):
+        self.t._buf = 'router# more'
+        d = self.t.expect_prompt('#')
+        self.assertIdentical(self.t.promise, d)
+        self.t.expectDataReceived('\nrouter#')
+        d.addCallback(lambda res: self.assertEqual(res[2], 'router# more\nrouter#'))
+        return d
+
+    def test_bounded_scan(self):
+        self.t.observer = ScanCounter()
+        self.t.prompt_tail = 32
+        d = self.t.expect_prompt(re.compile('.*#'))
+        for i in range(100):
+            self.t.expectDataReceived('line %d#\n' % i)
+        self.assertEqual(max(self.t.observer.scanned), 32)
+        self.t.expectDataReceived('router#')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'router#'))
+        return d
+
+    def test_tail(self):
+        d = self.t.expect_prompt('x+#', tail=4)
+        self.t.expectDataReceived('xxxxxx#')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'xxx#'))
+        return d
+
+
+class DiscardTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.t = ExpectMixin(_reactor=self.clock)
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_result(self):
+        d = self.t.expect(['Password:', 'Login:'], keep_data=False)
+        self.t.expectDataReceived('banner\r\nLog')
+        self.t.expectDataReceived('in: rest')
+        def check(res):
+            self.assertEqual((res[0], res[1].group(), res[2]), (1, 'Login:', None))
+            self.assertEqual(self.t._buf, ' rest')
+        return d.addCallback(check)
+
+    def test_read_until(self):
+        d = self.t.read_until(re.compile('#+'), keep_data=False)
+        self.t.expectDataReceived('router## ')
+        d.addCallback(self.assertIdentical, None)
+        d.addCallback(lambda ign: self.assertEqual(self.t._buf, ' '))
+        return d
+
+    def test_immediate(self):
+        self.t._buf = 'motd\nrouter# '
+        d = self.t.expect('#', keep_data=False)
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (0, None)))
+        d.addCallback(lambda ign: self.assertEqual(self.t._buf, ' '))
+        return d
+
+    def test_released(self):
+        d = self.t.expect(['Password:', re.compile('x[0-9]{3}y')], keep_data=False)
+        for i in range(100):
+            self.t.expectDataReceived('no match here, ')
+            self.assertTrue(len(self.t._buffer) < 9, self.t._buf)
+        self.t.expectDataReceived('x1')
+        self.t.expectDataReceived('23y')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'x123y'))
+        return d
+
+    def test_unbounded(self):
+        d = self.t.expect(re.compile('a.*b'), keep_data=False)
+        self.t.expectDataReceived('x' * 100)
+        self.assertEqual(len(self.t._buffer), 100)
+        self.t.expectDataReceived('ab')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'ab'))
+        return d
+
+    def check_no_match(self, patterns, chunks):
+        d = self.t.expect(patterns, timeout=1, keep_data=False)
+        for chunk in chunks:
+            self.t.expectDataReceived(chunk)
+        self.clock.advance(1)
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_beginning(self):
+        return self.check_no_match(['^#'], ['Hit # to continue', '#'])
+
+    def test_beginning_short(self):
+        return self.check_no_match(['^b'], ['x', 'b'])
+
+    def test_boundary(self):
+        return self.check_no_match([r'\bfoo'], ['xfo', 'o'])
+
+    def test_lookbehind(self):
+        d = self.t.expect(['(?<=a)b'], keep_data=False)
+        self.t.expectDataReceived('a')
+        self.t.expectDataReceived('b')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'b'))
+        return d
+
+    def test_lookback(self):
+        self.t.lookback = 10
+        d = self.t.expect(re.compile('a.*b'), keep_data=False)
+        self.t.expectDataReceived('x' * 100)
+        self.assertEqual(len(self.t._buffer), 10)
+        self.t.expectDataReceived('a---b')
+        d.addCallback(lambda res: self.assertEqual(res[1].group(), 'a---b'))
+        return d
+
+    def test_prompt(self):
+        d = self.t.expect_prompt('#', tail=16, keep_data=False)
+        self.t.expectDataReceived('output#\n' * 100)
+        self.assertEqual(len(self.t._buffer), 16)
+        self.t.expectDataReceived('router#')
+        d.addCallback(lambda res: self.assertEqual(res[2], None))
+        return d
+
+    def test_timeout(self):
+        d = self.t.expect('Password:', timeout=1, keep_data=False)
+        self.t.expectDataReceived('x' * 100)
+        self.clock.advance(1)
+        d = self.assertFailure(d, RequestTimeout)
+        d.addCallback(lambda e: self.assertEqual(e.data, 'x' * 8))
+        return d
+
+
+class BoundedBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.t = ExpectMixin(_reactor=self.clock)
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_search_window(self):
+        self.t.search_window = 50
+        d = self.t.expect(re.compile('A.*B'))
+        for i in range(100):
+            self.t.expectDataReceived('no match here, ')
+            self.assertTrue(len(self.t._buffer) <= 50)
+        self.t.expectDataReceived('A--B')
+        def check(res):
+            self.assertEqual(res[1].group(), 'A--B')
+            self.assertEqual(len(res[2]), 54)
+            self.assertTrue(res[2].endswith('here, A--B'))
+        return d.addCallback(check)
+
+    def test_window_split_literal(self):
+        self.t.search_window = 5
+        d = self.t.expect(['abcd', 'xyz'])
+        self.t.expectDataReceived('xxxxab')
+        self.assertEqual(self.t._buf, 'xxxab')
+        self.t.expectDataReceived('cd')
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (0, 'xxxabcd')))
+        return d
+
+    def check_window(self, window, patterns, chunks):
+        self.t.search_window = window
+        d = self.t.expect(patterns, timeout=1)
+        for chunk in chunks:
+            self.t.expectDataReceived(chunk)
+        return d
+
+    def test_window_beginning(self):
+        d = self.check_window(4, ['^#'], ['abc#def', 'g'])
+        self.clock.advance(1)
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_window_boundary(self):
+        d = self.check_window(2, [r'\bfoo'], ['xfo', 'o'])
+        self.clock.advance(1)
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_window_lookbehind(self):
+        d = self.check_window(1, ['(?<!a)c', '(?<=a)b'], ['xxxa', 'c', 'ab'])
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (1, 'cab')))
+        return d
+
+    def test_window_dialog(self):
+        self.t.search_window = 10
+        d = self.t.run(dialog.Dialog([dialog.Expect('#')]))
+        self.t.expectDataReceived('x' * 100)
+        self.assertEqual(len(self.t._buffer), 10)
+        self.t.expectDataReceived('#')
+        return d
+
+    def test_max_buffer(self):
+        self.t.max_buffer = 30
+        for i in range(10):
+            self.t.expectDataReceived('%d' % i * 10)
+        self.assertEqual(self.t._buf, '7' * 10 + '8' * 10 + '9' * 10)
+        d = self.t.read_until('97')
+        self.t.expectDataReceived('97')
+        d.addCallback(self.assertEqual, '7' * 10 + '8' * 10 + '9' * 10 + '97')
+        return d
+
+    def test_max_buffer_pending(self):
+        self.t.max_buffer = 8
+        d = self.t.expect(['Password:', 'pass'])
+        self.t.expectDataReceived('xxxxxxxPass')
+        self.assertEqual(self.t._buf, 'xxxxPass')
+        self.t.expectDataReceived('word:')
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (0, 'xxxxPassword:')))
+        return d
+
+    def test_error_tail_timeout(self):
+        self.t.error_tail = 4
+        d = self.t.read_until('#', timeout=1)
+        self.t.expectDataReceived('some output')
+        self.clock.advance(1)
+        d = self.assertFailure(d, RequestTimeout)
+        d.addCallback(lambda e: self.assertEqual(e.data, 'tput'))
+        d.addCallback(lambda ign: self.assertEqual(self.t._buf, ''))
+        return d
+
+    def test_error_tail_connection_lost(self):
+        self.t.error_tail = 4
+        d = self.t.read_until('#')
+        self.t.expectDataReceived('some output')
+        self.t.transport.loseConnection()
+        d = self.assertFailure(d, RequestInterruptedByConnectionLoss)
+        d.addCallback(lambda e: self.assertEqual(e.data, 'tput'))
+        return d
+
+    def test_error_tail_closed(self):
+        self.t.error_tail = 4
+        self.t._buf = 'some output'
+        self.t.eof = True
+        d = self.assertFailure(self.t.read_until('#'), ConnectionAlreadyClosed)
+        d.addCallback(lambda e: self.assertEqual(e.data, 'tput'))
+        return d
+
+
 class WriteTestCase(unittest.TestCase):
     
     def setUp(self):
@@ -311,3 +585,421 @@ class WriteTestCase(unittest.TestCase):
         self.failUnlessTrue(d2.called)
         d1.addCallback(lambda res: self.assertEqual(res, 'foo'))
         self.failUnlessFailure(d2, OutOfSequenceError)
+
+
+class IncrementalMatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin()
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_match_spanning_chunks(self):
+        d = self.t.expect(['Password:'])
+        for chunk in ('Welcome\r\nPas', 'sw', 'ord', ':spam'):
+            self.failIf(d.called)
+            self.t.expectDataReceived(chunk)
+        self.failUnless(d.called)
+        d.addCallback(lambda res: self.assertEqual(res[2], 'Welcome\r\nPassword:'))
+        self.assertEqual(self.t._buf, 'spam')
+
+    def test_searched(self):
+        d = self.t.expect(['spam'])
+        self.assertEqual(d.searched, 0)
+        self.t.expectDataReceived('foobar')
+        self.assertEqual(d.searched, 6)
+        self.assertEqual(d.lookbacks, [3])
+
+    def test_unbounded_pattern(self):
+        d = self.t.expect([r'b\w+m'])
+        self.assertEqual(d.lookbacks, [None])
+        self.t.expectDataReceived('foob')
+        self.t.expectDataReceived('aaaa')
+        self.t.expectDataReceived('mfoo')
+        d.addCallback(lambda res: self.assertEqual(res[2], 'foobaaaam'))
+        return d
+
+    def test_instance_lookback(self):
+        self.t.lookback = 2
+        d = self.t.expect([r'b\w+m'])
+        self.assertEqual(d.lookbacks, [2])
+        self.t.expectDataReceived('foobaaaa')
+        self.t.expectDataReceived('m')
+        self.failIf(d.called)
+        self.t.expectDataReceived('baam')
+        d.addCallback(lambda res: self.assertEqual(res[2], 'foobaaaambaam'))
+        return d
+
+    def test_buffer_consumed(self):
+        self.t.expectDataReceived('foobar')
+        d = self.t.read_until('foo')
+        d.addCallback(lambda res: self.assertEqual(res, 'foo'))
+        self.assertEqual(len(self.t._buffer), 3)
+        self.assertEqual(self.t._buf, 'bar')
+
+    def test_literal_streaming(self):
+        d = self.t.expect(['Password:', '--More--', r'\S+# $'])
+        self.t.expectDataReceived('line --Mo')
+        self.t.expectDataReceived('re')
+        self.assertEqual(d.scan.pos, len('line --More'))
+        self.failIf(d.called)
+        self.t.expectDataReceived('-- router# ')
+        d.addCallback(lambda res: self.assertEqual(
+            (res[0], res[1].group(), res[2]), (1, '--More--', 'line --More--')))
+        self.assertEqual(self.t._buf, ' router# ')
+        return d
+
+
+class ReadStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin()
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_callable(self):
+        chunks = []
+        self.t._buf = 'foo'
+        d = self.t.read_all(chunks.append)
+        self.assertIsInstance(d, ReadStream)
+        self.t.expectDataReceived('bar')
+        self.t.expectDataReceived('spam')
+        self.assertEqual(chunks, ['foo', 'bar', 'spam'])
+        self.assertEqual(self.t._buf, '')
+        self.failIf(d.called)
+        self.t.transport.loseConnection()
+        d.addCallback(self.assertEqual, 10)
+        return d
+
+    def test_file(self):
+        f = StringIO()
+        d = self.t.read_all(f)
+        self.t.expectDataReceived('bar')
+        self.t.transport.loseConnection()
+        d.addCallback(self.assertEqual, 3)
+        d.addCallback(lambda ign: self.assertEqual(f.getvalue(), 'bar'))
+        return d
+
+    def test_consumer(self):
+        consumer = StringTransport()
+        d = self.t.read_all(consumer)
+        self.assertIdentical(consumer.producer, self.t.transport)
+        self.assertEqual(consumer.streaming, True)
+        self.t.expectDataReceived('bar')
+        self.t.transport.loseConnection()
+        self.assertIdentical(consumer.producer, None)
+        self.assertEqual(consumer.value(), 'bar')
+        return d
+
+    def test_closed_connection_with_data(self):
+        chunks = []
+        self.t._buf = 'foo'
+        self.t.eof = True
+        d = self.t.read_all(chunks.append)
+        self.failUnless(d.called)
+        self.assertIdentical(self.t.promise, None)
+        self.assertEqual(chunks, ['foo'])
+        d.addCallback(self.assertEqual, 3)
+        return d
+
+    def test_closed_connection_without_data(self):
+        self.t.eof = True
+        d = self.t.read_all(lambda data: None)
+        self.failUnless(d.called)
+        return self.failUnlessFailure(d, EOFReached)
+
+    def test_consumer_failure(self):
+        def consumer(data):
+            raise ValueError(data)
+        d = self.t.read_all(consumer)
+        self.t.expectDataReceived('bar')
+        self.assertIdentical(self.t.promise, None)
+        self.t.expectDataReceived('spam')
+        self.assertEqual(self.t._buf, 'spam')
+        return self.failUnlessFailure(d, ValueError)
+
+    def test_consumer_failure_resumes(self):
+        def consumer(data):
+            raise ValueError(data)
+        self.t.high_watermark = 6
+        self.t.expectDataReceived('foobarspam')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+        d = self.t.read_all(consumer)
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        return self.failUnlessFailure(d, ValueError)
+
+    def test_encoding(self):
+        chunks = []
+        self.t.encoding = 'utf-8'
+        self.t._buf = 'caf'
+        d = self.t.read_all(chunks.append)
+        self.t.expectDataReceived('\xc3')
+        self.t.expectDataReceived('\xa9!')
+        self.t.transport.loseConnection()
+        self.assertEqual(chunks, [u'caf', u'\xe9!'])
+        return d
+
+    def test_zero_copy(self):
+        chunks = []
+        self.t.zero_copy = True
+        d = self.t.read_all(chunks.append)
+        self.t.expectDataReceived('bar')
+        self.t.transport.loseConnection()
+        self.assertIsInstance(chunks[0], memoryview)
+        self.assertEqual(chunks[0].tobytes(), 'bar')
+        return d
+
+
+class FlowControlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin()
+        self.t.high_watermark = 6
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_pause_without_request(self):
+        self.t.expectDataReceived('foo')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        self.t.expectDataReceived('barspam')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+
+    def test_resume_on_consumption(self):
+        self.t.expectDataReceived('foobarspam')
+        self.t.read_until('foo')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+        self.t.read_until('s')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+
+    def test_low_watermark(self):
+        self.t.low_watermark = 1
+        self.t.expectDataReceived('foobarspam')
+        self.t.read_until('foobar')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+        self.t.read_lazy()
+        self.assertEqual(self.t.transport.producerState, 'producing')
+
+    def test_resume_for_pending_request(self):
+        self.t.low_watermark = 1
+        self.t.expectDataReceived('foobarspam')
+        self.t.read_until('foobar')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+        d = self.t.read_until('eggs')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        self.t.expectDataReceived('eggs')
+        d.addCallback(self.assertEqual, 'spameggs')
+        return d
+
+    def test_fail_while_pending(self):
+        self.t.high_watermark = 100
+        self.t.error_tail = 10
+        d = self.t.read_until('never')
+        self.t.expectDataReceived('x' * 90)
+        self.t.expectDataReceived('y' * 60)
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        self.assertIdentical(self.t.promise, None)
+        self.assertEqual(len(self.t._buffer), 0)
+        d = self.assertFailure(d, BufferLimitExceeded)
+        d.addCallback(lambda e: self.assertEqual(e.data, 'y' * 10))
+        return d
+
+    def test_fail_when_made(self):
+        self.t.expectDataReceived('foobarspam')
+        self.assertEqual(self.t.transport.producerState, 'paused')
+        d = self.t.read_until('eggs')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        return self.assertFailure(d, BufferLimitExceeded)
+
+    def test_window_while_pending(self):
+        self.t.high_watermark = 100
+        self.t.search_window = 20
+        d = self.t.read_until('end')
+        for i in range(100):
+            self.t.expectDataReceived('x' * 150)
+            self.assertEqual(self.t.transport.producerState, 'producing')
+        self.t.expectDataReceived('end')
+        return d
+
+    def test_max_buffer_while_pending(self):
+        self.t.high_watermark = 100
+        self.t.max_buffer = 120
+        d = self.t.read_until('end')
+        for i in range(100):
+            self.t.expectDataReceived('x' * 150)
+            self.assertEqual(self.t.transport.producerState, 'producing')
+        self.t.expectDataReceived('end')
+        d.addCallback(lambda data: self.assertEqual(data[-3:], 'end'))
+        return d
+
+    def test_no_pause_while_pending(self):
+        d = self.t.read_all()
+        self.t.expectDataReceived('foobarspam')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+        self.t.transport.loseConnection()
+        return d
+
+    def test_disabled(self):
+        self.t.high_watermark = None
+        self.t.expectDataReceived('foobarspam')
+        self.assertEqual(self.t.transport.producerState, 'producing')
+
+
+class QueuedRequestsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin()
+        self.t.queue_requests = True
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_dialog(self):
+        results = []
+        self.t.write('user\n')
+        self.t.read_until('Password:').addCallback(results.append)
+        self.t.write('secret\n')
+        self.t.expect(['>', '#']).addCallback(lambda res: results.append(res[0]))
+        self.t.write('show version\n')
+        d = self.t.read_until('#')
+        self.assertEqual(self.t.transport.value(), 'user\n')
+        self.t.expectDataReceived('Password:')
+        self.assertEqual(self.t.transport.value(), 'user\nsecret\n')
+        # Both of the remaining requests are satisfied by a single chunk
+        self.t.expectDataReceived('router>version 1.0\nrouter#')
+        self.assertEqual(self.t.transport.value(), 'user\nsecret\nshow version\n')
+        self.assertEqual(results, ['Password:', 0])
+        d.addCallback(self.assertEqual, 'version 1.0\nrouter#')
+        return d
+
+    def test_no_out_of_sequence(self):
+        d1 = self.t.read_until('foo')
+        d2 = self.t.read_lazy()
+        self.failIf(d2.called)
+        self.t.expectDataReceived('foobar')
+        d1.addCallback(self.assertEqual, 'foo')
+        d2.addCallback(self.assertEqual, 'bar')
+        self.assertEqual(self.t.transport.connected, True)
+        return d2
+
+    def test_callback_order(self):
+        results = []
+        d1 = self.t.read_until('foo')
+        d1.addCallback(lambda ign: self.t.read_until('baz'))
+        d1.addCallback(results.append)
+        self.t.read_until('bar').addCallback(results.append)
+        self.t.expectDataReceived('foobarbaz')
+        self.assertEqual(results, ['bar', 'baz'])
+
+    def test_cancel_on_failure(self):
+        d1 = self.t.expect(['spam'], timeout=0.1)
+        d2 = self.t.write('foo')
+        d3 = self.t.read_lazy()
+        self.failIf(d2.called)
+        d1 = self.failUnlessFailure(d1, RequestTimeout)
+        d2 = self.failUnlessFailure(d2, RequestCancelled)
+        d3 = self.failUnlessFailure(d3, RequestCancelled)
+        d3.addCallback(lambda ign: self.assertEqual(self.t.transport.value(), ''))
+        return DeferredList([d1, d2, d3], fireOnOneErrback=True)
+
+    def test_connection_loss(self):
+        self.t._buf = 'foo'
+        d1 = self.t.read_all()
+        d2 = self.t.read_lazy()
+        self.t.transport.loseConnection()
+        d1.addCallback(self.assertEqual, 'foo')
+        return self.failUnlessFailure(d2, EOFReached)
+
+
+class ImmediateMatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.t = ExpectMixin(timeout=10, _reactor=self.clock)
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+        self.t._buf = 'foo bar'
+
+    def test_expect(self):
+        d = self.t.expect(['baz', 'foo'])
+        self.assertIsInstance(d, Expect)
+        self.assertIdentical(self.t.promise, None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(self.t._buf, ' bar')
+        d.addCallback(lambda res: self.assertEqual((res[0], res[2]), (1, 'foo')))
+        return d
+
+    def test_read_until(self):
+        d = self.t.read_until('bar')
+        self.assertIsInstance(d, ReadUntil)
+        d.addCallback(self.assertEqual, 'foo bar')
+        return d
+
+    def test_not_immediate(self):
+        d = self.t.read_until('baz')
+        self.assertIdentical(self.t.promise, d)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.t.expectDataReceived(' baz')
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        d.addCallback(self.assertEqual, 'foo bar baz')
+        return d
+
+    def test_expecting(self):
+        d = self.t.expect(['baz'])
+        self.assertEqual([p.pattern for p in d.expecting], ['baz'])
+        self.assertEqual(str(d), "Expect: 'baz'")
+        self.t.expectDataReceived('baz')
+        return d
+
+
+class ResultTypeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = ExpectMixin(_reactor=Clock())
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_zero_copy(self):
+        self.t.zero_copy = True
+        d = self.t.read_until('#')
+        self.t.expectDataReceived('router# ')
+        self.assertEqual(self.t._buf, ' ')
+        def check(res):
+            self.assertIsInstance(res, memoryview)
+            self.assertEqual(res.tobytes(), 'router#')
+        return d.addCallback(check)
+
+    def test_zero_copy_expect(self):
+        self.t.zero_copy = True
+        self.t.expectDataReceived('foo bar')
+        d = self.t.expect(re.compile('o+'))
+        def check(res):
+            self.assertEqual((res[0], res[1].group(), res[2].tobytes()), (0, 'oo', 'foo'))
+            return self.t.read_lazy()
+        d.addCallback(check)
+        d.addCallback(lambda res: self.assertEqual(res.tobytes(), ' bar'))
+        return d
+
+    def test_encoding(self):
+        self.t.encoding = 'utf-8'
+        self.t.expectDataReceived('caf\xc3')
+        d = self.t.read_lazy()
+        d.addCallback(self.assertEqual, u'caf')
+        self.t.expectDataReceived('\xa9 #')
+        d.addCallback(lambda ign: self.t.read_until('#'))
+        d.addCallback(self.assertEqual, u'\xe9 #')
+        return d
+
+    def test_encoding_final(self):
+        self.t.encoding = 'utf-8'
+        d = self.t.read_all()
+        self.t.expectDataReceived('ok \xc3')
+        self.t.connectionLost()
+        d.addCallback(self.assertEqual, u'ok \ufffd')
+        return d
+
+    def test_encoding_errors(self):
+        self.t.encoding = 'ascii'
+        self.t.decode_errors = 'ignore'
+        d = self.t.read_until('#')
+        self.t.expectDataReceived('r\xffouter#')
+        d.addCallback(self.assertEqual, u'router#')
+        return d
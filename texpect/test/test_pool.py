@@ -0,0 +1,292 @@
+"""
+@author: shylent
+"""
+from texpect.dialog import Dialog, Send, Expect
+from texpect.errors import PoolClosed, RequestTimeout
+from texpect.mixin import ExpectMixin
+from texpect.pool import SessionPool
+from texpect.protocols import TelnetExpect
+from twisted.internet.defer import Deferred, succeed, fail
+from twisted.internet.protocol import Protocol, ServerFactory
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+
+
+class FakePool(SessionPool):
+    r"""Creates the sessions on top of string transports."""
+
+    def __init__(self, *args, **kwargs):
+        SessionPool.__init__(self, *args, **kwargs)
+        self.connected = []
+        self.connecting = None
+
+    def _connect(self, host, port):
+        if self.connecting is not None:
+            return self.connecting
+        session = ExpectMixin(timeout=self.timeout, _reactor=self._reactor)
+        session.transport = StringTransportWithDisconnection()
+        session.transport.protocol = session
+        self.connected.append(session)
+        return succeed(session)
+
+
+class SessionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.logins = []
+
+    def login(self, session, credentials):
+        self.logins.append(credentials)
+        return session.write('login %s\n' % (credentials,))
+
+    def pool(self, **kwargs):
+        return FakePool(self.login, _reactor=self.clock, **kwargs)
+
+    def acquire(self, pool, host='host', credentials='admin'):
+        sessions = []
+        pool.acquire(host, credentials=credentials).addCallback(sessions.append)
+        return sessions
+
+    def test_reuse(self):
+        pool = self.pool()
+        first, = self.acquire(pool)
+        self.assertEqual(first.transport.value(), 'login admin\n')
+        pool.release(first)
+        self.assertEqual(pool.idle, 1)
+        second, = self.acquire(pool)
+        self.assertIdentical(first, second)
+        self.assertEqual(self.logins, ['admin'])
+        self.assertEqual((pool.size, pool.idle), (1, 0))
+
+    def test_keys(self):
+        pool = self.pool()
+        first, = self.acquire(pool)
+        pool.release(first)
+        second, = self.acquire(pool, credentials='guest')
+        third, = self.acquire(pool, host='other')
+        self.assertEqual(len(set([first, second, third])), 3)
+        self.assertEqual(self.logins, ['admin', 'guest', 'admin'])
+
+    def test_released_buffer_discarded(self):
+        pool = self.pool()
+        session, = self.acquire(pool)
+        session.expectDataReceived('leftover')
+        pool.release(session)
+        self.assertEqual(session._buf, '')
+
+    def test_released_resumed(self):
+        pool = self.pool()
+        session, = self.acquire(pool)
+        session.high_watermark = 4
+        session.expectDataReceived('leftover')
+        self.assertEqual(session.transport.producerState, 'paused')
+        pool.release(session)
+        self.assertEqual(session.transport.producerState, 'producing')
+
+    def test_idle_data_discarded(self):
+        pool = self.pool()
+        session, = self.acquire(pool)
+        pool.release(session)
+        session.expectDataReceived('idle chatter')
+        self.acquire(pool)
+        self.assertEqual(session._buf, '')
+
+    def test_max_size(self):
+        pool = self.pool(max_size=1)
+        first, = self.acquire(pool)
+        waiting = self.acquire(pool)
+        self.assertEqual(waiting, [])
+        pool.release(first)
+        self.assertEqual(waiting, [first])
+        self.assertEqual(len(pool.connected), 1)
+
+    def test_max_total(self):
+        pool = self.pool(max_total=1)
+        first, = self.acquire(pool)
+        waiting = self.acquire(pool, host='other')
+        self.assertEqual(waiting, [])
+        pool.release(first)
+        # The idle session is closed to make room for the other host
+        self.assertTrue(first.eof)
+        self.assertEqual(len(waiting), 1)
+        self.assertEqual((pool.size, pool.idle), (1, 0))
+
+    def test_idle_ttl(self):
+        pool = self.pool(idle_ttl=10)
+        session, = self.acquire(pool)
+        pool.release(session)
+        self.clock.advance(5)
+        self.assertFalse(session.eof)
+        self.clock.advance(5)
+        self.assertTrue(session.eof)
+        self.assertEqual((pool.size, pool.idle), (0, 0))
+
+    def test_idle_ttl_reset(self):
+        pool = self.pool(idle_ttl=10)
+        session, = self.acquire(pool)
+        pool.release(session)
+        self.clock.advance(5)
+        self.acquire(pool)
+        self.clock.advance(10)
+        self.assertFalse(session.eof)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_connection_lost_idle(self):
+        pool = self.pool()
+        first, = self.acquire(pool)
+        pool.release(first)
+        first.transport.loseConnection()
+        self.assertEqual((pool.size, pool.idle), (0, 0))
+        second, = self.acquire(pool)
+        self.assertNotIdentical(first, second)
+
+    def test_connection_lost_in_use(self):
+        pool = self.pool(max_size=1)
+        first, = self.acquire(pool)
+        waiting = self.acquire(pool)
+        first.transport.loseConnection()
+        # The slot is freed and a new session is established
+        self.assertEqual(len(waiting), 1)
+        self.assertNotIdentical(waiting[0], first)
+        pool.release(first)
+        self.assertEqual((pool.size, pool.idle), (1, 0))
+
+    def test_release_busy(self):
+        pool = self.pool()
+        session, = self.acquire(pool)
+        session.read_until('never')
+        pool.release(session)
+        self.assertTrue(session.eof)
+        self.assertEqual(pool.size, 0)
+
+    def test_probe(self):
+        pool = self.pool(probe=Dialog([Send('\n'), Expect('#')]))
+        session, = self.acquire(pool)
+        pool.release(session)
+        result = self.acquire(pool)
+        self.assertEqual(result, [])
+        self.assertTrue(session.transport.value().endswith('\n\n'))
+        session.expectDataReceived('router#')
+        self.assertEqual(result, [session])
+
+    def test_probe_failed(self):
+        pool = self.pool(probe=Dialog([Send('\n'), Expect('#')]), probe_timeout=3)
+        first, = self.acquire(pool)
+        pool.release(first)
+        result = self.acquire(pool)
+        self.clock.advance(3)
+        self.assertTrue(first.eof)
+        self.assertEqual(len(result), 1)
+        self.assertNotIdentical(result[0], first)
+        self.assertEqual(len(self.logins), 2)
+        self.flushLoggedErrors(RequestTimeout)
+
+    def test_connect_failed(self):
+        pool = self.pool(max_size=1)
+        pool.connecting = fail(ValueError('refused'))
+        d = pool.acquire('host')
+        self.assertFailure(d, ValueError)
+        self.assertEqual(pool.size, 0)
+        return d
+
+    def test_login_failed(self):
+        def login(session, credentials):
+            return session.read_until('#')
+        pool = FakePool(login, _reactor=self.clock, timeout=5)
+        d = pool.acquire('host')
+        self.clock.advance(5)
+        self.assertTrue(pool.connected[0].eof)
+        self.assertEqual(pool.size, 0)
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_login_waits(self):
+        logins = []
+        def login(session, credentials):
+            logins.append(Deferred())
+            return logins[-1]
+        pool = FakePool(login, _reactor=self.clock)
+        result = self.acquire(pool)
+        self.assertEqual((result, pool.size), ([], 1))
+        logins[0].callback(None)
+        self.assertEqual(result, pool.connected)
+
+    def test_run(self):
+        pool = self.pool()
+        d = pool.run(lambda session: session.write('foo'), 'host', credentials='admin')
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(pool.connected[0].transport.value(), 'login admin\nfoo')
+        return d
+
+    def test_run_failed(self):
+        pool = self.pool()
+        d = pool.run(lambda session: fail(ValueError()), 'host')
+        self.assertEqual(pool.size, 0)
+        self.assertTrue(pool.connected[0].eof)
+        return self.assertFailure(d, ValueError)
+
+    def test_close(self):
+        pool = self.pool(max_size=1)
+        first, = self.acquire(pool)
+        waiting = pool.acquire('host', credentials='admin')
+        self.assertFailure(waiting, PoolClosed)
+        idle, = self.acquire(pool, host='other')
+        pool.release(idle)
+        closing = pool.close()
+        self.assertTrue(idle.eof)
+        self.assertFalse(first.eof)
+        self.assertFalse(closing.called)
+        pool.release(first)
+        self.assertTrue(first.eof)
+        self.assertTrue(closing.called)
+        self.assertFailure(pool.acquire('host'), PoolClosed)
+        return waiting
+
+
+class LoginServer(Protocol):
+
+    def connectionMade(self):
+        self.factory.connections += 1
+        self.transport.write('Username:')
+
+    def dataReceived(self, data):
+        if data == 'admin\n':
+            self.transport.write('router#')
+        elif data == '\n':
+            self.transport.write('\nrouter#')
+        else:
+            self.transport.write(data + 'router#')
+
+
+class TelnetPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from twisted.internet import reactor
+        factory = ServerFactory()
+        factory.protocol = LoginServer
+        factory.connections = 0
+        self.factory = factory
+        self.port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.addCleanup(self.port.stopListening)
+
+    def test_telnet(self):
+        def login(session, credentials):
+            d = session.read_until('Username:')
+            d.addCallback(lambda ign: session.write(credentials + '\n'))
+            d.addCallback(lambda ign: session.read_until('#'))
+            return d
+        def command(session):
+            self.assertIsInstance(session, TelnetExpect)
+            session.write('show')
+            return session.read_until('#')
+        pool = SessionPool(login, probe=Dialog([Send('\n'), Expect('#')]),
+                           probe_timeout=5, timeout=5)
+        port = self.port.getHost().port
+        d = pool.run(command, '127.0.0.1', port, 'admin')
+        d.addCallback(self.assertEqual, 'showrouter#')
+        d.addCallback(lambda ign: pool.run(command, '127.0.0.1', port, 'admin'))
+        d.addCallback(self.assertEqual, 'showrouter#')
+        d.addCallback(lambda ign: self.assertEqual(self.factory.connections, 1))
+        d.addCallback(lambda ign: pool.close())
+        return d
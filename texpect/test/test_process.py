@@ -1,11 +1,15 @@
 '''
 @author: shylent
 '''
-from texpect.protocols import ProcessExpect
+from texpect.protocols import (ProcessExpect, PTYProcessExpect, MERGE, SEPARATE,
+    DISCARD, termios)
 from twisted.internet import reactor
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
 import os.path
+import sys
 
 
 class DumbProcessProtocol(ProcessExpect):
@@ -36,3 +40,160 @@ class ProcessTestCase(unittest.TestCase):
         reactor.spawnProcess(p, 'python', ['python', '-m', 'mock_process'],
                              path=os.path.dirname(__file__))
         return d
+
+
+class FakeReader(object):
+
+    def __init__(self):
+        self.paused = False
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+
+
+class FakeProcessTransport(StringTransport):
+
+    def __init__(self):
+        StringTransport.__init__(self)
+        self.pipes = {1: FakeReader(), 2: FakeReader()}
+
+
+class StderrTestCase(unittest.TestCase):
+
+    def make(self, stderr, **kwargs):
+        p = ProcessExpect(stderr=stderr, _reactor=Clock(), **kwargs)
+        p.makeConnection(FakeProcessTransport())
+        return p
+
+    def test_discard(self):
+        p = self.make(DISCARD)
+        self.assertIdentical(p.err, None)
+        d = p.read_all()
+        p.childDataReceived(2, 'error')
+        p.childDataReceived(1, 'output')
+        p.childConnectionLost(1)
+        d.addCallback(self.assertEqual, 'output')
+        return d
+
+    def test_merge(self):
+        p = self.make(MERGE)
+        d = p.read_all()
+        p.childDataReceived(1, 'out ')
+        p.childDataReceived(2, 'err ')
+        p.childConnectionLost(1)
+        self.assertFalse(p.eof)
+        p.childDataReceived(2, 'more')
+        p.childConnectionLost(2)
+        self.assertTrue(p.eof)
+        d.addCallback(self.assertEqual, 'out err more')
+        return d
+
+    def test_separate(self):
+        p = self.make(SEPARATE)
+        d1 = p.read_until('$')
+        d2 = p.err.read_until('error: ')
+        p.childDataReceived(2, 'error: disk full')
+        p.childDataReceived(1, 'output $')
+        d1.addCallback(self.assertEqual, 'output $')
+        d2.addCallback(self.assertEqual, 'error: ')
+        def lost(ign):
+            d = p.err.read_all()
+            p.childConnectionLost(2)
+            self.assertFalse(p.eof)
+            return d
+        d2.addCallback(lost)
+        d2.addCallback(self.assertEqual, 'disk full')
+        return DeferredList([d1, d2], fireOnOneErrback=True)
+
+    def test_drain(self):
+        p = self.make(SEPARATE)
+        p.err.limit = 4
+        p.childDataReceived(2, 'abcdef')
+        p.childDataReceived(2, 'gh')
+        self.assertEqual(p.err._buf, 'efgh')
+        d = p.err.read_until('x')
+        p.childDataReceived(2, '0123456789')
+        self.assertEqual(p.err._buf, 'efgh0123456789')
+        p.childDataReceived(2, 'x')
+        d.addCallback(self.assertEqual, 'efgh0123456789x')
+        return d
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, ProcessExpect, stderr='both')
+
+    def test_flow_control(self):
+        p = self.make(SEPARATE)
+        p.high_watermark = 4
+        p.childDataReceived(1, 'abcdef')
+        self.assertTrue(p.transport.pipes[1].paused)
+        self.assertFalse(p.transport.pipes[2].paused)
+        self.assertEqual(p.transport.producerState, 'producing')
+        p.read_lazy()
+        self.assertFalse(p.transport.pipes[1].paused)
+
+
+class ChattyStderrTestCase(unittest.TestCase):
+
+    def test_stderr_does_not_stall(self):
+        p = ProcessExpect(stderr=SEPARATE, timeout=10)
+        p.err.limit = 1000
+        script = ('import sys\n'
+                  'sys.stderr.write("x" * 1000000)\n'
+                  'sys.stderr.flush()\n'
+                  'sys.stdout.write("done")\n')
+        reactor.spawnProcess(p, sys.executable, [sys.executable, '-c', script])
+        p.transport.closeStdin()
+        d = p.read_until('done')
+        d.addCallback(lambda ign: p.read_all())
+        d.addCallback(lambda ign: p.err.notifyConnectionLost())
+        def check(ign):
+            self.assertTrue(len(p.err._buffer) <= 1000)
+        d.addCallback(check)
+        return d
+
+
+class PTYTestCase(unittest.TestCase):
+
+    if termios is None:
+        skip = 'Pseudo-terminals are not supported on this platform'
+
+    def spawn(self, script, **kwargs):
+        p = PTYProcessExpect(timeout=10, **kwargs)
+        reactor.spawnProcess(p, sys.executable, [sys.executable, '-c', script],
+                             usePTY=True)
+        return p
+
+    def test_line_buffered(self):
+        # The child never flushes its output, through a pipe nothing would
+        # arrive until it exits
+        p = self.spawn('import sys\n'
+                       'sys.stdout.write("hello\\n")\n'
+                       'sys.stdin.readline()\n'
+                       'sys.stdout.write("farewell\\n")\n', echo=False)
+        d = p.read_until('hello\r\n')
+        d.addCallback(lambda ign: p.write('x\n'))
+        d.addCallback(lambda ign: p.read_all())
+        d.addCallback(self.assertEqual, 'farewell\r\n')
+        return d
+
+    def test_echo(self):
+        p = self.spawn('import sys\n'
+                       'sys.stdin.readline()\n')
+        d = p.write('something\n')
+        d.addCallback(lambda ign: p.read_all())
+        d.addCallback(self.assertEqual, 'something\r\n')
+        return d
+
+    def test_window_size(self):
+        p = self.spawn('import fcntl, struct, sys, termios\n'
+                       'sys.stdin.readline()\n'
+                       'size = fcntl.ioctl(0, termios.TIOCGWINSZ, b"\\0" * 8)\n'
+                       'sys.stdout.write("%d %d\\n" % struct.unpack("HHHH", size)[:2])\n',
+                       echo=False, window=(50, 132))
+        d = p.write('go\n')
+        d.addCallback(lambda ign: p.read_all())
+        d.addCallback(self.assertEqual, '50 132\r\n')
+        return d
@@ -0,0 +1,320 @@
+"""
+@author: shylent
+"""
+from texpect.errors import (SSHConnectionFailed, OutOfSequenceError,
+    RequestInterruptedByConnectionLoss)
+from texpect.protocols import MERGE
+from twisted.cred.checkers import InMemoryUsernamePasswordDatabaseDontUse
+from twisted.cred.portal import IRealm, Portal
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
+from twisted.internet.protocol import Protocol
+from twisted.internet.task import deferLater
+from twisted.python.components import registerAdapter
+from twisted.trial import unittest
+from zope.interface import implementer
+import struct
+
+try:
+    from texpect.ssh import SSHClient
+    from twisted.conch import avatar
+    from twisted.conch.checkers import InMemorySSHKeyDB, SSHPublicKeyChecker
+    from twisted.conch.interfaces import IConchUser
+    from twisted.conch.ssh import connection, factory, keys, session
+    from twisted.conch.ssh.channel import SSHChannel
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:
+    skip = 'SSH needs twisted.conch with the cryptography package'
+else:
+    def generate_key():
+        return keys.Key(rsa.generate_private_key(65537, 2048, default_backend()))
+
+    HOST_KEY = generate_key()
+    USER_KEY = generate_key()
+
+    class Shell(Protocol):
+        r"""Answers every line with the line and a prompt, 'exit' ends the session."""
+
+        prompt = b'router# '
+
+        def connectionMade(self):
+            self.buf = b''
+            self.transport.write(self.prompt)
+
+        def dataReceived(self, data):
+            self.buf += data
+            while b'\n' in self.buf:
+                line, self.buf = self.buf.split(b'\n', 1)
+                if line == b'exit':
+                    self.transport.loseConnection()
+                    return
+                self.transport.write(line + b'\r\n' + self.prompt)
+
+    class Avatar(avatar.ConchUser):
+
+        def __init__(self, username):
+            avatar.ConchUser.__init__(self)
+            self.username = username
+            self.channelLookup[b'session'] = session.SSHSession
+            self.pty = None
+            self.windows = []
+
+    @implementer(session.ISession)
+    class ServerSession(object):
+
+        def __init__(self, avatar):
+            self.avatar = avatar
+
+        def getPty(self, term, windowSize, modes):
+            self.avatar.pty = (term, windowSize[:2])
+
+        def windowChanged(self, newWindowSize):
+            self.avatar.windows.append(newWindowSize[:2])
+
+        def openShell(self, transport):
+            shell = Shell()
+            shell.makeConnection(transport)
+            transport.makeConnection(session.wrapProtocol(shell))
+
+        def execCommand(self, transport, command):
+            if command == b'refuse':
+                raise ValueError(command)
+            # The reply to the request has to go first
+            reactor.callLater(0, self.run, transport, command)
+
+        def run(self, transport, command):
+            channel = transport.session
+            status = 0
+            if command.startswith(b'echo '):
+                channel.write(command[5:] + b'\n')
+            elif command == b'stderr':
+                channel.write(b'out\n')
+                channel.writeExtended(connection.EXTENDED_DATA_STDERR, b'err\n')
+                status = 3
+            elif command == b'flood':
+                channel.write(b'x' * 300000)
+            channel.conn.sendRequest(channel, b'exit-status', struct.pack('>L', status))
+            # There is no process to stop, when the channel is closed
+            channel.client = None
+            SSHChannel.loseConnection(channel)
+
+        def eofReceived(self):
+            pass
+
+        def closed(self):
+            pass
+
+    registerAdapter(ServerSession, Avatar, session.ISession)
+
+    @implementer(IRealm)
+    class Realm(object):
+
+        def __init__(self):
+            self.avatars = []
+
+        def requestAvatar(self, avatarId, mind, *interfaces):
+            user = Avatar(avatarId)
+            self.avatars.append(user)
+            return IConchUser, user, lambda: None
+
+    class ServerFactory(factory.SSHFactory):
+
+        publicKeys = {b'ssh-rsa': HOST_KEY.public()}
+        privateKeys = {b'ssh-rsa': HOST_KEY}
+
+        def __init__(self, portal):
+            self.portal = portal
+            self.connections = 0
+
+        def buildProtocol(self, addr):
+            self.connections += 1
+            return factory.SSHFactory.buildProtocol(self, addr)
+
+
+class SSHTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.realm = Realm()
+        checkers = [InMemoryUsernamePasswordDatabaseDontUse(admin=b'secret'),
+                    SSHPublicKeyChecker(InMemorySSHKeyDB({b'admin': [USER_KEY.public()]}))]
+        self.factory = ServerFactory(Portal(self.realm, checkers))
+        self.port = reactor.listenTCP(0, self.factory, interface='127.0.0.1')
+        self.addCleanup(self.port.stopListening)
+
+    def client(self, **kwargs):
+        kwargs.setdefault('username', 'admin')
+        kwargs.setdefault('password', 'secret')
+        kwargs.setdefault('host_key', HOST_KEY.fingerprint())
+        client = SSHClient('127.0.0.1', self.port.getHost().port, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_shell(self):
+        def opened(session):
+            d = session.read_until('router# ')
+            d.addCallback(lambda ign: session.write('show version\n'))
+            d.addCallback(lambda ign: session.read_until('router# '))
+            d.addCallback(self.assertEqual, 'show version\r\nrouter# ')
+            d.addCallback(lambda ign: session.write('exit\n'))
+            d.addCallback(lambda ign: session.read_all())
+            d.addCallback(self.assertEqual, '')
+            return d
+        return self.client().open().addCallback(opened)
+
+    def test_write_out_of_sequence(self):
+        def opened(session):
+            pending = session.read_until('never')
+            d = self.assertFailure(session.write('show version\n'), OutOfSequenceError)
+            d.addCallback(lambda ign: self.assertFailure(
+                pending, RequestInterruptedByConnectionLoss))
+            return d
+        return self.client().open().addCallback(opened)
+
+    def test_write_queued(self):
+        def opened(session):
+            session.queue_requests = True
+            session.read_until('router# ')
+            session.write('show version\n')
+            return session.read_until('router# ')
+        d = self.client().open().addCallback(opened)
+        d.addCallback(self.assertEqual, 'show version\r\nrouter# ')
+        return d
+
+    def test_write_beyond_window(self):
+        line = 'x' * 300000
+        def opened(session):
+            d = session.read_until('router# ')
+            d.addCallback(lambda ign: session.write(line + '\n'))
+            # The rest of the line is sent, when the window is adjusted, while
+            # this request is waiting
+            d.addCallback(lambda ign: session.read_until('router# '))
+            return d
+        d = self.client().open().addCallback(opened)
+        d.addCallback(self.assertEqual, line + '\r\nrouter# ')
+        return d
+
+    def test_multiplexed(self):
+        client = self.client()
+        def talk(session, line):
+            d = session.read_until('router# ')
+            d.addCallback(lambda ign: session.write(line + '\n'))
+            d.addCallback(lambda ign: session.read_until('router# '))
+            return d
+        def done(results):
+            self.assertEqual([result for success, result in results],
+                             ['%d\r\nrouter# ' % i for i in range(3)] + ['hello\n'])
+            self.assertEqual(self.factory.connections, 1)
+            self.assertEqual(len(self.realm.avatars), 1)
+        talks = [client.open().addCallback(talk, str(i)) for i in range(3)]
+        talks.append(client.open('echo hello').addCallback(lambda s: s.read_all()))
+        return DeferredList(talks, fireOnOneErrback=True).addCallback(done)
+
+    def test_exec(self):
+        def opened(session):
+            d = session.read_all()
+            d.addCallback(self.assertEqual, 'out\nerr\n')
+            d.addCallback(lambda ign: self.assertEqual(session.exit_status, 3))
+            return d
+        return self.client().open('stderr', stderr=MERGE).addCallback(opened)
+
+    def test_stderr_discarded(self):
+        d = self.client().open('stderr')
+        d.addCallback(lambda session: session.read_all())
+        d.addCallback(self.assertEqual, 'out\n')
+        return d
+
+    def test_refused(self):
+        client = self.client()
+        d = self.assertFailure(client.open('refuse'), SSHConnectionFailed)
+        d.addCallback(lambda ign: self.flushLoggedErrors(ValueError))
+        d.addCallback(lambda ign: client.open('echo hello'))
+        d.addCallback(lambda session: session.read_all())
+        d.addCallback(self.assertEqual, 'hello\n')
+        return d
+
+    def test_pty(self):
+        def opened(session):
+            self.assertEqual(self.realm.avatars[0].pty, (b'xterm', (50, 200)))
+            session.setWindowSize(60, 100)
+            d = session.read_until('router# ')
+            d.addCallback(lambda ign: session.write('\n'))
+            d.addCallback(lambda ign: session.read_until('router# '))
+            d.addCallback(lambda ign: self.assertEqual(self.realm.avatars[0].windows,
+                                                       [(60, 100)]))
+            return d
+        d = self.client().open(pty=True, term='xterm', window=(50, 200))
+        return d.addCallback(opened)
+
+    def test_public_key(self):
+        d = self.client(password=None, keys=[USER_KEY]).open('echo hello')
+        d.addCallback(lambda session: session.read_all())
+        d.addCallback(self.assertEqual, 'hello\n')
+        return d
+
+    def test_bad_password(self):
+        client = self.client(password='wrong', keys=[generate_key()])
+        d = self.assertFailure(client.open(), SSHConnectionFailed)
+        d.addCallback(lambda e: self.assertIn('authentication', str(e)))
+        return d
+
+    def test_host_key_rejected(self):
+        client = self.client(host_key=lambda key, fingerprint: False)
+        d = self.assertFailure(client.connect(), SSHConnectionFailed)
+        d.addCallback(lambda e: self.assertIn('not accepted', str(e)))
+        return d
+
+    def test_connection_refused(self):
+        port = self.port.getHost().port
+        d = self.port.stopListening()
+        d.addCallback(lambda ign: SSHClient('127.0.0.1', port, username='admin').open())
+        return self.assertFailure(d, SSHConnectionFailed)
+
+    def test_max_channels(self):
+        client = self.client(max_channels=1)
+        first = client.open()
+        second = client.open('echo hello')
+        def opened(session):
+            self.assertEqual(len(client.sessions), 1)
+            self.assertFalse(second.called)
+            return session.close()
+        first.addCallback(opened)
+        first.addCallback(lambda ign: second)
+        first.addCallback(lambda session: session.read_all())
+        first.addCallback(self.assertEqual, 'hello\n')
+        return first
+
+    def test_close(self):
+        client = self.client()
+        def opened(session):
+            d = client.close()
+            d.addCallback(lambda ign: self.assertTrue(session.eof))
+            d.addCallback(lambda ign: self.assertFailure(client.open(), SSHConnectionFailed))
+            return d
+        return client.open().addCallback(opened)
+
+    def test_reconnect(self):
+        client = self.client()
+        def opened(session):
+            lost = session.notifyConnectionLost()
+            client._transport.transport.loseConnection()
+            return lost
+        d = client.open().addCallback(opened)
+        d.addCallback(lambda ign: client.open('echo hello'))
+        d.addCallback(lambda session: session.read_all())
+        d.addCallback(self.assertEqual, 'hello\n')
+        d.addCallback(lambda ign: self.assertEqual(self.factory.connections, 2))
+        return d
+
+    def test_flow_control(self):
+        def opened(session):
+            session.high_watermark = 1000
+            d = deferLater(reactor, 0.2, lambda: None)
+            def paused(ign):
+                self.assertTrue(session._reading_paused)
+                self.assertTrue(len(session._buffer) <= session.localWindowSize)
+                return session.read_all()
+            d.addCallback(paused)
+            d.addCallback(lambda data: self.assertEqual(len(data), 300000))
+            return d
+        return self.client().open('flood').addCallback(opened)
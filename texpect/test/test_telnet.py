@@ -1,8 +1,12 @@
 '''
 @author: shylent
 '''
+from texpect.dialog import Dialog, Send
+from texpect.errors import OutOfSequenceError
 from texpect.protocols import TelnetExpect
+from twisted.conch import telnet
 from twisted.internet.protocol import Protocol, ServerFactory, ClientCreator
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
 
 
@@ -50,3 +54,138 @@ class TelnetTestCase(unittest.TestCase):
         d = self.go('hello', 'farewell', True)
         d.addCallback(cb)
         return d
+
+
+class WriteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = TelnetExpect()
+        self.t.makeConnection(StringTransport())
+
+    def test_escape_iac(self):
+        d = self.t.write('a\xffb')
+        self.assertEqual(self.t.transport.value(), 'a\xff\xffb')
+        return d
+
+    def test_escape_iac_dialog(self):
+        d = self.t.run(Dialog([Send('a\xffb')]))
+        self.assertEqual(self.t.transport.value(), 'a\xff\xffb')
+        return d
+
+    def test_out_of_sequence(self):
+        self.t.read_until('never')
+        d = self.t.write('foo')
+        self.assertEqual(self.t.transport.value(), '')
+        return self.assertFailure(d, OutOfSequenceError)
+
+    def test_queued(self):
+        self.t.queue_requests = True
+        self.t.read_until('login:')
+        d = self.t.write('admin\n')
+        self.assertEqual(self.t.transport.value(), '')
+        self.t.dataReceived('login:')
+        self.assertEqual(self.t.transport.value(), 'admin\n')
+        return d
+
+
+class Recorder:
+    r"""Records what the Telnet parser makes of the data."""
+
+    def start(self):
+        self.events = []
+        self.negotiationMap[telnet.NAWS] = self.record_negotiation
+        self.makeConnection(StringTransport())
+
+    def applicationDataReceived(self, data):
+        self.events.append(('data', data))
+
+    def commandReceived(self, command, argument):
+        self.events.append(('command', command, argument))
+        telnet.Telnet.commandReceived(self, command, argument)
+
+    def record_negotiation(self, data):
+        self.events.append(('negotiation', b''.join(data)))
+
+    def merged_events(self):
+        r"""The events with the adjacent data merged."""
+        merged = []
+        for event in self.events:
+            if event[0] == 'data' and merged and merged[-1][0] == 'data':
+                merged[-1] = ('data', merged[-1][1] + event[1])
+            else:
+                merged.append(event)
+        return merged
+
+
+class ReferenceTelnet(Recorder, telnet.Telnet):
+    pass
+
+
+class RecordingTelnetExpect(Recorder, TelnetExpect):
+    pass
+
+
+class ConformanceTestCase(unittest.TestCase):
+    r"""The fast path of L{TelnetExpect} must do exactly what L{telnet.Telnet} does."""
+
+    samples = [
+        b'plain text',
+        b'line\r\nnext\r\x00cr\rx\r\rdouble\r\n',
+        b'escaped \xff\xff byte',
+        b'\xff\xfb\x01\xff\xfd\x03login: ',
+        b'before\xff\xf1nop\xff\xf9ga\xff\xfe\x18after',
+        b'sb\xff\xfa\x1f\x00\x50\xff\xff\x00\x18\xff\xf0done',
+        b'cr\r\xff\xfb\x01iac',
+        b'\r',
+        b'\xff',
+        b'\xff\xff\xff\xfb\x03\r\n\r\n\xff\xfa\x1f\xff\xf0\r\x00',
+    ]
+
+    def parse(self, cls, chunks):
+        protocol = cls()
+        protocol.start()
+        for chunk in chunks:
+            protocol.dataReceived(chunk)
+        return protocol.merged_events(), protocol.transport.value(), protocol.state
+
+    def check(self, chunks):
+        self.assertEqual(self.parse(RecordingTelnetExpect, chunks),
+                         self.parse(ReferenceTelnet, chunks), chunks)
+
+    def test_whole(self):
+        for sample in self.samples:
+            self.check([sample])
+
+    def test_split(self):
+        for sample in self.samples:
+            for i in range(len(sample) + 1):
+                self.check([sample[:i], sample[i:]])
+
+    def test_bytewise(self):
+        for sample in self.samples:
+            self.check([sample[i:i + 1] for i in range(len(sample))])
+
+    def test_concatenated(self):
+        self.check(self.samples)
+        self.check([b''.join(self.samples)])
+
+    def test_invalid_command(self):
+        self.assertRaises(ValueError, self.parse, RecordingTelnetExpect, [b'\xff\x01'])
+
+    def test_single_slice(self):
+        protocol = RecordingTelnetExpect()
+        protocol.start()
+        protocol.dataReceived(b'a' * 10000 + b'\r\n' + b'b' * 10000 + b'\xff\xff')
+        self.assertEqual(protocol.events,
+                         [('data', b'a' * 10000 + b'\n' + b'b' * 10000 + b'\xff')])
+        protocol.dataReceived(b'x\xff\xfb\x01y')
+        self.assertEqual(protocol.events[1:],
+                         [('data', b'x'), ('command', telnet.WILL, b'\x01'), ('data', b'y')])
+
+    def test_buffer(self):
+        protocol = TelnetExpect()
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived(b'User\r\nna\xff\xfb\x01me:')
+        d = protocol.read_until('name:')
+        d.addCallback(self.assertEqual, 'User\nname:')
+        return d
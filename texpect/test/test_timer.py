@@ -0,0 +1,159 @@
+"""
+@author: shylent
+"""
+from texpect.errors import RequestTimeout
+from texpect.mixin import ExpectMixin
+from texpect.timer import TimingWheel
+from twisted.internet.error import AlreadyCalled, AlreadyCancelled
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+
+
+class TimingWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimingWheel(resolution=1, size=8, _reactor=self.clock)
+        self.called = []
+
+    def call(self, delay, name):
+        return self.wheel.callLater(delay, self.called.append, name)
+
+    def test_call(self):
+        timeout = self.call(3, 'a')
+        self.assertEqual(timeout.getTime(), 3)
+        self.clock.advance(2.9)
+        self.assertEqual(self.called, [])
+        self.assertTrue(timeout.active())
+        self.clock.advance(0.1)
+        self.assertEqual(self.called, ['a'])
+        self.assertFalse(timeout.active())
+        self.assertRaises(AlreadyCalled, timeout.cancel)
+
+    def test_resolution(self):
+        self.clock.advance(0.5)
+        self.call(1, 'a')
+        self.clock.advance(1)
+        self.assertEqual(self.called, [])
+        self.clock.advance(0.5)
+        self.assertEqual(self.called, ['a'])
+
+    def test_fractional_resolution(self):
+        wheel = TimingWheel(resolution=0.1, _reactor=self.clock)
+        wheel.callLater(0.7, self.called.append, 'a')
+        for i in range(7):
+            self.clock.advance(0.1)
+        self.assertEqual(self.called, ['a'])
+
+    def test_order(self):
+        self.call(2.5, 'b')
+        self.call(2.2, 'a')
+        self.call(5, 'c')
+        self.clock.advance(10)
+        self.assertEqual(self.called, ['a', 'b', 'c'])
+
+    def test_cancel(self):
+        timeout = self.call(3, 'a')
+        self.call(3, 'b')
+        timeout.cancel()
+        self.assertFalse(timeout.active())
+        self.assertRaises(AlreadyCancelled, timeout.cancel)
+        self.clock.advance(3)
+        self.assertEqual(self.called, ['b'])
+
+    def test_single_reactor_call(self):
+        for i in range(100):
+            self.call(i % 5 + 1, i)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(len(self.wheel), 100)
+
+    def test_idle(self):
+        timeout = self.call(3, 'a')
+        timeout.cancel()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.call(1, 'b')
+        self.clock.advance(1)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_several_revolutions(self):
+        self.call(20, 'a')
+        self.clock.advance(19)
+        self.assertEqual(self.called, [])
+        self.clock.advance(1)
+        self.assertEqual(self.called, ['a'])
+
+    def test_reactor_late(self):
+        self.call(3, 'a')
+        self.call(12, 'b')
+        self.call(30, 'c')
+        self.clock.advance(15)
+        self.assertEqual(self.called, ['a', 'b'])
+        self.clock.advance(15)
+        self.assertEqual(self.called, ['a', 'b', 'c'])
+
+    def test_reset(self):
+        timeout = self.call(3, 'a')
+        self.clock.advance(2)
+        timeout.reset(3)
+        self.clock.advance(2)
+        self.assertEqual(self.called, [])
+        timeout.delay(1)
+        self.clock.advance(1)
+        self.assertEqual(self.called, [])
+        self.clock.advance(1)
+        self.assertEqual(self.called, ['a'])
+
+    def test_cancel_from_call(self):
+        timeouts = []
+        def cancel_other():
+            self.called.append('a')
+            timeouts[1].cancel()
+        timeouts.append(self.wheel.callLater(1, cancel_other))
+        timeouts.append(self.call(1.5, 'b'))
+        self.call(3, 'c')
+        self.clock.advance(2)
+        self.assertEqual(self.called, ['a'])
+        self.assertEqual(len(self.wheel), 1)
+        self.clock.advance(1)
+        self.assertEqual(self.called, ['a', 'c'])
+
+    def test_schedule_from_call(self):
+        self.wheel.callLater(1, lambda: self.call(1, 'b'))
+        self.clock.advance(1)
+        self.clock.advance(1)
+        self.assertEqual(self.called, ['b'])
+
+    def test_error(self):
+        self.wheel.callLater(1, lambda: 1 / 0)
+        self.call(1, 'a')
+        self.clock.advance(1)
+        self.assertEqual(self.called, ['a'])
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+
+
+class MixinTimerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimingWheel(resolution=1, _reactor=self.clock)
+        self.t = ExpectMixin(_reactor=self.clock)
+        self.t.timer = self.wheel
+        self.t.transport = StringTransportWithDisconnection()
+        self.t.transport.protocol = self.t
+
+    def test_timeout(self):
+        d = self.t.read_until('foo', timeout=2)
+        self.assertEqual(len(self.wheel), 1)
+        self.clock.advance(2)
+        self.assertEqual(len(self.wheel), 0)
+        return self.assertFailure(d, RequestTimeout)
+
+    def test_cancelled(self):
+        d = self.t.read_until('foo', timeout=2)
+        self.t.expectDataReceived('foo')
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        d.addCallback(self.assertEqual, 'foo')
+        return d
@@ -0,0 +1,113 @@
+'''
+@author: shylent
+'''
+from texpect.mixin import ExpectMixin
+from texpect.transcript import MemoryTranscript, RingTranscript, SpillTranscript
+from twisted.test.proto_helpers import StringTransportWithDisconnection
+from twisted.trial import unittest
+import gzip
+
+
+class MemoryTranscriptTestCase(unittest.TestCase):
+
+    def test_write(self):
+        t = MemoryTranscript()
+        t.write('foo')
+        t.write('bar')
+        self.assertEqual(t.getvalue(), 'foobar')
+
+
+class RingTranscriptTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.t = RingTranscript(5)
+
+    def test_not_full(self):
+        self.t.write('foo')
+        self.assertEqual(self.t.getvalue(), 'foo')
+
+    def test_exactly_full(self):
+        self.t.write('foo')
+        self.t.write('ba')
+        self.assertEqual(self.t.getvalue(), 'fooba')
+
+    def test_wrap(self):
+        self.t.write('foo')
+        self.t.write('bar')
+        self.assertEqual(self.t.getvalue(), 'oobar')
+        self.t.write('spam')
+        self.assertEqual(self.t.getvalue(), 'rspam')
+
+    def test_large_chunk(self):
+        self.t.write('f')
+        self.t.write('foobarspam')
+        self.assertEqual(self.t.getvalue(), 'rspam')
+        self.t.write('x')
+        self.assertEqual(self.t.getvalue(), 'spamx')
+
+
+class SpillTranscriptTestCase(unittest.TestCase):
+
+    def test_plain(self):
+        path = self.mktemp()
+        t = SpillTranscript(path)
+        for chunk in ('foo', 'bar', 'spam'):
+            t.write(chunk)
+        d = t.close()
+        d.addCallback(lambda ign: self.assertEqual(open(path, 'rb').read(), 'foobarspam'))
+        return d
+
+    def test_compressed(self):
+        path = self.mktemp()
+        t = SpillTranscript(path, compress=True)
+        for chunk in ('foo', 'bar', 'spam'):
+            t.write(chunk)
+        d = t.close()
+        d.addCallback(lambda ign: self.assertEqual(gzip.open(path).read(), 'foobarspam'))
+        return d
+
+    def test_close_without_data(self):
+        return SpillTranscript(self.mktemp()).close()
+
+
+class MixinTranscriptTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = StringTransportWithDisconnection()
+
+    def make(self, **kwargs):
+        t = ExpectMixin(**kwargs)
+        t.transport = self.transport
+        self.transport.protocol = t
+        return t
+
+    def test_no_transcript(self):
+        t = self.make()
+        t.expectDataReceived('foo')
+        self.assertIdentical(t.transcript, None)
+        self.assertEqual(t._debug_buf, '')
+
+    def test_debug(self):
+        t = self.make(debug=True)
+        t.expectDataReceived('foo')
+        t.read_until('o')
+        t.expectDataReceived('bar')
+        self.assertIsInstance(t.transcript, MemoryTranscript)
+        self.assertEqual(t._debug_buf, 'foobar')
+
+    def test_ring(self):
+        t = self.make(transcript=RingTranscript(4))
+        t.expectDataReceived('foo')
+        t.expectDataReceived('bar')
+        self.assertEqual(t._debug_buf, 'obar')
+
+    def test_spill(self):
+        path = self.mktemp()
+        transcript = SpillTranscript(path)
+        t = self.make(transcript=transcript)
+        t.expectDataReceived('foo')
+        t.expectDataReceived('bar')
+        self.transport.loseConnection()
+        d = transcript.close()
+        d.addCallback(lambda ign: self.assertEqual(open(path, 'rb').read(), 'foobar'))
+        return d
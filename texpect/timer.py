@@ -0,0 +1,185 @@
+"""
+A coarse-grained timer for the request timeouts.
+
+Almost every timeout is cancelled, because the request completes before it
+expires, so scheduling a separate reactor call for each one of them means,
+that the reactor spends most of its time adding calls to its heap of delayed
+calls and removing them from it. L{TimingWheel} keeps the timeouts in a
+hashed timing wheel instead: arming and cancelling a timeout are O(1) and
+the reactor only has a single delayed call, that advances the wheel,
+regardless of the number of the timeouts::
+
+    ExpectMixin.timer = TimingWheel(resolution=0.5)
+
+@author: shylent
+"""
+from twisted.internet.error import AlreadyCalled, AlreadyCancelled
+from twisted.python import log
+import math
+
+
+class WheelTimeout(object):
+    r"""A call, that is scheduled with a L{TimingWheel}. Provides the same
+    methods as L{IDelayedCall<twisted.internet.interfaces.IDelayedCall>}.
+
+    """
+
+    __slots__ = ('wheel', 'time', 'tick', 'func', 'args', 'kw', 'called', 'cancelled')
+
+    def __init__(self, wheel, time, func, args, kw):
+        self.wheel = wheel
+        self.time = time
+        self.tick = None
+        self.func = func
+        self.args = args
+        self.kw = kw
+        self.called = False
+        self.cancelled = False
+
+    def getTime(self):
+        return self.time
+
+    def active(self):
+        return not (self.called or self.cancelled)
+
+    def cancel(self):
+        if self.cancelled:
+            raise AlreadyCancelled
+        if self.called:
+            raise AlreadyCalled
+        self.cancelled = True
+        self.wheel._remove(self)
+
+    def delay(self, seconds):
+        self.reset(self.time + seconds - self.wheel._reactor.seconds())
+
+    def reset(self, seconds):
+        if self.cancelled:
+            raise AlreadyCancelled
+        if self.called:
+            raise AlreadyCalled
+        self.wheel._remove(self)
+        self.wheel._add(self, seconds)
+
+
+class TimingWheel(object):
+    r"""A hashed timing wheel.
+
+    The time is divided into ticks of L{resolution} seconds, each call is put
+    into the slot of the tick, in which it expires (modulo the number of the
+    slots). While there are calls in the wheel, the reactor advances it once
+    per tick and the calls in the slots, that the wheel passes, whose time
+    has come, are made. A call is made no earlier, than it was scheduled
+    for, and at most one tick later (given that the reactor is not late).
+
+    @ivar resolution: Length of a tick in seconds
+    @type resolution: C{float}
+    @ivar size: Number of the slots. The calls, that are further away than
+    C{size} ticks, stay in their slots for more than one revolution of the
+    wheel.
+    @type size: C{int}
+
+    """
+
+    def __init__(self, resolution=0.1, size=512, _reactor=None):
+        r"""
+        @param resolution: Length of a tick in seconds. Default: 0.1
+        @type resolution: C{float}
+        @param size: Number of the slots. Default: 512
+        @type size: C{int}
+
+        """
+        if _reactor is None:
+            from twisted.internet import reactor as _reactor
+        self._reactor = _reactor
+        self.resolution = resolution
+        self.size = size
+        self._slots = [set() for i in xrange(size)]
+        self._count = 0
+        self._current = None
+        self._call = None
+
+    def __len__(self):
+        return self._count
+
+    def callLater(self, delay, func, *args, **kw):
+        r"""Schedule a call, the same way as
+        L{IReactorTime.callLater<twisted.internet.interfaces.IReactorTime.callLater>}
+        does.
+
+        @param delay: Number of seconds
+        @type delay: C{float}
+        @rtype: L{WheelTimeout}
+
+        """
+        timeout = WheelTimeout(self, None, func, args, kw)
+        self._add(timeout, delay)
+        return timeout
+
+    def _now_tick(self, now):
+        # The epsilon keeps the float division from landing on the wrong
+        # side of a tick boundary
+        return int(math.floor(now / self.resolution + 1e-9))
+
+    def _add(self, timeout, delay):
+        now = self._reactor.seconds()
+        if self._current is None:
+            self._current = self._now_tick(now)
+        timeout.time = now + delay
+        tick = int(math.ceil(timeout.time / self.resolution - 1e-9))
+        timeout.tick = max(tick, self._current + 1)
+        self._slots[timeout.tick % self.size].add(timeout)
+        self._count += 1
+        if self._call is None:
+            self._schedule(now)
+
+    def _remove(self, timeout):
+        slot = self._slots[timeout.tick % self.size]
+        if timeout not in slot:
+            # It is due and is about to be made by _advance
+            return
+        slot.remove(timeout)
+        self._count -= 1
+        if not self._count:
+            self._stop()
+
+    def _schedule(self, now):
+        delay = max((self._current + 1) * self.resolution - now, 0)
+        self._call = self._reactor.callLater(delay, self._advance)
+
+    def _stop(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        self._current = None
+
+    def _advance(self):
+        r"""Make the calls, whose time has come."""
+        self._call = None
+        now = self._reactor.seconds()
+        target = self._now_tick(now)
+        due = []
+        ticks = min(target - self._current, self.size)
+        for tick in xrange(self._current + 1, self._current + ticks + 1):
+            slot = self._slots[tick % self.size]
+            if slot:
+                expired = [timeout for timeout in slot if timeout.tick <= target]
+                slot.difference_update(expired)
+                due.extend(expired)
+        self._current = target
+        self._count -= len(due)
+        due.sort(key=lambda timeout: timeout.time)
+        for timeout in due:
+            if timeout.cancelled or timeout.tick > target:
+                # Cancelled or reset by one of the calls, that were made before it
+                continue
+            timeout.called = True
+            try:
+                timeout.func(*timeout.args, **timeout.kw)
+            except:
+                log.err(None, 'Error in a call, scheduled with the timing wheel')
+        if self._count:
+            if self._call is None:
+                self._schedule(self._reactor.seconds())
+        else:
+            self._stop()
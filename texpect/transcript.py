@@ -0,0 +1,184 @@
+"""
+Transcripts keep a record of the data, that was received during a session.
+
+@author: shylent
+"""
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.python import log
+import gzip
+
+
+class Transcript(object):
+    r"""Base class for transcripts."""
+
+    def write(self, data):
+        r"""Record the received data.
+
+        @type data: C{str}
+
+        """
+        raise NotImplementedError
+
+    def close(self):
+        r"""Called, when the session is over.
+
+        @return: A L{Deferred}, that fires, when the transcript has been
+        finalized.
+        @rtype: L{Deferred}
+
+        """
+        return succeed(None)
+
+
+class MemoryTranscript(Transcript):
+    r"""Keeps all of the received data in memory."""
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def write(self, data):
+        self._data.extend(data)
+
+    def getvalue(self):
+        r"""
+        @return: All of the data, that was received
+        @rtype: C{str}
+
+        """
+        return str(self._data)
+
+
+class RingTranscript(Transcript):
+    r"""Keeps only the last L{size} bytes of the received data in memory.
+
+    @ivar size: Maximum number of bytes to keep
+    @type size: C{int}
+
+    """
+
+    def __init__(self, size):
+        r"""
+        @param size: Maximum number of bytes to keep
+        @type size: C{int}
+
+        """
+        self.size = size
+        self._data = bytearray(size)
+        self._pos = 0
+        self._full = False
+
+    def write(self, data):
+        size = self.size
+        if len(data) >= size:
+            self._data[:] = data[-size:]
+            self._pos = 0
+            self._full = True
+            return
+        end = self._pos + len(data)
+        if end <= size:
+            self._data[self._pos:end] = data
+        else:
+            split = size - self._pos
+            self._data[self._pos:] = data[:split]
+            self._data[:end - size] = data[split:]
+            self._full = True
+        self._pos = end % size
+        if self._pos == 0:
+            self._full = True
+
+    def getvalue(self):
+        r"""
+        @return: The last L{size} bytes of the data, that was received
+        (or less, if less was received)
+        @rtype: C{str}
+
+        """
+        if not self._full:
+            return str(self._data[:self._pos])
+        return str(self._data[self._pos:] + self._data[:self._pos])
+
+
+class SpillTranscript(Transcript):
+    r"""Appends the received data to a file.
+
+    The writes are performed in the reactor's thread pool, so the reactor is
+    never blocked by the disk I/O. The data, that is waiting to be written, is
+    collected and written in one go, once the previous write is complete. At
+    most one write is in progress at a time, so the order of the data is
+    preserved.
+
+    @ivar path: Path to the file
+    @type path: C{str}
+    @ivar compress: Whether the file is compressed with gzip
+    @type compress: C{bool}
+
+    """
+
+    def __init__(self, path, compress=False, _reactor=None):
+        r"""
+        @param path: Path to the file. The data is appended to it, if the
+        file exists.
+        @type path: C{str}
+        @param compress: Compress the data with gzip. Default: C{False}
+        @type compress: C{bool}
+
+        """
+        if _reactor is None:
+            from twisted.internet import reactor as _reactor
+        self._reactor = _reactor
+        self.path = path
+        self.compress = compress
+        self._file = None
+        self._pending = []
+        self._writing = None
+        self._closing = None
+
+    def write(self, data):
+        self._pending.append(data)
+        if self._writing is None:
+            self._flush()
+
+    def _flush(self):
+        chunks, self._pending = self._pending, []
+        self._writing = deferToThreadPool(self._reactor, self._reactor.getThreadPool(),
+                                          self._write_chunks, chunks)
+        self._writing.addErrback(log.err, 'Failed to write the transcript to %s' % self.path)
+        self._writing.addCallback(self._written)
+
+    def _write_chunks(self, chunks):
+        r"""Write the data to the file. Runs in a thread."""
+        if self._file is None:
+            if self.compress:
+                self._file = gzip.open(self.path, 'ab')
+            else:
+                self._file = open(self.path, 'ab')
+        self._file.write(''.join(chunks))
+
+    def _close_file(self):
+        r"""Close the file. Runs in a thread."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _written(self, ignored=None):
+        self._writing = None
+        if self._pending:
+            self._flush()
+        elif self._closing is not None:
+            d = deferToThreadPool(self._reactor, self._reactor.getThreadPool(),
+                                  self._close_file)
+            d.chainDeferred(self._closing)
+
+    def close(self):
+        r"""Write the remaining data and close the file.
+
+        @return: A L{Deferred}, that fires, when the file has been closed.
+        @rtype: L{Deferred}
+
+        """
+        if self._closing is None:
+            self._closing = Deferred()
+            if self._writing is None:
+                self._written()
+        return self._closing